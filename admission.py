@@ -0,0 +1,154 @@
+"""
+admission.py — Admission control for generation endpoints
+==========================================================
+Under a spike every /generate used to be accepted and park a threadpool
+thread for minutes, until the whole API stalled. AdmissionController
+estimates how long a new request would wait before it starts:
+
+    wait ≈ tokens already admitted at the same or better priority
+           ÷ recent tokens/sec (measured from finished batches)
+
+and rejects it (AdmissionRejected → 429 + Retry-After) when that exceeds
+its class's limit or the client already has ADMIT_MAX_PER_USER requests
+in flight. BatchScheduler then runs admitted work by priority and
+round-robin between users (fair queuing).
+
+  priority 0  logged-in   ADMIT_MAX_WAIT_SEC       (default 120 s)
+  priority 1  anonymous   ADMIT_ANON_MAX_WAIT_SEC  (default 30 s)
+
+A limit of 0 or less disables the wait check for that class.
+
+    admission = AdmissionController(parallelism=scheduler.workers)
+    scheduler = BatchScheduler(..., on_batch=admission.record_batch)
+    ticket = admission.admit(tokens, user="ip:1.2.3.4", priority=PRIORITY_ANON)
+    try: ... finally: ticket.release()
+"""
+
+from __future__ import annotations
+import math, os, threading
+
+ADMIT_MAX_WAIT_SEC      = float(os.getenv("ADMIT_MAX_WAIT_SEC", "120"))
+ADMIT_ANON_MAX_WAIT_SEC = float(os.getenv("ADMIT_ANON_MAX_WAIT_SEC", "30"))
+ADMIT_MAX_PER_USER      = int(os.getenv("ADMIT_MAX_PER_USER", "4"))
+# Throughput assumed until the first batch has been measured (job tokens/sec)
+ADMIT_DEFAULT_TOKENS_PER_SEC = float(os.getenv("ADMIT_DEFAULT_TOKENS_PER_SEC", "50"))
+
+PRIORITY_USER = 0
+PRIORITY_ANON = 1
+
+
+class AdmissionRejected(Exception):
+    """Too much queued work for this request's class (or user)."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """An admitted request's share of the backlog. release() once its
+    generation has finished, failed or been cancelled (idempotent)."""
+
+    def __init__(self, controller: "AdmissionController", tokens: int, user: str, priority: int):
+        self._controller = controller
+        self.tokens      = tokens
+        self.user        = user
+        self.priority    = priority
+        self.released    = False
+
+    def release(self):
+        self._controller._release(self)
+
+
+class AdmissionController:
+    """Estimated-wait admission with per-class limits and a per-user cap."""
+
+    def __init__(self, max_wait_sec: dict | None = None, max_per_user: int = ADMIT_MAX_PER_USER,
+                 parallelism: int = 1, default_tokens_per_sec: float = ADMIT_DEFAULT_TOKENS_PER_SEC,
+                 alpha: float = 0.3):
+        self.max_wait_sec = max_wait_sec or {PRIORITY_USER: ADMIT_MAX_WAIT_SEC,
+                                             PRIORITY_ANON: ADMIT_ANON_MAX_WAIT_SEC}
+        self.max_per_user = int(max_per_user)
+        self.parallelism  = max(1, int(parallelism))
+        self.default_rate = float(default_tokens_per_sec)
+        self.alpha        = float(alpha)          # EWMA weight of the newest batch
+        self._rate: float | None = None           # job tokens/sec of one worker
+        self._outstanding: dict[int, int] = {}    # priority → admitted, unfinished tokens
+        self._per_user: dict[str, int] = {}       # user → admitted, unfinished requests
+        self._lock  = threading.Lock()
+        self._stats = {"admitted": 0, "rejected_wait": 0, "rejected_user": 0}
+
+    # ── Public API ────────────────────────────────────────────────
+    def record_batch(self, job_tokens: int, seconds: float):
+        """BatchScheduler on_batch hook: one finished batch of job_tokens."""
+        if seconds <= 0 or job_tokens <= 0:
+            return
+        rate = job_tokens / seconds
+        with self._lock:
+            self._rate = rate if self._rate is None else (
+                self.alpha * rate + (1 - self.alpha) * self._rate)
+
+    def tokens_per_sec(self) -> float:
+        with self._lock:
+            return self._tokens_per_sec()
+
+    def estimate_wait(self, priority: int = PRIORITY_ANON) -> float:
+        """Seconds a new request of this priority would wait before starting."""
+        with self._lock:
+            return self._estimate_wait(priority)
+
+    def admit(self, tokens: int, user: str, priority: int = PRIORITY_ANON) -> Ticket:
+        """Admit a request of `tokens` max_new_tokens or raise AdmissionRejected."""
+        with self._lock:
+            rate = self._tokens_per_sec()
+            if self.max_per_user > 0 and self._per_user.get(user, 0) >= self.max_per_user:
+                self._stats["rejected_user"] += 1
+                raise AdmissionRejected(
+                    f"{self.max_per_user} generations already in progress for this client",
+                    max(1, math.ceil(tokens / rate)))
+            wait  = self._estimate_wait(priority)
+            limit = self.max_wait_sec.get(priority, 0)
+            if limit > 0 and wait > limit:
+                self._stats["rejected_wait"] += 1
+                raise AdmissionRejected(
+                    f"Server busy: estimated wait {wait:.0f}s exceeds {limit:.0f}s",
+                    max(1, math.ceil(wait - limit)))
+            self._outstanding[priority] = self._outstanding.get(priority, 0) + int(tokens)
+            self._per_user[user] = self._per_user.get(user, 0) + 1
+            self._stats["admitted"] += 1
+        return Ticket(self, int(tokens), user, priority)
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+            s["tokens_per_sec"]     = round(self._tokens_per_sec(), 1)
+            s["measured"]           = self._rate is not None
+            s["outstanding_tokens"] = dict(self._outstanding)
+            s["estimated_wait_sec"] = {p: round(self._estimate_wait(p), 1)
+                                       for p in self.max_wait_sec}
+            s["active_users"]       = len(self._per_user)
+        s["max_wait_sec"] = dict(self.max_wait_sec)
+        s["max_per_user"] = self.max_per_user
+        return s
+
+    # ── Internals (call with _lock held) ──────────────────────────
+    def _tokens_per_sec(self) -> float:
+        rate = self._rate if self._rate is not None else self.default_rate
+        return max(rate * self.parallelism, 1e-6)
+
+    def _estimate_wait(self, priority: int) -> float:
+        # lower priority values run first, so only they (and equals) are ahead
+        ahead = sum(t for p, t in self._outstanding.items() if p <= priority)
+        return ahead / self._tokens_per_sec()
+
+    def _release(self, ticket: Ticket):
+        with self._lock:
+            if ticket.released:
+                return
+            ticket.released = True
+            self._outstanding[ticket.priority] -= ticket.tokens
+            if not self._outstanding[ticket.priority]:
+                del self._outstanding[ticket.priority]
+            self._per_user[ticket.user] -= 1
+            if not self._per_user[ticket.user]:
+                del self._per_user[ticket.user]
@@ -5,9 +5,13 @@ Run: python api_server.py
 Endpoints
 ─────────────────────────────────────────────
 GET   /health
-POST  /generate          → beat from text prompt (sync)
+POST  /generate          → beat from text prompt (sync, micro-batched)
+GET   /generate/stream   → chunked WAV stream while the beat is generated
+POST  /generate/long     → 2–5 min track from crossfaded windows (tracked, SSE progress)
 POST  /generate/async    → dispatch Celery task, returns task_id
 GET   /tasks/{task_id}   → poll Celery task status
+DELETE /tasks/{task_id}  → cancel a tracked / WebSocket generation or a Celery task
+WS    /ws/generate       → JSON progress + binary PCM/Opus audio, several generations per socket
 POST  /analyze           → BPM / key / energy / waveform peaks
 POST  /separate          → DEMUCS stem split (+ optional commit_id to link stems in DB)
 POST  /continue          → extend a beat
@@ -38,16 +42,28 @@ POST  /projects/{id}/play        → increment play count
 GET   /projects/{repo_id}/commits/{commit_id}/comments   → list comments
 POST  /projects/{repo_id}/commits/{commit_id}/comments   → add comment (auth)
 DELETE /comments/{comment_id}    → delete own comment (auth)
+
+GET   /admin/models              → model registry: resident variants + RAM budget
+POST  /admin/models/{name}/load  → preload small / medium / melody
+DELETE /admin/models/{name}      → unload an idle variant
+GET   /admin/assets              → asset store: blobs, dedupe savings, GC totals
+POST  /admin/assets/gc           → delete unreferenced outputs past the grace period
 """
 
 from __future__ import annotations
-import time, re, sys, shutil, asyncio, json
+import os, time, re, sys, shutil, asyncio, json, threading, hmac
 from datetime import datetime
 from pathlib import Path
 
+# ── CPU thread budget (before torch / numpy / librosa are imported) ─
+from thread_budget import ThreadBudget, apply_thread_env
+apply_thread_env()
+
 # ── FastAPI / Uvicorn ─────────────────────────────────────────────
 try:
-    from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Depends, Query
+    from fastapi import (FastAPI, HTTPException, UploadFile, File, Form, Depends, Query, Header,
+                         Request, WebSocket, WebSocketDisconnect)
+    from starlette.requests import HTTPConnection
     from fastapi.middleware.cors import CORSMiddleware
     from fastapi.staticfiles import StaticFiles
     from fastapi.responses import JSONResponse, StreamingResponse
@@ -60,34 +76,111 @@ except ImportError:
     print("    pip install fastapi uvicorn[standard] pydantic")
     sys.exit(1)
 
-# ── Torch / Transformers ──────────────────────────────────────────
-import torch
-from transformers import AutoProcessor, MusicgenForConditionalGeneration
-
 # ── Database ──────────────────────────────────────────────────────
 from database import init_db, get_db
 from models import User, Repository, Commit, Stem, Star, Follow, Comment
 from auth import (
-    hash_password, verify_password,
+    hash_password, verify_password, decode_token,
     create_access_token, get_current_user, get_current_user_optional
 )
 from sqlalchemy.orm import Session
 
-# ── Pre-load audio_processing (imports librosa at module level) ───
-import audio_processing as _ap
+# torch / transformers / librosa (inference, encoder_cache, model_registry,
+# audio_processing) are imported by _load_models() in the background
+from generation_cache import GenerationCache, codes_path, link_or_copy, sampling_params
+from job_manager import CancelToken, FINAL_STATES, JobManager, JobQueueFull
+from job_store import make_job_store
+from single_flight import SingleFlight
+from audio_writer import COMPRESSED, encode_async, encoded_path, open_audio, write_audio
+from asset_store import AssetStore, output_name
+import audio_writer
+from admission import AdmissionController, AdmissionRejected, PRIORITY_ANON, PRIORITY_USER
 
 # ── Config ───────────────────────────────────────────────────────
+MODEL_KEY       = "small"      # default variant — always resident, see model_registry.py
 MODEL_NAME      = "facebook/musicgen-small"
-DURATION_TOKENS = 512          # ~10 seconds
+DURATION_TOKENS = 512          # ~10 seconds — default when a request has no duration
 OUTPUT_DIR      = Path("beat_outputs")
 STEMS_DIR       = Path("stems_outputs")
 MASTER_DIR      = Path("mastered_outputs")
 UPLOAD_TMP      = Path("upload_tmp")
+# Micro-batching: concurrent prompts are gathered for up to MAX_WAIT_MS and
+# run as one model.generate call of at most MAX_SIZE prompts.
+BATCH_MAX_SIZE    = int(os.getenv("GEN_BATCH_MAX_SIZE", "4"))
+BATCH_MAX_WAIT_MS = float(os.getenv("GEN_BATCH_MAX_WAIT_MS", "25"))
+# Two-stage pipeline: EnCodec decode runs on DECODE_WORKERS threads of its own
+# while the scheduler generates the next batch's tokens (0 → decode inline)
+GEN_PIPELINE      = os.getenv("GEN_PIPELINE", "1") != "0"
+DECODE_WORKERS    = int(os.getenv("GEN_DECODE_WORKERS", "1"))
+# Requested durations (seconds) are batched per bucket: a 5 s job never waits on a 30 s one
+DURATION_BUCKETS  = [float(x) for x in os.getenv("GEN_DURATION_BUCKETS", "5,10,15,20,30").split(",")]
+MAX_DURATION_SEC  = float(os.getenv("GEN_MAX_DURATION_SEC", "30"))
+# Seeded (deterministic) generations are cached on disk, LRU-evicted past this size
+GEN_CACHE_DIR     = Path(os.getenv("GEN_CACHE_DIR", "gen_cache"))
+GEN_CACHE_MAX_MB  = int(os.getenv("GEN_CACHE_MAX_MB", "512"))
+# T5 outputs for custom prompts kept in an LRU of this many entries (moods are pinned)
+ENCODER_CACHE_SIZE = int(os.getenv("ENCODER_CACHE_SIZE", "128"))
+# /generate/stream: decode + send every STREAM_PLAY_FRAMES EnCodec frames (50 ≈ 1 s)
+STREAM_PLAY_FRAMES = int(os.getenv("STREAM_PLAY_FRAMES", "50"))
+
+# /generate/tracked: worker pool size, max waiting jobs, seconds a finished job is kept
+TRACKED_WORKERS   = int(os.getenv("TRACKED_WORKERS", "4"))
+TRACKED_QUEUE_MAX = int(os.getenv("TRACKED_QUEUE_MAX", "64"))
+JOB_TTL_SEC       = float(os.getenv("JOB_TTL_SEC", "600"))
+# /sse/progress: keep-alive comment after this many idle seconds; stream closes after SSE_MAX_SEC
+SSE_HEARTBEAT_SEC = float(os.getenv("SSE_HEARTBEAT_SEC", "15"))
+SSE_MAX_SEC       = float(os.getenv("SSE_MAX_SEC", "1800"))
+# Cancel an unfinished job once its last SSE listener has been gone this long (<0 → never)
+SSE_CANCEL_GRACE_SEC = float(os.getenv("SSE_CANCEL_GRACE_SEC", "5"))
+# /ws/generate: concurrent generations per socket, payload bytes per binary audio frame
+WS_MAX_ACTIVE     = int(os.getenv("WS_MAX_ACTIVE", "4"))
+WS_FRAME_BYTES    = int(os.getenv("WS_FRAME_BYTES", "32768"))
+# /generate/long: longest track, window length, context carried into each next
+# window, crossfade at every window seam (seconds)
+LONG_MAX_SEC       = float(os.getenv("LONG_MAX_SEC", "300"))
+LONG_WINDOW_SEC    = float(os.getenv("LONG_WINDOW_SEC", "20"))
+LONG_CONTEXT_SEC   = float(os.getenv("LONG_CONTEXT_SEC", "10"))
+LONG_CROSSFADE_SEC = float(os.getenv("LONG_CROSSFADE_SEC", "0.25"))
+# Most alternatives one /generate may ask for with `variations`
+GEN_MAX_VARIATIONS = int(os.getenv("GEN_MAX_VARIATIONS", "4"))
+# Share one generation between identical seeded requests in flight at the same time (0 → off)
+GEN_DEDUPE        = os.getenv("GEN_DEDUPE", "1") != "0"
+# /continue conditions on the last CONTINUE_CONTEXT_SEC seconds only (≤0 → the whole beat)
+CONTINUE_CONTEXT_SEC = float(os.getenv("CONTINUE_CONTEXT_SEC", "10"))
+# Tokens each /continue generates (also what admission control charges for it)
+CONTINUE_TOKENS      = int(os.getenv("CONTINUE_TOKENS", "512"))
+# Tokens each /hum generates with MusicGen-Melody (~30 s; also its admission charge)
+HUM_TOKENS           = int(os.getenv("HUM_TOKENS", "1500"))
+# Startup warm-up: one dummy generation of this many tokens (0 → skip)
+MODEL_WARMUP_TOKENS = int(os.getenv("MODEL_WARMUP_TOKENS", "32"))
+# Retry-After (seconds) on 503s while the model is still loading / warming
+MODEL_RETRY_AFTER   = int(os.getenv("MODEL_RETRY_AFTER", "15"))
+
+# Content-addressed store behind every output / upload (same filesystem as the outputs)
+ASSET_DIR              = Path(os.getenv("ASSET_DIR", "asset_store"))
+# GC: files no Commit / Stem references are deleted once older than the grace period;
+# runs every ASSET_GC_INTERVAL_SEC (0 → only via POST /admin/assets/gc)
+ASSET_GC_GRACE_SEC     = float(os.getenv("ASSET_GC_GRACE_SEC", str(24 * 3600)))
+ASSET_GC_INTERVAL_SEC  = float(os.getenv("ASSET_GC_INTERVAL_SEC", "3600"))
+ASSET_GC_MIN_GRACE_SEC = 600.0           # POST /admin/assets/gc never goes below this (422)
+
+# /admin/* endpoints require this in the X-Admin-Token header (disabled when unset)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
 for _d in [OUTPUT_DIR, STEMS_DIR, MASTER_DIR, UPLOAD_TMP]:
     _d.mkdir(exist_ok=True)
 
-# In-memory SSE progress store  { task_id: {"status":…,"pct":…} }
-_gen_progress: dict = {}
+# Tracked generations + their SSE progress state (see job_manager.py).
+# JOB_STORE=redis shares that state across uvicorn workers and Celery tasks.
+_jobs = JobManager(workers=TRACKED_WORKERS, max_queue=TRACKED_QUEUE_MAX, ttl_sec=JOB_TTL_SEC,
+                   store=make_job_store(JOB_TTL_SEC))
+# 429 + Retry-After when the estimated queue wait is too long (see admission.py)
+_admission = AdmissionController()
+# Outputs and uploads are stored once per content; unreferenced ones are GC'd (see asset_store.py)
+_assets = AssetStore(ASSET_DIR, {"/audio": OUTPUT_DIR, "/stems": STEMS_DIR, "/mastered": MASTER_DIR},
+                     scratch=[UPLOAD_TMP])
+# Identical seeded requests in flight share one generation / one Celery task (see single_flight.py)
+_flights       = SingleFlight()
+_async_flights = SingleFlight()
 
 # ── Mood → prompt map (mirrors beat_generator.py) ─────────────────
 MOOD_PROMPTS: dict[str, str] = {
@@ -117,17 +210,81 @@ MOOD_PROMPTS: dict[str, str] = {
     "Middle Eastern":     "Middle Eastern music with oud, darbuka drums, haunting scales, traditional yet modern fusion",
 }
 
-# ── Load model once at startup ────────────────────────────────────
-print("[..] Loading MusicGen model…")
-_device     = "cuda" if torch.cuda.is_available() else "cpu"
-_dtype      = torch.float16 if _device == "cuda" else torch.float32
-_gpu_name   = torch.cuda.get_device_name(0) if _device == "cuda" else "CPU"
-_processor  = AutoProcessor.from_pretrained(MODEL_NAME)
-_model      = MusicgenForConditionalGeneration.from_pretrained(
-    MODEL_NAME, torch_dtype=_dtype
-).to(_device)
-_model.eval()
-print(f"[OK] Model ready on {_device} ({_gpu_name}) dtype={_dtype}")
+# ── Load model in the background ──────────────────────────────────
+# The port binds straight away (auth, projects, library work meanwhile);
+# _load_models() then loads MusicGen, precomputes the mood prompts and runs
+# one short dummy generation so the first real request doesn't pay for
+# kernel JIT / allocator warm-up. Generation endpoints answer 503 with
+# Retry-After until the state is "ready".
+# CPU precision (fp32 | int8 | bf16) comes from MUSICGEN_CPU_MODE — see model_loader.py.
+# Other variants (medium, melody) load on demand and are evicted when idle
+# once MODEL_RAM_BUDGET_MB is exceeded; the default model is pinned.
+_model_state = {"state": "loading", "load_sec": None, "warmup_sec": None, "error": None}
+_device, _gpu_name = "cpu", "CPU"
+_budget = _registry = _processor = _model = _dtype = _precision = None
+_encoder_cache = _scheduler = _decode_stage = None
+_gen_cache = GenerationCache(GEN_CACHE_DIR, GEN_CACHE_MAX_MB * 1024 * 1024)
+
+
+def _load_models():
+    global _device, _gpu_name, _budget, _registry, _processor, _model, _dtype, _precision
+    global _encoder_cache, _scheduler, _decode_stage
+    t0 = time.time()
+    try:
+        import torch
+        import audio_processing            # noqa: F401 — librosa import is slow, pay it here
+        from model_registry import ModelRegistry, MODEL_RAM_BUDGET_MB
+        from inference import BatchScheduler, DecodeStage, musicgen_batch_runner, duration_to_tokens
+        from encoder_cache import TextEncoderCache
+
+        print("[..] Loading MusicGen model…")
+        _budget   = ThreadBudget()         # INFER_SLOTS × THREADS_PER_SLOT — see thread_budget.py
+        _device   = "cuda" if torch.cuda.is_available() else "cpu"
+        _gpu_name = torch.cuda.get_device_name(0) if _device == "cuda" else "CPU"
+        _registry = ModelRegistry(_device, budget_bytes=MODEL_RAM_BUDGET_MB << 20)
+        base      = _registry.get(MODEL_KEY, pin=True)
+        _processor, _model, _dtype, _precision = base.processor, base.model, base.dtype, base.precision
+
+        # Encode the built-in mood prompts once; generation reuses them via encoder_outputs
+        _encoder_cache = TextEncoderCache(_processor, _model, _device, _dtype,
+                                          max_entries=ENCODER_CACHE_SIZE)
+        _encoder_cache.precompute(MOOD_PROMPTS.values())
+
+        _decode_stage = DecodeStage(DECODE_WORKERS) if GEN_PIPELINE else None
+        _scheduler = BatchScheduler(
+            musicgen_batch_runner(_processor, _model, _device, _dtype, encoder_cache=_encoder_cache,
+                                  decode_stage=_decode_stage),
+            max_batch_size=BATCH_MAX_SIZE,
+            max_wait_ms=BATCH_MAX_WAIT_MS,
+            token_buckets=[duration_to_tokens(sec, _model) for sec in DURATION_BUCKETS],
+            budget=_budget,
+            on_batch=_admission.record_batch,
+        )
+        _admission.parallelism = _scheduler.workers
+        _model_state.update(state="warming", load_sec=round(time.time() - t0, 1))
+        print(f"[OK] Model loaded on {_device} ({_gpu_name}) dtype={_dtype} "
+              f"precision={_precision} in {_model_state['load_sec']}s — warming up")
+
+        t1 = time.time()
+        if MODEL_WARMUP_TOKENS > 0:
+            _scheduler.generate(next(iter(MOOD_PROMPTS.values())), MODEL_WARMUP_TOKENS)
+        _model_state.update(state="ready", warmup_sec=round(time.time() - t1, 1))
+        print(f"[OK] Model ready (warm-up {_model_state['warmup_sec']}s)")
+    except Exception as e:
+        _model_state.update(state="error", error=f"{type(e).__name__}: {e}")
+        print(f"[X] Model load failed: {e}")
+
+
+def _require_model():
+    """Dependency for endpoints that need MusicGen: 503 + Retry-After until ready."""
+    state = _model_state["state"]
+    if state == "ready":
+        return
+    if state == "error":
+        raise HTTPException(503, f"Model failed to load: {_model_state['error']}")
+    raise HTTPException(503, f"Model is {state}, try again shortly",
+                        headers={"Retry-After": str(MODEL_RETRY_AFTER)})
+
 
 # ── FastAPI app ───────────────────────────────────────────────────
 app = FastAPI(title="BeatFlow AI", version="2.0.0")
@@ -136,6 +293,9 @@ app = FastAPI(title="BeatFlow AI", version="2.0.0")
 def on_startup():
     init_db()
     print("[OK] Database initialised")
+    threading.Thread(target=_load_models, name="model-loader", daemon=True).start()
+    if ASSET_GC_INTERVAL_SEC > 0:
+        threading.Thread(target=_asset_gc_loop, name="asset-gc", daemon=True).start()
 
 app.add_middleware(
     CORSMiddleware,
@@ -161,8 +321,21 @@ async def root_redirect():
 
 
 class GenerateRequest(BaseModel):
-    prompt: str
-    name:   str = "Custom"
+    prompt:   str
+    name:     str = "Custom"
+    seed:     Optional[int] = None     # set → deterministic mode (reproducible + cached)
+    duration: Optional[float] = None   # seconds (default ~10, max GEN_MAX_DURATION_SEC)
+    variations: int = 1                # >1 → that many alternatives in one batched pass
+    encodings: list[str] = []          # "flac" / "opus": compressed copies, encoded in the background
+
+
+class Variation(BaseModel):
+    url:      str
+    filename: str
+    duration: float
+    seed:     int                      # POST /generate with this seed reproduces it
+    encodings: dict[str, str] = {}     # encoding → url (served once its encode finishes)
+    cached:   bool = False
 
 
 class GenerateResponse(BaseModel):
@@ -171,6 +344,10 @@ class GenerateResponse(BaseModel):
     duration: float
     elapsed:  float
     device:   str
+    seed:     Optional[int] = None
+    cached:   bool = False
+    variations: list[Variation] = []   # every variation (the first is also above)
+    encodings: dict[str, str] = {}     # encoding → url (served once its encode finishes)
 
 
 class FilenameRequest(BaseModel):
@@ -178,8 +355,10 @@ class FilenameRequest(BaseModel):
 
 
 class ContinueRequest(BaseModel):
-    filename: str
-    prompt:   str
+    filename:    str
+    prompt:      str
+    context_sec: Optional[float] = None   # trailing seconds used as the prompt (None → CONTINUE_CONTEXT_SEC)
+    stitch:      bool = True              # False → return only the new audio
 
 
 class MasterRequest(BaseModel):
@@ -191,38 +370,145 @@ def _safe_name(label: str) -> str:
     return re.sub(r"[^a-zA-Z0-9_-]", "_", label.replace(" ", "_"))[:30]
 
 
-def _generate(prompt: str, label: str) -> tuple[Path, float]:
-    """Generate audio and save as WAV. Returns (path, duration_seconds)."""
-    inputs = _processor(
-        text=[prompt],
-        padding=True,
-        return_tensors="pt",
-    ).to(_device)
+def _check_duration(duration: Optional[float]):
+    if duration is not None and not 0 < duration <= MAX_DURATION_SEC:
+        raise HTTPException(status_code=422,
+                            detail=f"duration must be between 0 and {MAX_DURATION_SEC:g} seconds")
 
-    with torch.inference_mode():
-        with torch.autocast(device_type=_device, dtype=_dtype, enabled=(_device == "cuda")):
-            output = _model.generate(**inputs, max_new_tokens=DURATION_TOKENS)
 
-    # Shape: [batch, channels, samples] → numpy [samples]
-    audio_np = output[0, 0].cpu().float().numpy()
-    sample_rate = _model.config.audio_encoder.sampling_rate
-    duration    = len(audio_np) / sample_rate
+def _duration_tokens(duration: Optional[float]) -> int:
+    """max_new_tokens for a requested duration in seconds (None → DURATION_TOKENS)."""
+    _check_duration(duration)
+    if duration is None:
+        return DURATION_TOKENS
+    from inference import duration_to_tokens
+    return duration_to_tokens(duration, _model)
+
 
-    ts       = datetime.now().strftime("%H%M%S")
-    filename = f"{_safe_name(label)}_{ts}.wav"
-    out_path = OUTPUT_DIR / filename
+def _client(conn: HTTPConnection) -> tuple[str, int]:
+    """(fair-queuing key, priority) of a request or WebSocket. A valid bearer
+    token (header, or ?token= for WebSockets) → its user at PRIORITY_USER,
+    otherwise the client IP at PRIORITY_ANON. Only the JWT is checked; the
+    user row is not loaded."""
+    auth  = conn.headers.get("authorization", "")
+    token = auth[7:] if auth.lower().startswith("bearer ") else conn.query_params.get("token")
+    sub   = decode_token(token).get("sub") if token else None
+    if sub:
+        return f"user:{sub}", PRIORITY_USER
+    return f"ip:{conn.client.host if conn.client else 'unknown'}", PRIORITY_ANON
 
+
+def _admit(tokens: int, user: str, priority: int):
+    """Admission ticket for a generation of `tokens`, or 429 + Retry-After."""
     try:
-        import torchaudio
-        import io
-        wav_tensor = torch.from_numpy(audio_np).unsqueeze(0)
-        buf = io.BytesIO()
-        torchaudio.save(buf, wav_tensor, sample_rate, format="wav")
-        out_path.write_bytes(buf.getvalue())
-    except Exception:
-        import soundfile as sf
-        sf.write(str(out_path), audio_np, sample_rate)
+        return _admission.admit(tokens, user, priority)
+    except AdmissionRejected as e:
+        raise HTTPException(429, str(e), headers={"Retry-After": str(e.retry_after)})
 
+
+def _intern(path):
+    """Hand an output to the asset store; failing only costs the deduplication."""
+    try:
+        _assets.intern(path)
+    except OSError as e:
+        print(f"[!] Asset store: {e}")
+
+
+def _generate(prompt: str, label: str, seed: Optional[int] = None,
+              on_progress=None, max_new_tokens: int = DURATION_TOKENS,
+              cancel: Optional[CancelToken] = None, priority: int = PRIORITY_USER,
+              user: Optional[str] = None) -> tuple[Path, float, bool]:
+    """Generate audio and save as WAV. Returns (path, duration_seconds, cached).
+    Concurrent callers are batched together by _scheduler. With a seed the
+    result is reproducible and served from _gen_cache when already generated.
+    Identical seeded requests (prompt, length, params, seed) already in flight
+    share that generation via _flights; each caller still gets its own file.
+    Unseeded requests never share: each one is a new beat.
+    on_progress(dict) receives tokens_done / tokens_per_sec / eta_sec.
+    Raises GenerationCancelled (nothing written) once `cancel` fires.
+    priority / user order the scheduler queue (see _client)."""
+    out_path = OUTPUT_DIR / output_name(_safe_name(label))
+
+    key = GenerationCache.make_key(MODEL_NAME, prompt, max_new_tokens,
+                                   sampling_params(_model), seed)
+    if seed is not None:
+        hit = _gen_cache.get(key)
+        if hit is not None:
+            import soundfile as sf
+            link_or_copy(hit, out_path)
+            _intern(out_path)
+            return out_path, sf.info(str(out_path)).duration, True
+
+    if seed is None:
+        return (*_generate_once(prompt, out_path, seed, on_progress, max_new_tokens,
+                                cancel, priority, user), False)
+
+    def _run(fan_out, flight_cancel):
+        path, duration = _generate_once(prompt, out_path, seed, fan_out, max_new_tokens,
+                                        flight_cancel, priority, user)
+        _gen_cache.put(key, path)              # cached whether or not the run was shared
+        return path, duration
+
+    if not GEN_DEDUPE:
+        return (*_run(on_progress, cancel), False)
+
+    (path, duration), shared = _flights.do(key, _run, on_progress=on_progress, cancel=cancel)
+    if shared:
+        link_or_copy(path, out_path)
+        _intern(out_path)
+    return out_path, duration, False
+
+
+def _generate_variations(prompt: str, label: str, seeds: list[int],
+                         max_new_tokens: int = DURATION_TOKENS, priority: int = PRIORITY_USER,
+                         user: Optional[str] = None) -> list[tuple[Path, float, bool]]:
+    """One (path, duration, cached) per seed. Uncached seeds are generated together
+    (_scheduler.submit_variations: one text encode, one batched generate) and
+    each is cached under its own seed, exactly as a seeded _generate would."""
+    from inference import save_codes
+    import soundfile as sf
+    params  = sampling_params(_model)
+    results: dict[int, tuple[Path, float, bool]] = {}
+    pending = []
+    for seed in seeds:
+        out_path = OUTPUT_DIR / output_name(_safe_name(label))
+        key      = GenerationCache.make_key(MODEL_NAME, prompt, max_new_tokens, params, seed)
+        hit      = _gen_cache.get(key)
+        if hit is not None:
+            link_or_copy(hit, out_path)
+            _intern(out_path)
+            results[seed] = (out_path, sf.info(str(out_path)).duration, True)
+        else:
+            pending.append((seed, key, out_path))
+
+    futures = _scheduler.submit_variations(prompt, max_new_tokens, [p[0] for p in pending],
+                                           priority=priority, user=user, with_codes=True)
+    sample_rate = _model.config.audio_encoder.sampling_rate
+    for (seed, key, out_path), future in zip(pending, futures):
+        audio_np, codes = future.result()
+        write_audio(out_path, audio_np, sample_rate)
+        save_codes(out_path, codes)
+        _intern(out_path)
+        _gen_cache.put(key, out_path)
+        results[seed] = (out_path, len(audio_np) / sample_rate, False)
+    return [results[seed] for seed in seeds]
+
+
+def _generate_once(prompt: str, out_path: Path, seed: Optional[int], on_progress,
+                   max_new_tokens: int, cancel: Optional[CancelToken], priority: int,
+                   user: Optional[str]) -> tuple[Path, float]:
+    """One scheduler generation written to out_path (+ its EnCodec codes for
+    /continue). Returns (path, duration_seconds). The write happens on the
+    request's thread, off the scheduler (see GEN_PIPELINE)."""
+    from inference import save_codes
+    audio_np, codes = _scheduler.generate(prompt, max_new_tokens, seed=seed,
+                                          on_progress=on_progress, cancel=cancel,
+                                          priority=priority, user=user, with_codes=True)
+    sample_rate = _model.config.audio_encoder.sampling_rate
+    duration    = len(audio_np) / sample_rate
+    write_audio(out_path, audio_np, sample_rate)
+    save_codes(out_path, codes)
+    _intern(out_path)
     return out_path, duration
 
 
@@ -237,36 +523,135 @@ def health():
         redis_ok = True
     except Exception:
         pass
+    ready = _model_state["state"] == "ready"
     return {
         "status":    "ok",
+        "model":     dict(_model_state),      # state: loading | warming | ready | error
         "device":    _device,
         "gpu_name":  _gpu_name,
-        "dtype":     str(_dtype).replace("torch.", ""),
+        "dtype":     str(_dtype).replace("torch.", "") if _dtype is not None else None,
+        "precision": _precision,
         "redis":     "connected" if redis_ok else "unavailable",
+        "scheduler": _scheduler.stats() if ready else None,
+        "decode_stage": _decode_stage.stats() if _decode_stage is not None else None,
+        "threads":   _budget.stats() if _budget is not None else None,
+        "cache":     _gen_cache.stats(),
+        "jobs":      _jobs.stats(),
+        "admission": _admission.stats(),
+        "dedupe":    {"generate": _flights.stats(), "async": _async_flights.stats()},
+        "audio_encoder": audio_writer.stats(),
+        "encoder_cache": _encoder_cache.stats() if ready else None,
+        "models":    ({n: e["precision"] for n, e in _registry.stats()["loaded"].items()}
+                      if _registry is not None else {}),
     }
 
 
-@app.post("/generate", response_model=GenerateResponse)
-def generate(req: GenerateRequest):
+@app.post("/generate", response_model=GenerateResponse, dependencies=[Depends(_require_model)])
+def generate(req: GenerateRequest, request: Request):
     # Resolve prompt: if name matches a known mood AND prompt is empty/same, use canonical
     prompt = MOOD_PROMPTS.get(req.name, req.prompt) if not req.prompt else req.prompt
 
+    tokens = _duration_tokens(req.duration)
+    if not 1 <= req.variations <= GEN_MAX_VARIATIONS:
+        raise HTTPException(400, f"variations must be between 1 and {GEN_MAX_VARIATIONS}")
+    unknown = set(req.encodings) - set(COMPRESSED)
+    if unknown:
+        raise HTTPException(400, f"unknown encodings {sorted(unknown)}, choose from {list(COMPRESSED)}")
+    user, priority = _client(request)
+    ticket = _admit(tokens * req.variations, user, priority)
     t0 = time.time()
     try:
-        path, duration = _generate(prompt, req.name)
+        if req.variations == 1:
+            path, duration, cached = _generate(prompt, req.name, seed=req.seed,
+                                               max_new_tokens=tokens,
+                                               priority=priority, user=user)
+            seeds, outputs = [req.seed], [(path, duration, cached)]
+        else:
+            # a given seed makes the whole set reproducible: seed, seed+1, …
+            import secrets
+            base    = req.seed if req.seed is not None else secrets.randbelow(2**31 - GEN_MAX_VARIATIONS)
+            seeds   = [base + i for i in range(req.variations)]
+            outputs = _generate_variations(prompt, req.name, seeds, max_new_tokens=tokens,
+                                           priority=priority, user=user)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        ticket.release()
 
     elapsed = round(time.time() - t0, 1)
+    path, duration, cached = outputs[0]
+    # compressed copies: queued here, written next to the WAV by the background encoder
+    encoded = [{enc: f"/audio/{encoded_path(p, enc).name}" for enc in encode_async(p, req.encodings)}
+               for p, _, _ in outputs]
     return GenerateResponse(
         url=f"/audio/{path.name}",
         filename=path.name,
         duration=duration,
         elapsed=elapsed,
         device=f"{_device} ({_gpu_name})",
+        seed=seeds[0],
+        cached=cached,
+        variations=[Variation(url=f"/audio/{p.name}", filename=p.name, duration=d,
+                              seed=sd, cached=c, encodings=enc)
+                    for sd, (p, d, c), enc in zip(seeds, outputs, encoded)]
+                   if req.variations > 1 else [],
+        encodings=encoded[0],
     )
 
 
+@app.get("/generate/stream", dependencies=[Depends(_require_model)])
+def generate_stream(
+    request: Request,
+    prompt: str = Query("", description="Text prompt (empty → mood prompt for name)"),
+    name:   str = Query("Custom"),
+    duration: Optional[float] = Query(None, description="Seconds (default ~10)"),
+):
+    """
+    Stream a beat as a chunked 16-bit PCM WAV while it is still being
+    generated; playback can start after the first ~second of audio.
+    The full beat is also written to beat_outputs/ (see X-Beat-Filename).
+    """
+    prompt = MOOD_PROMPTS.get(name, prompt) if not prompt else prompt
+    if not prompt:
+        raise HTTPException(status_code=400, detail="prompt or a known mood name is required")
+    tokens = _duration_tokens(duration)
+    user, priority = _client(request)
+    ticket = _admit(tokens, user, priority)
+
+    from inference import AudioStreamer, stream_generate, wav_stream_header, to_pcm16
+    streamer = AudioStreamer(_model, play_frames=STREAM_PLAY_FRAMES)
+    cancel   = CancelToken()
+    out_path = OUTPUT_DIR / output_name(f"{_safe_name(name)}_stream")
+
+    # Runs between batches on the scheduler thread, like /continue
+    _scheduler.submit_call(lambda: stream_generate(
+        _processor, _model, _device, _dtype, prompt, tokens, streamer,
+        encoder_cache=_encoder_cache, cancel=cancel, codes_for=out_path),
+        cancel=cancel, priority=priority, user=user,
+    ).add_done_callback(lambda _: ticket.release())
+
+    def wav_chunks():
+        finished = False
+        try:
+            yield wav_stream_header(streamer.sample_rate)
+            with open_audio(out_path, streamer.sample_rate) as f:
+                for chunk in streamer.chunks():
+                    f.write(chunk)
+                    yield to_pcm16(chunk)
+            finished = True
+            _intern(out_path)
+        finally:
+            if not finished:                  # client disconnected: stop decoding, drop the file
+                cancel.cancel("client disconnected")
+                out_path.unlink(missing_ok=True)
+                codes_path(out_path).unlink(missing_ok=True)
+
+    return StreamingResponse(wav_chunks(), media_type="audio/wav",
+                             headers={"Cache-Control": "no-cache",
+                                      "X-Accel-Buffering": "no",
+                                      "X-Beat-Filename": out_path.name})
+
+
 # ── Phase 2B: Audio Analysis ──────────────────────────────────────
 @app.post("/analyze")
 def analyze(req: FilenameRequest):
@@ -308,11 +693,15 @@ def separate(req: SeparateRequest, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail=f"File not found: {req.filename}")
     try:
         from audio_processing import separate_stems
-        stems = separate_stems(str(audio_path))
+        from contextlib import nullcontext
+        # demucs subprocess inherits the thread caps; no budget yet while starting up
+        with _budget.slot() if _budget is not None else nullcontext():
+            stems = separate_stems(str(audio_path))
         # Return web-accessible URLs for each stem
         stem_urls = {}
         stems_dir_abs = STEMS_DIR.resolve()
         for name, path in stems.items():
+            _intern(path)
             rel = Path(path).resolve().relative_to(stems_dir_abs)
             stem_urls[name] = f"/stems/{rel.as_posix()}"
         # Persist to DB if commit_id is given
@@ -333,58 +722,86 @@ def separate(req: SeparateRequest, db: Session = Depends(get_db)):
 
 
 # ── Phase 3A: Audio Continuation ─────────────────────────────────
-@app.post("/continue")
-def continue_beat_endpoint(req: ContinueRequest):
-    """Extend an existing beat with a new prompt."""
+@app.post("/continue", dependencies=[Depends(_require_model)])
+def continue_beat_endpoint(req: ContinueRequest, request: Request):
+    """Extend an existing beat with a new prompt. Beats generated here carry
+    their EnCodec codes (<name>.codes.npy), which skip decode/resample/encode.
+    Only the last context_sec seconds are the prompt, so each extension costs
+    the same; the result is the whole track (stitch) or just the new part."""
     audio_path = OUTPUT_DIR / req.filename
     if not audio_path.exists():
         raise HTTPException(status_code=404, detail=f"File not found: {req.filename}")
+    context_sec = CONTINUE_CONTEXT_SEC if req.context_sec is None else req.context_sec
+    if context_sec <= 0:
+        context_sec = None
+    user, priority = _client(request)
+    ticket = _admit(CONTINUE_TOKENS, user, priority)
     try:
         from audio_processing import continue_beat
         t0 = time.time()
-        out_path, duration = continue_beat(
+        # Runs on the scheduler thread so it never competes with a batched run
+        out_path, duration = _scheduler.call(lambda: continue_beat(
             audio_path=str(audio_path),
             prompt=req.prompt,
             processor=_processor,
             model=_model,
             device=_device,
             dtype=_dtype,
-        )
+            max_new_tokens=CONTINUE_TOKENS,
+            context_sec=context_sec,
+            stitch=req.stitch,
+        ), priority=priority, user=user)
+        _intern(out_path)
         elapsed = round(time.time() - t0, 1)
         return {
-            "url":      f"/audio/{out_path.name}",
-            "filename": out_path.name,
-            "duration": round(duration, 2),
-            "elapsed":  elapsed,
-            "device":   f"{_device} ({_gpu_name})",
+            "url":         f"/audio/{out_path.name}",
+            "filename":    out_path.name,
+            "duration":    round(duration, 2),
+            "elapsed":     elapsed,
+            "context_sec": context_sec,
+            "stitched":    req.stitch,
+            "device":      f"{_device} ({_gpu_name})",
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        ticket.release()
 
 
 # ── Phase 2C: Hum / Melody → Beat (MusicGen Melody) ───────────────
-@app.post("/hum")
+@app.post("/hum", dependencies=[Depends(_require_model)])
 async def hum_to_beat_endpoint(
+    request: Request,
     file: UploadFile = File(...),
     prompt: str = Form(default="upbeat electronic beat"),
 ):
     """Upload a hummed/recorded melody and get a generated beat."""
+    ticket = _admit(HUM_TOKENS, *_client(request))
     try:
-        ts       = datetime.now().strftime("%H%M%S")
-        tmp_path = UPLOAD_TMP / f"hum_{ts}_{file.filename}"
+        tmp_path = UPLOAD_TMP / output_name("hum", Path(file.filename or "").suffix)
         with open(tmp_path, "wb") as f:
             shutil.copyfileobj(file.file, f)
 
         from audio_processing import hum_to_beat
+
+        def _run():
+            with _registry.acquire("melody") as melody, _budget.slot():
+                return hum_to_beat(
+                    audio_path=str(tmp_path),
+                    prompt=prompt,
+                    processor=melody.processor,
+                    model=melody.model,
+                    device=_device,
+                    dtype=melody.dtype,
+                    max_new_tokens=HUM_TOKENS,
+                )
+
         t0 = time.time()
-        out_path, duration = hum_to_beat(
-            audio_path=str(tmp_path),
-            prompt=prompt,
-            device=_device,
-            dtype=_dtype,
-        )
+        # off the event loop: loading + generating takes minutes on CPU
+        out_path, duration = await asyncio.to_thread(_run)
         elapsed = round(time.time() - t0, 1)
         tmp_path.unlink(missing_ok=True)
+        _intern(out_path)
         return {
             "url":      f"/audio/{out_path.name}",
             "filename": out_path.name,
@@ -394,21 +811,20 @@ async def hum_to_beat_endpoint(
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        ticket.release()
 
 
 # ── Audio File Upload ─────────────────────────────────────────────
 @app.post("/upload")
 async def upload_audio(file: UploadFile = File(...)):
-    """Upload any audio file to be used with analyze / separate / master tools."""
+    """Upload any audio file to be used with analyze / separate / master tools.
+    Files are named by content: the same file uploaded again is not stored twice."""
     ext = Path(file.filename).suffix.lower() if file.filename else ".wav"
     if ext not in {".wav", ".mp3", ".flac", ".ogg", ".aac", ".m4a"}:
         raise HTTPException(status_code=400, detail=f"Unsupported audio format: {ext}")
-    import uuid
-    fname = f"upload_{uuid.uuid4().hex[:10]}{ext}"
-    dest  = OUTPUT_DIR / fname
-    with open(dest, "wb") as f:
-        shutil.copyfileobj(file.file, f)
-    return {"filename": fname, "audio_url": f"/audio/{fname}"}
+    dest, _, duplicate = await asyncio.to_thread(_assets.put_upload, file.file, ext, OUTPUT_DIR)
+    return {"filename": dest.name, "audio_url": f"/audio/{dest.name}", "duplicate": duplicate}
 
 
 # ── Phase 3B: AI Mastering (matchering) ──────────────────────────
@@ -429,6 +845,7 @@ def master_endpoint(req: MasterRequest):
         from audio_processing import master_audio
         t0 = time.time()
         out_path, info = master_audio(str(target_path), reference_path)
+        _intern(out_path)
         elapsed = round(time.time() - t0, 1)
         return {
             "url":      f"/mastered/{out_path.name}",
@@ -769,8 +1186,10 @@ def _commit_summary(c: Commit) -> dict:
 # ─────────────────────────────────────────────────────────────────
 
 class AsyncGenerateRequest(BaseModel):
-    prompt: str
-    name:   str = "Custom"
+    prompt:   str
+    name:     str = "Custom"
+    seed:     Optional[int] = None
+    duration: Optional[float] = None   # seconds
 
 
 @app.post("/generate/async")
@@ -778,19 +1197,34 @@ def generate_async(req: AsyncGenerateRequest):
     """
     Dispatch beat generation to Celery worker.
     Returns task_id immediately; poll GET /tasks/{task_id} for status.
+    With JOB_STORE=redis the task also reports to /sse/progress/{task_id}.
+    An identical seeded request (prompt, duration, seed) whose task is still
+    pending or running gets that task_id back (deduplicated: true) instead of a new task.
     Falls back to 503 with guidance if Redis is not reachable.
     """
     prompt = MOOD_PROMPTS.get(req.name, req.prompt) if not req.prompt else req.prompt
+    _check_duration(req.duration)                    # validate before dispatch
     try:
-        from celery_worker import generate_beat_task, celery_app as _ca
-        # Ping broker to verify connectivity before dispatching
-        conn = _ca.connection(transport_options={"max_retries": 1, "interval_start": 0,
-                                                  "interval_step": 0, "interval_max": 0})
-        conn.ensure_connection(max_retries=1)
-        conn.close()
-        task = generate_beat_task.delay(prompt, req.name)
-        return {"task_id": task.id, "status": "pending",
-                "poll_url": f"/tasks/{task.id}"}
+        import uuid
+        from celery_worker import generate_beat_task
+
+        def _dispatch() -> str:
+            _celery_app()
+            task_id = str(uuid.uuid4())
+            if _jobs.store.backend == "redis":        # visible to SSE before the worker starts
+                _jobs.track(task_id, kind="celery", url=None)
+            return generate_beat_task.apply_async(args=(prompt, req.name),
+                                                  kwargs={"seed": req.seed, "duration": req.duration},
+                                                  task_id=task_id).id
+
+        if GEN_DEDUPE and req.seed is not None:
+            # the worker's sampling params aren't known here; it loads MODEL_NAME too
+            key = GenerationCache.make_key(MODEL_NAME, prompt, 0, {"duration": req.duration}, req.seed)
+            task_id, shared = _async_flights.join(key, _dispatch, _celery_in_flight)
+        else:
+            task_id, shared = _dispatch(), False
+        return {"task_id": task_id, "status": "pending", "deduplicated": shared,
+                "poll_url": f"/tasks/{task_id}", "progress_url": f"/sse/progress/{task_id}"}
     except Exception as e:
         raise HTTPException(
             status_code=503,
@@ -799,6 +1233,47 @@ def generate_async(req: AsyncGenerateRequest):
         )
 
 
+def _celery_app():
+    """celery_worker's app after a quick broker ping (raises when Redis is down)."""
+    from celery_worker import celery_app as _ca
+    conn = _ca.connection(transport_options={"max_retries": 1, "interval_start": 0,
+                                              "interval_step": 0, "interval_max": 0})
+    conn.ensure_connection(max_retries=1)
+    conn.close()
+    return _ca
+
+
+def _celery_in_flight(task_id: str) -> bool:
+    """True while a dispatched Celery task is pending or running."""
+    job = _jobs.get(task_id)
+    if job is not None:
+        return job["status"] not in FINAL_STATES
+    from celery import states
+    from celery.result import AsyncResult
+    from celery_worker import celery_app as _celery
+    return AsyncResult(task_id, app=_celery).state not in states.READY_STATES
+
+
+@app.delete("/tasks/{task_id}")
+def cancel_task(task_id: str):
+    """
+    Cancel a generation. Queued work is dropped at once; a running
+    generation stops at its next decoding step and writes nothing.
+    Celery tasks are also revoked (a revoked task that has not started
+    never runs; a running one stops through the job store, JOB_STORE=redis).
+    A task_id handed to several /generate/async callers is cancelled for all.
+    """
+    status = _jobs.cancel(task_id, "cancelled by client")
+    if status is None or (_jobs.get(task_id) or {}).get("kind") == "celery":
+        try:
+            _celery_app().control.revoke(task_id)
+            status = status or "revoked"
+        except Exception:
+            if status is None:
+                raise HTTPException(404, f"Unknown task: {task_id}")
+    return {"task_id": task_id, "status": status}
+
+
 @app.get("/tasks/{task_id}")
 def get_task_status(task_id: str):
     """
@@ -818,7 +1293,8 @@ def get_task_status(task_id: str):
         if state == "SUCCESS":
             return {"task_id": task_id, "status": "completed", "result": result.result}
         if state == "FAILURE":
-            return {"task_id": task_id, "status": "failed",
+            cancelled = type(result.result).__name__ == "GenerationCancelled"
+            return {"task_id": task_id, "status": "cancelled" if cancelled else "failed",
                     "error": str(result.result)}
         return {"task_id": task_id, "status": state.lower()}
     except Exception as e:
@@ -1266,56 +1742,416 @@ def diff_commits(
 # TRACKED GENERATION + SSE PROGRESS
 # ═══════════════════════════════════════════════════════════════════
 
-import threading, uuid as _uuid_mod
-
 class TrackedGenerateRequest(BaseModel):
-    name:   str
-    prompt: Optional[str] = ""
+    name:     str
+    prompt:   Optional[str] = ""
+    seed:     Optional[int] = None
+    duration: Optional[float] = None   # seconds
 
 
-@app.post("/generate/tracked")
-def generate_tracked(req: TrackedGenerateRequest):
-    """Start an async generation and return a task_id for SSE polling."""
-    task_id = str(_uuid_mod.uuid4())
-    _gen_progress[task_id] = {"status": "queued", "pct": 0, "url": None, "error": None}
+def _tracked_job(prompt: str, label: str, seed: Optional[int], tokens: int,
+                 cancel: CancelToken, ticket):
+    """fn(update) for _jobs.submit: one _generate call reporting token progress.
+    The admission ticket is released when it ends or is cancelled while queued."""
+    cancel.on_cancel(ticket.release)
 
-    prompt = MOOD_PROMPTS.get(req.name, req.prompt) if not req.prompt else req.prompt
+    def _run(update):
+        def _on_progress(info: dict):
+            # decoding is ~95% of the work; the last 5% is EnCodec decode + WAV write
+            pct = int(95 * info["tokens_done"] / max(info["tokens_total"], 1))
+            update(status="generating", pct=pct, **info)
 
-    def _run():
         try:
-            _gen_progress[task_id].update({"status": "generating", "pct": 10})
-            path, duration = _generate(prompt, req.name)
-            _gen_progress[task_id].update({
-                "status": "done", "pct": 100,
-                "url": f"/audio/{path.name}",
-                "filename": path.name,
-                "duration": duration,
-            })
-        except Exception as e:
-            _gen_progress[task_id].update({"status": "error", "pct": 0, "error": str(e)})
+            path, duration, cached = _generate(prompt, label, seed=seed,
+                                               on_progress=_on_progress,
+                                               max_new_tokens=tokens, cancel=cancel,
+                                               priority=ticket.priority, user=ticket.user)
+        finally:
+            ticket.release()
+        return {
+            "url":      f"/audio/{path.name}",
+            "filename": path.name,
+            "duration": duration,
+            "cached":   cached,
+        }
+    return _run
 
-    threading.Thread(target=_run, daemon=True).start()
+
+@app.post("/generate/tracked", dependencies=[Depends(_require_model)])
+def generate_tracked(req: TrackedGenerateRequest, request: Request):
+    """Queue a generation on the job pool and return a task_id for SSE polling.
+    429 + Retry-After when admission control rejects it, 503 + Retry-After
+    when TRACKED_QUEUE_MAX jobs are already waiting."""
+    tokens = _duration_tokens(req.duration)
+    prompt = MOOD_PROMPTS.get(req.name, req.prompt) if not req.prompt else req.prompt
+    ticket = _admit(tokens, *_client(request))
+    cancel = CancelToken()
+    try:
+        task_id = _jobs.submit(_tracked_job(prompt, req.name, req.seed, tokens, cancel, ticket),
+                               cancel=cancel, url=None)
+    except JobQueueFull as e:
+        ticket.release()
+        raise HTTPException(503, f"Generation queue full ({e}), try again shortly",
+                            headers={"Retry-After": str(MODEL_RETRY_AFTER)})
     return {"task_id": task_id}
 
 
+class LongGenerateRequest(BaseModel):
+    name:          str = "Custom"
+    prompt:        Optional[str] = ""
+    duration:      float = 120.0           # seconds, up to LONG_MAX_SEC
+    seed:          Optional[int] = None    # window i samples with seed + i
+    window_sec:    Optional[float] = None  # defaults: LONG_WINDOW_SEC / LONG_CONTEXT_SEC /
+    context_sec:   Optional[float] = None  #           LONG_CROSSFADE_SEC
+    crossfade_sec: Optional[float] = None
+
+
+def _long_job(prompt: str, label: str, req: LongGenerateRequest, cancel: CancelToken, ticket):
+    """fn(update) for _jobs.submit: a generate_long run reporting each window.
+    Every window is its own _scheduler.call, so other requests run in between."""
+    cancel.on_cancel(ticket.release)
+
+    def _run(update):
+        from audio_processing import generate_long
+        out_path = OUTPUT_DIR / output_name(f"{_safe_name(label)}_long")
+
+        def _on_window(timing: dict):
+            update(status="generating", pct=int(95 * timing["total_sec"] / timing["target_sec"]),
+                   window=timing["window"], last_window=timing)
+
+        try:
+            path, duration, timings = generate_long(
+                prompt, _processor, _model, _device, _dtype, req.duration,
+                window_sec=req.window_sec or LONG_WINDOW_SEC,
+                context_sec=req.context_sec or LONG_CONTEXT_SEC,
+                crossfade_sec=LONG_CROSSFADE_SEC if req.crossfade_sec is None else req.crossfade_sec,
+                seed=req.seed, out_path=out_path, on_window=_on_window, cancel=cancel,
+                run_window=lambda fn: _scheduler.call(fn, cancel=cancel, priority=ticket.priority,
+                                                      user=ticket.user))
+        except BaseException:
+            out_path.unlink(missing_ok=True)   # partial track
+            raise
+        finally:
+            ticket.release()
+        _intern(path)
+        return {
+            "url":      f"/audio/{path.name}",
+            "filename": path.name,
+            "duration": round(duration, 2),
+            "windows":  timings,
+        }
+    return _run
+
+
+@app.post("/generate/long", dependencies=[Depends(_require_model)])
+def generate_long_track(req: LongGenerateRequest, request: Request):
+    """Queue a long-form (minutes) generation: fixed-size windows, each continuing
+    the tail of the previous one, crossfaded and streamed to disk. Returns a
+    task_id; /sse/progress reports every window's timing, the result lists all."""
+    prompt = MOOD_PROMPTS.get(req.name, req.prompt) if not req.prompt else req.prompt
+    if not prompt:
+        raise HTTPException(400, "prompt or a known mood name is required")
+    if not 0 < req.duration <= LONG_MAX_SEC:
+        raise HTTPException(400, f"duration must be between 0 and {LONG_MAX_SEC:.0f} seconds")
+    window  = req.window_sec or LONG_WINDOW_SEC
+    context = req.context_sec or LONG_CONTEXT_SEC
+    if not 0 < context < window <= MAX_DURATION_SEC:
+        raise HTTPException(400, f"need 0 < context_sec < window_sec <= {MAX_DURATION_SEC:.0f}")
+    fade = LONG_CROSSFADE_SEC if req.crossfade_sec is None else req.crossfade_sec
+    if not 0 <= fade < context:                # the seam is faded over context audio
+        raise HTTPException(422, f"need 0 <= crossfade_sec ({fade:g}) < context_sec ({context:g})")
+    from inference import duration_to_tokens
+    ticket = _admit(duration_to_tokens(req.duration, _model), *_client(request))
+    cancel = CancelToken()
+    try:
+        task_id = _jobs.submit(_long_job(prompt, req.name, req, cancel, ticket),
+                               cancel=cancel, url=None, kind="long")
+    except JobQueueFull as e:
+        ticket.release()
+        raise HTTPException(503, f"Generation queue full ({e}), try again shortly",
+                            headers={"Retry-After": str(MODEL_RETRY_AFTER)})
+    return {"task_id": task_id, "progress_url": f"/sse/progress/{task_id}"}
+
+
 @app.get("/sse/progress/{task_id}")
 async def sse_progress(task_id: str):
-    """Server-Sent Events stream for generation progress."""
+    """
+    Server-Sent Events stream for generation progress. Sends the job state
+    whenever it changes (pushed by _jobs, no polling) and a `: keep-alive`
+    comment after SSE_HEARTBEAT_SEC without changes. If the client goes
+    away and nobody reconnects within SSE_CANCEL_GRACE_SEC, the job is
+    cancelled. Connections are counted in the job store, so a reconnect
+    through another uvicorn worker (JOB_STORE=redis) keeps the job alive.
+    """
+    def _cancel_if_abandoned():               # on an executor thread: both calls may hit Redis
+        if not _jobs.listeners(task_id):
+            _jobs.cancel(task_id, "client disconnected")
+
     async def event_stream():
-        for _ in range(300):          # max 5 min (300 × 1 s)
-            info = _gen_progress.get(task_id, {"status": "unknown", "pct": 0})
-            data = json.dumps(info)
-            yield f"data: {data}\n\n"
-            if info.get("status") in ("done", "error"):
-                _gen_progress.pop(task_id, None)
-                break
-            await asyncio.sleep(1)
+        loop    = asyncio.get_running_loop()
+        changed = asyncio.Event()
+        unsubscribe = _jobs.subscribe(task_id, lambda: loop.call_soon_threadsafe(changed.set))
+        _jobs.watch(task_id)
+        deadline = loop.time() + SSE_MAX_SEC
+        info     = {}
+        try:
+            while True:
+                changed.clear()
+                info = _jobs.get(task_id) or {"status": "unknown", "pct": 0}
+                yield f"data: {json.dumps(info)}\n\n"
+                if info.get("status") in (*FINAL_STATES, "unknown"):
+                    break             # state stays readable until JOB_TTL_SEC expires
+                while not changed.is_set():
+                    timeout = min(SSE_HEARTBEAT_SEC, deadline - loop.time())
+                    if timeout <= 0:
+                        return
+                    try:
+                        await asyncio.wait_for(changed.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        yield ": keep-alive\n\n"
+        finally:
+            unsubscribe()
+            _jobs.unwatch(task_id)
+            if info.get("status") not in (*FINAL_STATES, "unknown") and SSE_CANCEL_GRACE_SEC >= 0:
+                loop.call_later(SSE_CANCEL_GRACE_SEC,
+                                lambda: loop.run_in_executor(None, _cancel_if_abandoned))
 
     return StreamingResponse(event_stream(), media_type="text/event-stream",
                              headers={"Cache-Control": "no-cache",
                                       "X-Accel-Buffering": "no"})
 
 
+# ── WebSocket: progress + audio on one connection ─────────────────
+def _ws_audio(path: Path, fmt: str) -> tuple[bytes, int]:
+    """Encoded payload of a finished beat and its sample rate."""
+    import soundfile as sf
+    from inference import to_opus, to_pcm16
+    audio, sr = sf.read(str(path), dtype="float32", always_2d=True)
+    audio = audio.mean(axis=1)
+    if fmt == "opus":
+        return to_opus(audio, sr), 48000
+    return to_pcm16(audio), sr
+
+
+@app.websocket("/ws/generate")
+async def ws_generate(ws: WebSocket):
+    """
+    Generation over one WebSocket, several at a time. Client → server:
+      {"type": "generate", "id": "a", "prompt": "...", "name": "Custom",
+       "seed": null, "duration": 10, "format": "pcm16" | "opus"}
+      {"type": "cancel", "id": "a"}
+    Server → client, per id (JSON text frames):
+      queued    {stream, task_id}               stream tags this id's binary frames
+      progress  {status, pct, tokens_done, …}   on every job change
+      audio     {stream, format, sample_rate, channels, bytes, filename, url, duration}
+      done      {stream, frames}                after the last binary frame
+      cancelled {detail}
+      error     {detail}
+    Binary frames are a 4-byte little-endian stream number + payload:
+    raw PCM16 mono, or one Ogg Opus file split across frames.
+    Closing the socket cancels every generation still running on it.
+    Pass ?token=<JWT> to be admitted and queued as the logged-in user.
+    """
+    import struct
+    await ws.accept()
+    if _model_state["state"] != "ready":
+        await ws.send_json({"type": "error", "id": None,
+                            "detail": f"Model is {_model_state['state']}, try again shortly",
+                            "retry_after": MODEL_RETRY_AFTER})
+        await ws.close(code=1013)
+        return
+
+    user, priority = _client(ws)
+    loop      = asyncio.get_running_loop()
+    send_lock = asyncio.Lock()              # one frame at a time from all generations
+    active: dict[str, asyncio.Task] = {}
+    task_ids: dict[str, str] = {}           # request id → _jobs id
+    next_stream = 0
+
+    async def send(msg):
+        async with send_lock:
+            if isinstance(msg, bytes):
+                await ws.send_bytes(msg)
+            else:
+                await ws.send_json(msg)
+
+    async def run(req_id: str, stream: int, msg: dict):
+        try:
+            fmt = msg.get("format", "pcm16")
+            if fmt not in ("pcm16", "opus"):
+                raise HTTPException(422, "format must be pcm16 or opus")
+            name   = msg.get("name") or "Custom"
+            prompt = msg.get("prompt") or MOOD_PROMPTS.get(name, "")
+            if not prompt:
+                raise HTTPException(400, "prompt or a known mood name is required")
+            tokens = _duration_tokens(msg.get("duration"))
+            try:
+                ticket = _admission.admit(tokens, user, priority)
+            except AdmissionRejected as e:
+                await send({"type": "error", "id": req_id, "detail": str(e),
+                            "retry_after": e.retry_after})
+                return
+            cancel = CancelToken()
+            try:
+                task_id = _jobs.submit(_tracked_job(prompt, name, msg.get("seed"), tokens,
+                                                    cancel, ticket),
+                                       cancel=cancel, url=None)
+                task_ids[req_id] = task_id
+            except JobQueueFull as e:
+                ticket.release()
+                raise HTTPException(503, f"Generation queue full ({e}), try again shortly")
+            await send({"type": "queued", "id": req_id, "stream": stream, "task_id": task_id})
+
+            changed = asyncio.Event()
+            unsubscribe = _jobs.subscribe(task_id, lambda: loop.call_soon_threadsafe(changed.set))
+            _jobs.watch(task_id)
+            try:
+                while True:
+                    changed.clear()
+                    info = _jobs.get(task_id) or {"status": "error", "error": "job expired"}
+                    if info["status"] == "cancelled":
+                        await send({"type": "cancelled", "id": req_id, "detail": info.get("error")})
+                        return
+                    if info["status"] == "error":
+                        raise HTTPException(500, info.get("error") or "Generation failed")
+                    if info["status"] == "done":
+                        break
+                    await send({"type": "progress", "id": req_id, **info})
+                    await changed.wait()
+            finally:
+                unsubscribe()
+                _jobs.unwatch(task_id)
+
+            path = OUTPUT_DIR / info["filename"]
+            payload, sr = await asyncio.to_thread(_ws_audio, path, fmt)
+            await send({"type": "audio", "id": req_id, "stream": stream, "format": fmt,
+                        "sample_rate": sr, "channels": 1, "bytes": len(payload),
+                        "filename": info["filename"], "url": info["url"],
+                        "duration": info["duration"], "cached": info["cached"]})
+            head, frames = struct.pack("<I", stream), 0
+            for i in range(0, len(payload), WS_FRAME_BYTES):
+                await send(head + payload[i:i + WS_FRAME_BYTES])
+                frames += 1
+            await send({"type": "done", "id": req_id, "stream": stream, "frames": frames})
+        except HTTPException as e:
+            await send({"type": "error", "id": req_id, "detail": e.detail})
+        except (WebSocketDisconnect, asyncio.CancelledError):
+            raise
+        except Exception as e:
+            await send({"type": "error", "id": req_id, "detail": str(e)})
+        finally:
+            active.pop(req_id, None)
+            task_ids.pop(req_id, None)
+
+    try:
+        while True:
+            try:
+                msg = json.loads(await ws.receive_text())
+                assert isinstance(msg, dict)
+            except (ValueError, AssertionError):
+                await send({"type": "error", "id": None, "detail": "messages must be JSON objects"})
+                continue
+            req_id = str(msg.get("id") or next_stream)
+            if msg.get("type") == "cancel":
+                if req_id in task_ids:
+                    await asyncio.to_thread(_jobs.cancel, task_ids[req_id], "cancelled by client")
+                else:
+                    await send({"type": "error", "id": req_id, "detail": "no active generation"})
+            elif msg.get("type") != "generate":
+                await send({"type": "error", "id": req_id,
+                            "detail": f"unknown message type {msg.get('type')!r}"})
+            elif req_id in active:
+                await send({"type": "error", "id": req_id, "detail": "id already in use"})
+            elif len(active) >= WS_MAX_ACTIVE:
+                await send({"type": "error", "id": req_id,
+                            "detail": f"{WS_MAX_ACTIVE} generations already active on this socket"})
+            else:
+                active[req_id] = asyncio.create_task(run(req_id, next_stream, msg))
+                next_stream += 1
+    except (WebSocketDisconnect, RuntimeError):
+        pass                              # client went away
+    finally:
+        for task_id in list(task_ids.values()):
+            _jobs.cancel(task_id, "client disconnected")
+        for task in list(active.values()):
+            task.cancel()
+
+
+# ═══════════════════════════════════════════════════════════════════
+# ADMIN — MODEL REGISTRY
+# ═══════════════════════════════════════════════════════════════════
+
+def _admin_token_ok(token: Optional[str]) -> bool:
+    """Fail closed: no ADMIN_TOKEN configured → nobody is an admin."""
+    return bool(ADMIN_TOKEN) and token is not None and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+def _require_admin(x_admin_token: Optional[str] = Header(default=None)):
+    if not _admin_token_ok(x_admin_token):
+        raise HTTPException(403, "Admin token required" if ADMIN_TOKEN
+                            else "Admin endpoints are disabled (ADMIN_TOKEN not set)")
+
+
+@app.get("/admin/models", dependencies=[Depends(_require_admin), Depends(_require_model)])
+def admin_models():
+    """Resident MusicGen variants, their memory and the RAM budget."""
+    return _registry.stats()
+
+
+@app.post("/admin/models/{name}/load", dependencies=[Depends(_require_admin), Depends(_require_model)])
+def admin_load_model(name: str):
+    """Load a variant ahead of time (may evict idle ones over budget)."""
+    if name not in _registry.variants:
+        raise HTTPException(404, f"Unknown model: {name}")
+    _registry.get(name)
+    return _registry.stats()
+
+
+@app.delete("/admin/models/{name}", dependencies=[Depends(_require_admin), Depends(_require_model)])
+def admin_unload_model(name: str):
+    """Unload an idle variant. The default model is pinned and can't be unloaded."""
+    if name not in _registry.variants:
+        raise HTTPException(404, f"Unknown model: {name}")
+    if not _registry.unload(name):
+        raise HTTPException(409, f"Model '{name}' is not loaded, pinned or in use")
+    return _registry.stats()
+
+
+@app.get("/admin/assets", dependencies=[Depends(_require_admin)])
+def admin_assets():
+    """Blob count and size, bytes saved by deduplication, GC totals."""
+    return {**_assets.stats(), "grace_sec": ASSET_GC_GRACE_SEC,
+            "interval_sec": ASSET_GC_INTERVAL_SEC}
+
+
+@app.post("/admin/assets/gc", dependencies=[Depends(_require_admin)])
+def admin_assets_gc(dry_run: bool = Query(True),
+                    grace_sec: Optional[float] = Query(None, ge=ASSET_GC_MIN_GRACE_SEC),
+                    db: Session = Depends(get_db)):
+    """Run the GC now. Defaults to a dry run that only lists what would go.
+    grace_sec can't go below ASSET_GC_MIN_GRACE_SEC, so beats still being
+    fetched right after generation are never collected."""
+    return _assets.collect(db, ASSET_GC_GRACE_SEC if grace_sec is None else grace_sec,
+                           dry_run=dry_run)
+
+
+def _asset_gc_loop():
+    """Every ASSET_GC_INTERVAL_SEC: drop outputs no Commit / Stem references."""
+    from database import SessionLocal
+    while True:
+        time.sleep(ASSET_GC_INTERVAL_SEC)
+        db = SessionLocal()
+        try:
+            r = _assets.collect(db, ASSET_GC_GRACE_SEC)
+            if r["files"] or r["blobs"]:
+                print(f"[OK] Asset GC: {len(r['files'])} files, {len(r['blobs'])} blobs, "
+                      f"{r['bytes_freed'] / 1e6:.1f} MB freed")
+        except Exception as e:
+            print(f"[!] Asset GC failed: {e}")
+        finally:
+            db.close()
+
+
 # ── Run ───────────────────────────────────────────────────────────
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info")
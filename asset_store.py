@@ -0,0 +1,255 @@
+"""
+asset_store.py — Content-addressed audio assets with reference-counted GC
+==========================================================================
+Blob = <root>/<sha[:2]>/<sha[2:4]>/<sha256><suffix>
+
+Generated and uploaded files are interned: their bytes are hashed and
+stored once as a blob, and the file in beat_outputs/ (stems_outputs/, …)
+becomes a hard link to it. Identical content — cache hits, shared
+single-flight results, the same upload sent twice — costs disk once,
+whatever name it is served under. The store must sit on the same
+filesystem as the output directories (a copy would not be deduplicated).
+
+Because deduplicated names share one inode, nothing may write through
+them: audio_writer / save_codes replace files atomically instead. For
+the same reason a name's GC grace period starts when it was interned, as
+recorded in <root>/names.sqlite, not at the shared inode's mtime.
+
+  output_name(prefix)        unique file name for a new output
+                             (time + random suffix: no same-second clashes)
+  intern(path)               → sha256; path now links to its blob
+  put_upload(fileobj, ext, dest_dir)
+                             uploads are named by content
+                             (upload_<sha[:16]><ext>): re-uploading a file
+                             returns the existing name and URL
+  refcounts(db)              file → number of Commit.audio_url /
+                             Stem.audio_url rows pointing at it
+  collect(db, grace_sec)     delete generated files no row references that
+                             are older than the grace period (with their
+                             .codes.npy / .flac / .opus siblings), then the
+                             blobs nothing links to any more
+"""
+
+from __future__ import annotations
+import hashlib, os, sqlite3, threading, time, uuid
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+HASH_BLOCK = 1 << 20                        # bytes per read while hashing
+
+
+def output_name(prefix: str, suffix: str = ".wav") -> str:
+    """<prefix>_<HHMMSS>_<6 hex><suffix> — unique even within one second."""
+    return f"{prefix}_{datetime.now().strftime('%H%M%S')}_{uuid.uuid4().hex[:6]}{suffix}"
+
+
+def file_digest(path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class AssetStore:
+    """
+    Sharded blob store + GC over the served output directories.
+    `mounts` maps URL prefixes to directories ({"/audio": OUTPUT_DIR, …}) so
+    DB audio_urls can be resolved to files; `scratch` directories (e.g.
+    upload_tmp/) hold nothing referable and are only swept by collect().
+    """
+
+    def __init__(self, root: Path | str, mounts: dict, scratch=()):
+        self.root    = Path(root)
+        self.mounts  = {prefix.rstrip("/"): Path(d) for prefix, d in mounts.items()}
+        self.scratch = [Path(d) for d in scratch]
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._names = self.root / "names.sqlite"     # name → interned_at (GC grace)
+        with self._db() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS names (path TEXT PRIMARY KEY, "
+                       "interned_at REAL NOT NULL)")
+        self._lock  = threading.Lock()
+        self._stats = {"interned": 0, "deduplicated": 0, "bytes_saved": 0,
+                       "collections": 0, "files_removed": 0, "blobs_removed": 0,
+                       "bytes_freed": 0}
+
+    # ── Public API ────────────────────────────────────────────────
+    def blob_path(self, digest: str, suffix: str = "") -> Path:
+        return self.root / digest[:2] / digest[2:4] / f"{digest}{suffix}"
+
+    def intern(self, path) -> str:
+        """Store path's bytes as a blob (once) and make path a link to it."""
+        path   = Path(path)
+        digest = file_digest(path)
+        blob   = self.blob_path(digest, path.suffix)
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        self._record(path)                      # its grace period starts now
+        with self._lock:
+            self._stats["interned"] += 1
+            if not blob.exists():
+                try:
+                    os.link(path, blob)
+                except FileExistsError:
+                    pass                        # another process stored it meanwhile
+                except OSError:
+                    return digest               # other filesystem: nothing to share
+                else:
+                    return digest
+            if os.path.samefile(path, blob):     # already linked (cache hit, shared run)
+                return digest
+            size = path.stat().st_size
+            tmp  = path.with_name(f".intern-{uuid.uuid4().hex[:8]}{path.suffix}")
+            try:
+                os.link(blob, tmp)
+                os.replace(tmp, path)           # path → existing blob; its copy is freed
+            except OSError:
+                tmp.unlink(missing_ok=True)
+                return digest
+            self._stats["deduplicated"] += 1
+            self._stats["bytes_saved"]  += size
+        return digest
+
+    def put_upload(self, fileobj, ext: str, dest_dir: Path | str) -> tuple[Path, str, bool]:
+        """
+        Stream an upload to disk while hashing it. Returns (path, sha256,
+        duplicate): the file is dest_dir/upload_<sha[:16]><ext>, and a
+        duplicate of an earlier upload is not stored again.
+        """
+        dest_dir = Path(dest_dir)
+        h   = hashlib.sha256()
+        tmp = dest_dir / f".upload-{uuid.uuid4().hex}{ext}"
+        try:
+            with open(tmp, "wb") as out:
+                for block in iter(lambda: fileobj.read(HASH_BLOCK), b""):
+                    h.update(block)
+                    out.write(block)
+            digest = h.hexdigest()
+            dest   = dest_dir / f"upload_{digest[:16]}{ext}"
+            if dest.exists():
+                self._record(dest)              # re-uploaded: restart its grace period
+                return dest, digest, True
+            os.replace(tmp, dest)
+        finally:
+            tmp.unlink(missing_ok=True)
+        self.intern(dest)
+        return dest, digest, False
+
+    def resolve(self, url: str | None) -> Path | None:
+        """/audio/x.wav → beat_outputs/x.wav (None for other URLs)."""
+        if not url:
+            return None
+        for prefix, directory in self.mounts.items():
+            if url.startswith(prefix + "/"):
+                return directory / url[len(prefix) + 1:]
+        return None
+
+    def refcounts(self, db) -> Counter:
+        """Resolved file → number of Commit / Stem rows whose audio_url is it."""
+        from models import Commit, Stem
+        counts = Counter()
+        for (url,) in db.query(Commit.audio_url).union_all(db.query(Stem.audio_url)):
+            path = self.resolve(url)
+            if path is not None:
+                counts[os.path.normpath(path)] += 1
+        return counts
+
+    def collect(self, db, grace_sec: float, dry_run: bool = False) -> dict:
+        """
+        Remove unreferenced generated files older than grace_sec from the
+        mounted and scratch directories, then every blob no file links to.
+        A file's age runs from when it was last written or interned under
+        its name, whichever is later. A referenced file keeps its siblings
+        (x.wav → x.codes.npy, x.flac, …), and siblings age together: the
+        youngest counts for all.
+        Returns what was (or, dry_run, would be) removed.
+        """
+        refs   = self.refcounts(db)
+        keep   = {(os.path.dirname(p), os.path.basename(p).split(".")[0]) for p in refs}
+        cutoff = time.time() - grace_sec
+        born   = self._recorded()
+        groups: dict = {}                       # (dir, stem) → [(path, stat)]
+        for directory in [*self.mounts.values(), *self.scratch]:
+            for path in sorted(directory.rglob("*")):
+                if not path.is_file() or path.is_symlink():
+                    continue
+                key = (os.path.normpath(path.parent), path.name.split(".")[0])
+                groups.setdefault(key, []).append((path, path.stat()))
+        files, freed = [], 0
+        for key, members in groups.items():
+            age_from = max(max(born.get(os.path.abspath(path), 0.0), st.st_mtime)
+                           for path, st in members)
+            if key in keep or age_from > cutoff:
+                continue
+            for path, st in members:
+                files.append(str(path))
+                if st.st_nlink == 1:            # last name of these bytes
+                    freed += st.st_size
+                if not dry_run:
+                    path.unlink(missing_ok=True)
+        if not dry_run:
+            for directory in [*self.mounts.values(), *self.scratch]:
+                self._prune_dirs(directory)
+            self._forget([p for p in born if not os.path.exists(p)])
+
+        blobs = []
+        for blob in self.root.glob("??/??/*"):
+            st = blob.stat()
+            if st.st_nlink == 1:                # no file links to it any more
+                blobs.append(str(blob))
+                freed += st.st_size
+                if not dry_run:
+                    blob.unlink(missing_ok=True)
+        if not dry_run:
+            self._prune_dirs(self.root)
+            with self._lock:
+                self._stats["collections"]   += 1
+                self._stats["files_removed"] += len(files)
+                self._stats["blobs_removed"] += len(blobs)
+                self._stats["bytes_freed"]   += freed
+        return {"files": files, "blobs": blobs, "bytes_freed": freed,
+                "referenced": len(refs), "dry_run": dry_run}
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+        blobs = list(self.root.glob("??/??/*"))
+        s["blobs"]      = len(blobs)
+        s["blob_bytes"] = sum(b.stat().st_size for b in blobs)
+        return s
+
+    # ── Internals ─────────────────────────────────────────────────
+    @contextmanager
+    def _db(self):
+        """A short-lived connection, committed and closed on exit (API threads
+        and Celery workers share the file)."""
+        db = sqlite3.connect(self._names, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _record(self, path):
+        with self._db() as db:
+            db.execute("INSERT OR REPLACE INTO names VALUES (?, ?)",
+                       (os.path.abspath(path), time.time()))
+
+    def _recorded(self) -> dict:
+        with self._db() as db:
+            return dict(db.execute("SELECT path, interned_at FROM names"))
+
+    def _forget(self, paths):
+        with self._db() as db:
+            db.executemany("DELETE FROM names WHERE path = ?", [(p,) for p in paths])
+
+    @staticmethod
+    def _prune_dirs(root: Path):
+        """Drop directories emptied by collect() (stem track dirs, shards)."""
+        for directory in sorted((d for d in root.rglob("*") if d.is_dir()),
+                                key=lambda d: len(d.parts), reverse=True):
+            try:
+                directory.rmdir()
+            except OSError:
+                pass
@@ -5,18 +5,22 @@ All AI audio processing modules:
   - Phase 2A: DEMUCS  — stem separation (drums, bass, vocals, other)
   - Phase 2B: LIBROSA — BPM, key, energy, waveform analysis
   - Phase 2C: Melody Conditioning — hum/audio → music (MusicGen Melody)
-  - Phase 3A: Audio Continuation  — extend a beat using MusicGen
+  - Phase 3A: Audio Continuation  — extend a beat using MusicGen,
+                                    long-form tracks as windowed continuation
   - Phase 3B: AI Mastering        — matchering (loudness normalization)
 """
 
 from __future__ import annotations
 import io, re, time
 from pathlib import Path
-from datetime import datetime
 import numpy as np
 import torch
 import soundfile as sf
 
+from asset_store import output_name
+from audio_writer import AUDIO_WRITE_BLOCK, open_audio, write_audio
+from model_loader import autocast
+
 OUTPUT_DIR  = Path("beat_outputs")
 STEMS_DIR   = Path("stems_outputs")
 MASTER_DIR  = Path("mastered_outputs")
@@ -39,8 +43,7 @@ def separate_stems(audio_path: str) -> dict[str, str]:
     import sys, subprocess
 
     audio_path = Path(audio_path).resolve()   # absolute path — critical!
-    ts        = datetime.now().strftime("%H%M%S")
-    stem_base = STEMS_DIR.resolve() / f"{audio_path.stem}_{ts}"
+    stem_base = STEMS_DIR.resolve() / output_name(audio_path.stem, "")
     stem_base.mkdir(parents=True, exist_ok=True)
 
     # Use run_demucs.py wrapper which patches torchaudio.load/save with
@@ -130,28 +133,11 @@ def analyze_audio(audio_path: str) -> dict:
 # PHASE 2C — MELODY CONDITIONING  (Hum → Beat)
 # ═══════════════════════════════════════════════════════════════════
 
-_melody_processor = None
-_melody_model     = None
-
-def _load_melody_model(device: str, dtype: torch.dtype):
-    global _melody_processor, _melody_model
-    if _melody_model is not None:
-        return _melody_processor, _melody_model
-
-    from transformers import AutoProcessor, MusicgenMelodyForConditionalGeneration
-    print("[..] Loading MusicGen-Melody model...")
-    _melody_processor = AutoProcessor.from_pretrained("facebook/musicgen-melody")
-    _melody_model     = MusicgenMelodyForConditionalGeneration.from_pretrained(
-        "facebook/musicgen-melody", torch_dtype=dtype
-    ).to(device)
-    _melody_model.eval()
-    print(f"[OK] MusicGen-Melody ready on {device}")
-    return _melody_processor, _melody_model
-
-
 def hum_to_beat(
     audio_path: str,
     prompt: str,
+    processor,          # MusicGen-Melody processor (from api_server's model registry)
+    model,              # MusicGen-Melody model
     device: str,
     dtype: torch.dtype,
     max_new_tokens: int = 1500,   # ~30 seconds
@@ -161,8 +147,6 @@ def hum_to_beat(
     """
     import librosa
 
-    processor, model = _load_melody_model(device, dtype)
-
     # Load and resample to 32kHz as float32 numpy — processor MUST receive numpy, not tensor
     y, sr = librosa.load(audio_path, sr=32000, mono=True)
     y = y.astype(np.float32)   # ensure float32
@@ -179,7 +163,7 @@ def hum_to_beat(
     inputs = {k: v.to(device) for k, v in inputs.items()}
 
     with torch.inference_mode():
-        with torch.autocast(device_type=device, dtype=dtype, enabled=(device == "cuda")):
+        with autocast(device, dtype):
             output = model.generate(
                 **inputs,
                 max_new_tokens=max_new_tokens,
@@ -192,9 +176,8 @@ def hum_to_beat(
     sample_rate = model.config.audio_encoder.sampling_rate
     duration    = len(audio_np) / sample_rate
 
-    ts       = datetime.now().strftime("%H%M%S")
-    out_path = OUTPUT_DIR / f"hum_to_beat_{ts}.wav"
-    sf.write(str(out_path), audio_np, sample_rate)
+    out_path = OUTPUT_DIR / output_name("hum_to_beat")
+    write_audio(out_path, audio_np, sample_rate)
     return out_path, duration
 
 
@@ -202,6 +185,53 @@ def hum_to_beat(
 # PHASE 3A — AUDIO CONTINUATION  (Extend a Beat)
 # ═══════════════════════════════════════════════════════════════════
 
+def continue_codes(
+    prompt: str,
+    processor,
+    model,
+    device: str,
+    dtype: torch.dtype,
+    max_new_tokens: int,
+    codes: np.ndarray | None = None,
+    audio: np.ndarray | None = None,
+    logits_processor=None,
+    stopping_criteria=(),
+) -> tuple[np.ndarray, np.ndarray, int]:
+    """
+    One MusicGen continuation step, prompted by EnCodec `codes`
+    [codebooks, frames] (used as decoder_input_ids, nothing re-encoded), by
+    32 kHz mono `audio` (run through the audio encoder) or by text only.
+    Returns (audio of prompt + new frames, their codes, prompt frames).
+    """
+    from transformers import StoppingCriteriaList
+    from inference import CodesRecorder
+
+    if audio is not None:
+        inputs = processor(
+            audio=torch.from_numpy(audio[np.newaxis, np.newaxis, :]).to(device),  # [1,1,samples]
+            sampling_rate=32000,
+            text=[prompt],
+            padding=True,
+            return_tensors="pt",
+        ).to(device)
+    else:
+        inputs = processor(text=[prompt], padding=True, return_tensors="pt").to(device)
+        if codes is not None:
+            inputs["decoder_input_ids"] = torch.from_numpy(codes.astype(np.int64)).to(device)
+
+    recorder = CodesRecorder(model.decoder.num_codebooks)
+    with torch.inference_mode():
+        with autocast(device, dtype):
+            output = model.generate(**inputs, max_new_tokens=max_new_tokens,
+                                    logits_processor=logits_processor,
+                                    stopping_criteria=StoppingCriteriaList(
+                                        [*stopping_criteria, recorder]))
+
+    out_codes     = recorder.codes()
+    prompt_frames = out_codes.shape[1] - max(max_new_tokens - model.decoder.num_codebooks + 1, 0)
+    return output[0, 0].cpu().float().numpy(), out_codes, prompt_frames
+
+
 def continue_beat(
     audio_path: str,
     prompt: str,
@@ -210,36 +240,179 @@ def continue_beat(
     device: str,
     dtype: torch.dtype,
     max_new_tokens: int = 512,
+    context_sec: float | None = None,
+    stitch: bool = True,
 ) -> tuple[Path, float]:
     """
     Continues an existing beat using MusicGen audio continuation.
+    When the beat's EnCodec codes were stored next to it (<name>.codes.npy)
+    they are the decoder prompt as-is; otherwise the WAV is loaded,
+    resampled to 32 kHz and run through the audio encoder.
+
+    Only the last `context_sec` seconds condition the model (None → the
+    whole beat), so an extension costs the same however long the track
+    has grown. With `stitch` the output is the input beat with the new
+    audio appended (copied block by block, nothing re-encoded); without
+    it, just the new audio. The output's codes are stored next to it.
     """
-    import librosa
-
-    # Load audio, resample to MusicGen's expected 32kHz
-    y, sr = librosa.load(audio_path, sr=32000, mono=True)
-    audio_array = y[np.newaxis, np.newaxis, :]  # [1,1,samples]
-
-    inputs = processor(
-        audio=torch.from_numpy(audio_array).to(device),
-        sampling_rate=32000,
-        text=[prompt],
-        padding=True,
-        return_tensors="pt",
-    ).to(device)
-
-    with torch.inference_mode():
-        with torch.autocast(device_type=device, dtype=dtype, enabled=(device == "cuda")):
-            output = model.generate(**inputs, max_new_tokens=max_new_tokens)
-
-    audio_np    = output[0, 0].cpu().float().numpy()
-    sample_rate = model.config.audio_encoder.sampling_rate
-    duration    = len(audio_np) / sample_rate
-
-    ts       = datetime.now().strftime("%H%M%S")
-    out_path = OUTPUT_DIR / f"continued_{Path(audio_path).stem}_{ts}.wav"
-    sf.write(str(out_path), audio_np, sample_rate)
-    return out_path, duration
+    from inference import load_codes, save_codes
+
+    num_codebooks = model.decoder.num_codebooks
+    sample_rate   = model.config.audio_encoder.sampling_rate
+    frame_rate    = model.config.audio_encoder.frame_rate
+    window        = None if context_sec is None else max(1, int(context_sec * frame_rate))
+
+    codes = load_codes(audio_path, num_codebooks)
+    if codes is not None:
+        prompt_codes = codes if window is None else codes[:, -window:]
+        audio_np, out_codes, prompt_frames = continue_codes(
+            prompt, processor, model, device, dtype, max_new_tokens, codes=prompt_codes)
+        whole = prompt_codes.shape[1] == codes.shape[1]
+    else:
+        import librosa
+
+        # Load (the tail of) the audio, resample to MusicGen's expected 32kHz
+        total  = sf.info(audio_path).duration
+        offset = 0.0 if window is None else max(0.0, total - window / frame_rate)
+        y, sr  = librosa.load(audio_path, sr=32000, mono=True, offset=offset)
+        audio_np, out_codes, prompt_frames = continue_codes(
+            prompt, processor, model, device, dtype, max_new_tokens, audio=y)
+        whole = offset == 0.0
+
+    # output = prompt window + new audio; keep the new frames only
+    hop       = int(np.prod(model.config.audio_encoder.upsampling_ratios))
+    new_audio = audio_np[prompt_frames * hop:]
+    new_codes = out_codes[:, prompt_frames:]
+
+    out_path = OUTPUT_DIR / output_name(f"continued_{Path(audio_path).stem}")
+    if not stitch:
+        write_audio(out_path, new_audio, sample_rate)
+        save_codes(out_path, new_codes)
+        return out_path, len(new_audio) / sample_rate
+
+    written = append_audio(audio_path, new_audio, out_path, sample_rate)
+    if codes is not None:
+        save_codes(out_path, np.concatenate([codes, new_codes], axis=1))
+    elif whole:                                # the prompt was the whole beat
+        save_codes(out_path, out_codes)
+    return out_path, written / sample_rate
+
+
+def append_audio(src_path: str, new_audio: np.ndarray, out_path: Path,
+                 sample_rate: int, block: int = AUDIO_WRITE_BLOCK) -> int:
+    """Write src's samples followed by new_audio to out_path, streaming src in
+    blocks (memory stays flat for long tracks). Returns samples written."""
+    info = sf.info(src_path)
+    with open_audio(out_path, sample_rate) as out:
+        if info.samplerate == sample_rate and info.channels == 1:
+            for chunk in sf.blocks(src_path, blocksize=block, dtype="float32"):
+                out.write(chunk)
+        else:                                  # e.g. an uploaded 44.1 kHz stereo file
+            import librosa
+            out.write(librosa.load(src_path, sr=sample_rate, mono=True)[0])
+        out.write(new_audio)
+        return out.frames
+
+
+def generate_long(
+    prompt: str,
+    processor,
+    model,
+    device: str,
+    dtype: torch.dtype,
+    duration_sec: float,
+    window_sec: float = 20.0,
+    context_sec: float = 10.0,
+    crossfade_sec: float = 0.25,
+    seed: int | None = None,
+    out_path: Path | None = None,
+    run_window=None,
+    on_window=None,
+    cancel=None,
+) -> tuple[Path, float, list[dict]]:
+    """
+    Long-form generation (minutes) as a chain of fixed-size continue_codes
+    windows: the first from text alone, each next one prompted by the last
+    `context_sec` of codes and adding window_sec - context_sec of new audio,
+    so every window costs the same however long the track gets.
+
+    Audio is streamed to out_path as windows finish (memory stays flat);
+    the last `crossfade_sec` written so far is held back and crossfaded
+    with the next window's decode of the same frames, hiding the EnCodec
+    seam. The whole track's codes are saved next to it.
+
+    run_window(fn) runs one window (e.g. on BatchScheduler.call, so other
+    requests get in between windows); on_window(dict) gets each window's
+    timing; `cancel` (CancelToken) stops between and within windows.
+    Returns (path, duration_seconds, per-window timings).
+    """
+    from transformers import LogitsProcessorList
+    from inference import CancelCriteria, SeededSampler, save_codes
+
+    num_codebooks = model.decoder.num_codebooks
+    sample_rate   = model.config.audio_encoder.sampling_rate
+    frame_rate    = model.config.audio_encoder.frame_rate
+    hop           = int(np.prod(model.config.audio_encoder.upsampling_ratios))
+    window_frames = max(2, int(window_sec * frame_rate))
+    context       = min(max(1, int(context_sec * frame_rate)), window_frames - 1)
+    total_frames  = int(duration_sec * frame_rate)
+    fade          = min(int(crossfade_sec * sample_rate), context * hop)  # ≤ the prompt's audio
+    run_window    = run_window or (lambda fn: fn())
+
+    if out_path is None:
+        out_path = OUTPUT_DIR / output_name("long")
+
+    codes: np.ndarray | None = None          # every frame so far (≈ 0.4 KB/s)
+    held  = np.zeros(0, dtype=np.float32)    # written audio held back for the crossfade
+    timings, index = [], 0
+    with open_audio(out_path, sample_rate) as out:
+        while codes is None or codes.shape[1] < total_frames:
+            if cancel is not None:
+                cancel.raise_if_cancelled()
+            done       = 0 if codes is None else codes.shape[1]
+            prompt_cds = None if codes is None else codes[:, -context:]
+            new_frames = min(total_frames - done,
+                             window_frames - (0 if prompt_cds is None else prompt_cds.shape[1]))
+            sampler    = (LogitsProcessorList([SeededSampler(model, [seed + index], device)])
+                          if seed is not None else None)
+            criteria   = [CancelCriteria([cancel])] if cancel is not None else []
+
+            t0 = time.time()
+            audio, out_codes, prompt_frames = run_window(lambda: continue_codes(
+                prompt, processor, model, device, dtype, new_frames + num_codebooks - 1,
+                codes=prompt_cds, logits_processor=sampler, stopping_criteria=criteria))
+            gen_sec = time.time() - t0
+
+            t1 = time.time()
+            start = prompt_frames * hop
+            if len(held):                      # crossfade the seam over the held-back tail
+                overlap = audio[start - len(held):start]
+                ramp    = np.linspace(0.0, 1.0, len(held), dtype=np.float32)
+                out.write(held * (1.0 - ramp) + overlap * ramp)
+            new_audio = audio[start:]
+            keep      = min(fade, len(new_audio))
+            out.write(new_audio[:len(new_audio) - keep])
+            held      = new_audio[len(new_audio) - keep:]
+            new_codes = out_codes[:, prompt_frames:]
+            codes     = new_codes if codes is None else np.concatenate([codes, new_codes], axis=1)
+
+            timing = {
+                "window":      index,
+                "new_sec":     round(new_codes.shape[1] / frame_rate, 2),
+                "context_sec": round(prompt_frames / frame_rate, 2),
+                "gen_sec":     round(gen_sec, 2),
+                "write_sec":   round(time.time() - t1, 3),
+                "total_sec":   round(codes.shape[1] / frame_rate, 2),
+                "target_sec":  round(total_frames / frame_rate, 2),
+            }
+            timings.append(timing)
+            if on_window is not None:
+                on_window(timing)
+            index += 1
+        out.write(held)
+        written = out.frames
+    save_codes(out_path, codes)
+    return out_path, written / sample_rate, timings
 
 
 # ═══════════════════════════════════════════════════════════════════
@@ -259,8 +432,7 @@ def master_audio(target_path: str, reference_path: str | None = None) -> tuple[P
     import pyloudnorm as pyln
 
     target = Path(target_path)
-    ts     = datetime.now().strftime("%H%M%S")
-    output = MASTER_DIR / f"mastered_{target.stem}_{ts}.wav"
+    output = MASTER_DIR / output_name(f"mastered_{target.stem}")
 
     # Load audio
     audio, sr = librosa.load(str(target), sr=None, mono=False)
@@ -284,7 +456,7 @@ def master_audio(target_path: str, reference_path: str | None = None) -> tuple[P
         audio_norm = audio_norm * (ceiling_linear / peak)
 
     # ── 4. Write output ───────────────────────────────────────────
-    sf.write(str(output), audio_norm.astype(np.float32), sr, subtype="PCM_16")
+    write_audio(output, audio_norm, sr)
 
     # Measure final loudness for the response
     final_loudness = meter.integrated_loudness(audio_norm)
@@ -312,5 +484,5 @@ def _make_builtin_reference() -> Path:   # kept for backward compat, no longer u
         0.05 * np.random.randn(len(t))           # high end noise
     )
     audio = audio / np.abs(audio).max() * 0.85
-    sf.write(str(BUILTIN_REFERENCE), audio.astype(np.float32), sr)
+    write_audio(BUILTIN_REFERENCE, audio, sr)
     return BUILTIN_REFERENCE
@@ -0,0 +1,168 @@
+"""
+audio_writer.py — The one way audio files get written
+======================================================
+Every generated / processed file (api_server /generate, hum_to_beat,
+continue_beat, master_audio, Celery generate_beat_task) goes through
+write_audio(): it streams the numpy buffer straight into libsndfile in
+blocks of AUDIO_WRITE_BLOCK frames — no tensor round-trip, no in-memory
+WAV, no full-size clipped copy (each block is clipped into one reusable
+scratch buffer).
+
+  ENCODINGS                  pcm16 → .wav (16-bit PCM), flac → .flac,
+                             opus → .opus (Ogg Opus, resampled to 48 kHz)
+  write_audio(path, audio)   synchronous write, returns the path used
+  open_audio(path, sr)       an open SoundFile for incremental writers
+                             (append_audio, generate_long, /generate/stream)
+  encode_async(wav, encs)    compressed copies next to a finished WAV on a
+                             background encoder thread, off the request path
+
+Every file appears atomically: it is written under a temporary name and
+renamed over `path` once complete. An existing `path` is replaced, never
+written through — it may be a hard link into the asset store, shared with
+other names (see asset_store.py).
+
+The WAV stays the primary file: /continue, the codes sidecar and the
+generation cache all key on it.
+"""
+
+from __future__ import annotations
+import math, os, threading, time, uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+# Frames per write / read block (64 Ki frames ≈ 2 s at 32 kHz)
+AUDIO_WRITE_BLOCK    = int(os.getenv("AUDIO_WRITE_BLOCK", "65536"))
+# Background threads for FLAC / Opus encodes
+AUDIO_ENCODE_WORKERS = int(os.getenv("AUDIO_ENCODE_WORKERS", "1"))
+# Opus bitrate-quality in libsndfile terms: 0.0 (best) … 1.0 (smallest)
+OPUS_COMPRESSION     = float(os.getenv("OPUS_COMPRESSION", "0.3"))
+
+OPUS_SAMPLE_RATE = 48000                   # Opus only takes 8/12/16/24/48 kHz
+
+# encoding → (suffix, libsndfile format, subtype)
+ENCODINGS: dict[str, tuple[str, str, str]] = {
+    "pcm16": (".wav",  "WAV",  "PCM_16"),
+    "flac":  (".flac", "FLAC", "PCM_16"),
+    "opus":  (".opus", "OGG",  "OPUS"),
+}
+COMPRESSED = ("flac", "opus")
+
+
+def encoded_path(path, encoding: str) -> Path:
+    """Where `encoding` of the file at `path` lives (same stem, its own suffix)."""
+    return Path(path).with_suffix(ENCODINGS[encoding][0])
+
+
+def temp_path(path) -> Path:
+    """A unique hidden sibling of `path` (same suffix) to write before os.replace."""
+    path = Path(path)
+    return path.with_name(f".part-{uuid.uuid4().hex[:8]}-{path.name}")
+
+
+@contextmanager
+def open_audio(path, sample_rate: int, channels: int = 1, encoding: str = "pcm16"):
+    """
+    Context manager: a SoundFile open for writing in `encoding`. It writes a
+    temporary file that replaces `path` when the block exits cleanly; on an
+    exception (or a closed generator) `path` is left as it was.
+    """
+    _, fmt, subtype = ENCODINGS[encoding]
+    path = Path(path)
+    tmp  = temp_path(path)
+    try:
+        with sf.SoundFile(str(tmp), "w", int(sample_rate), channels, subtype=subtype,
+                          format=fmt,
+                          compression_level=OPUS_COMPRESSION if encoding == "opus" else None) as f:
+            yield f
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def write_audio(path, audio: np.ndarray, sample_rate: int, encoding: str = "pcm16",
+                block: int = AUDIO_WRITE_BLOCK) -> Path:
+    """
+    Write float audio ([samples] or [samples, channels]) to `path`, whose
+    suffix is replaced by the encoding's. Blocks are views into `audio`,
+    clipped to [-1, 1] into one scratch buffer before libsndfile converts
+    them. Opus is resampled to 48 kHz first.
+    """
+    path = encoded_path(path, encoding)
+    if encoding == "opus" and sample_rate != OPUS_SAMPLE_RATE:
+        audio, sample_rate = _resample(audio, sample_rate, OPUS_SAMPLE_RATE), OPUS_SAMPLE_RATE
+    channels = 1 if audio.ndim == 1 else audio.shape[1]
+    scratch  = np.empty((min(block, len(audio)),) + audio.shape[1:], dtype=np.float32)
+    with open_audio(path, sample_rate, channels, encoding) as f:
+        for start in range(0, len(audio), block):
+            chunk = audio[start:start + block]
+            f.write(np.clip(chunk, -1.0, 1.0, out=scratch[:len(chunk)]))
+    return path
+
+
+def encode_async(wav_path, encodings) -> dict[str, Future]:
+    """
+    Queue compressed copies (flac / opus) of a finished WAV on the
+    background encoder. Returns encoding → Future of the written path;
+    the file is renamed into place only once fully encoded.
+    """
+    return {enc: _encoder().submit(_encode, Path(wav_path), enc)
+            for enc in dict.fromkeys(encodings) if enc in COMPRESSED}
+
+
+def stats() -> dict:
+    with _lock:
+        s = dict(_stats)
+    s["busy_sec"] = round(s["busy_sec"], 1)
+    s["workers"]  = AUDIO_ENCODE_WORKERS
+    return s
+
+
+# ── Internals ─────────────────────────────────────────────────────
+_lock  = threading.Lock()
+_pool: ThreadPoolExecutor | None = None
+_stats = {"queued": 0, "encoded": 0, "errors": 0, "busy_sec": 0.0}
+
+
+def _encoder() -> ThreadPoolExecutor:
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max(1, AUDIO_ENCODE_WORKERS),
+                                       thread_name_prefix="audio-encode")
+        _stats["queued"] += 1
+    return _pool
+
+
+def _resample(audio: np.ndarray, sr_in: int, sr_out: int) -> np.ndarray:
+    from scipy.signal import resample_poly
+    g = math.gcd(int(sr_in), int(sr_out))
+    return resample_poly(audio, sr_out // g, int(sr_in) // g, axis=0).astype(np.float32)
+
+
+def _encode(wav_path: Path, encoding: str) -> Path:
+    with _lock:
+        _stats["queued"] -= 1
+    t0  = time.monotonic()
+    out = encoded_path(wav_path, encoding)
+    try:
+        if encoding == "opus":         # resampling needs the whole signal
+            audio, sr = sf.read(str(wav_path), dtype="float32")
+            write_audio(out, audio, sr, "opus")
+        else:
+            info = sf.info(str(wav_path))
+            with open_audio(out, info.samplerate, info.channels, encoding) as f:
+                for chunk in sf.blocks(str(wav_path), blocksize=AUDIO_WRITE_BLOCK,
+                                       dtype="float32"):
+                    f.write(chunk)
+    except BaseException:
+        with _lock:
+            _stats["errors"] += 1
+        raise
+    with _lock:
+        _stats["encoded"]  += 1
+        _stats["busy_sec"] += time.monotonic() - t0
+    return out
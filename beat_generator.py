@@ -10,6 +10,8 @@ import time
 from pathlib import Path
 from datetime import datetime
 
+from inference import duration_to_tokens
+
 MOODS = {
     "1":  ("EDM / Club Banger",         "energetic EDM beat with heavy bass drops, synthesizers, and pulsing drums at 128 bpm, club music"),
     "2":  ("Trap / Hip-Hop",            "dark trap beat with 808 bass, hi-hats, and atmospheric pads, hip hop production, 140 bpm"),
@@ -38,7 +40,8 @@ MOODS = {
     "25": ("Custom Prompt",             None),
 }
 
-DURATION_TOKENS = 512
+DURATION_TOKENS = 512          # ~10 seconds, used when no duration is entered
+MAX_DURATION_SEC = 30
 OUTPUT_DIR = Path("beat_outputs")
 OUTPUT_DIR.mkdir(exist_ok=True)
 
@@ -95,12 +98,25 @@ def load_model():
     print("  [OK] Model ready!\n")
     return processor, model, device
 
-def generate(processor, model, device, prompt, label):
+def ask_duration():
+    raw = input(f"  Duration in seconds [Enter = 10, max {MAX_DURATION_SEC}]: ").strip()
+    try:
+        seconds = float(raw) if raw else None
+    except ValueError:
+        seconds = None
+    if seconds is not None and not 0 < seconds <= MAX_DURATION_SEC:
+        print(f"  [!] Out of range, using 10s")
+        seconds = None
+    return seconds
+
+def generate(processor, model, device, prompt, label, seconds=None):
     inputs = processor(text=[prompt], padding=True, return_tensors="pt").to(device)
-    print(f"\n  [..] Generating ~10s beat (takes ~60-120s on CPU) ...")
+    tokens = DURATION_TOKENS if seconds is None else duration_to_tokens(seconds, model)
+    secs   = seconds or 10
+    print(f"\n  [..] Generating ~{secs:g}s beat (takes ~{6 * secs:.0f}-{12 * secs:.0f}s on CPU) ...")
     t0 = time.time()
     with torch.no_grad():
-        audio_values = model.generate(**inputs, max_new_tokens=DURATION_TOKENS)
+        audio_values = model.generate(**inputs, max_new_tokens=tokens)
     elapsed = time.time() - t0
     sampling_rate = model.config.audio_encoder.sampling_rate
     duration = audio_values.shape[-1] / sampling_rate
@@ -141,8 +157,9 @@ def main():
             label = "custom"
         print(f"\n  [MOOD]   {label}")
         print(f"  [PROMPT] {prompt}")
+        seconds = ask_duration()
         try:
-            generate(processor, model, device, prompt, label)
+            generate(processor, model, device, prompt, label, seconds)
             print("\n  Press Enter for another beat, or q to quit.")
             if input("  > ").strip().lower() == "q":
                 print("\n  Bye!\n")
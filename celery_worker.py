@@ -10,12 +10,28 @@ Note: --pool=solo is required on Windows.
 """
 from __future__ import annotations
 import os
+import threading
 import time
 from celery import Celery
+from celery.signals import task_failure, worker_process_init
+
+# Each prefork child is one inference slot — cap its thread pools before torch loads
+# (set INFER_SLOTS to the worker --concurrency so slots × threads fits the cores)
+from thread_budget import apply_thread_env
+apply_thread_env()
 
 # ── Celery app ────────────────────────────────────────────────────
 BROKER  = os.getenv("CELERY_BROKER_URL",  "redis://localhost:6379/0")
 BACKEND = os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/1")
+MODEL_NAME    = "facebook/musicgen-small"
+DURATION_TOKENS = 512          # ~10 seconds
+# Seeded generations share api_server's on-disk result cache
+GEN_CACHE_DIR     = os.getenv("GEN_CACHE_DIR", "gen_cache")
+GEN_CACHE_MAX_MB  = int(os.getenv("GEN_CACHE_MAX_MB", "512"))
+# Outputs are interned into api_server's content-addressed asset store
+ASSET_DIR         = os.getenv("ASSET_DIR", "asset_store")
+# Load MusicGen as soon as a prefork child starts instead of on its first task
+PRELOAD_MODEL = os.getenv("CELERY_PRELOAD_MODEL", "1") != "0"
 
 celery_app = Celery(
     "beatflow",
@@ -46,45 +62,210 @@ def _gpu_context():
     return device, dtype
 
 
+class _ModelHolder:
+    """
+    One MusicGen processor/model per worker process.
+    Loaded on worker_process_init (prefork) or lazily on first use
+    (--pool=solo never fires that signal), then reused by every task.
+    """
+
+    def __init__(self):
+        self._lock      = threading.Lock()
+        self.processor  = None
+        self.model      = None
+        self.device     = None
+        self.dtype      = None
+        self.load_sec   = 0.0
+        self.uses       = 0
+
+    @property
+    def loaded(self) -> bool:
+        return self.model is not None
+
+    def load(self):
+        with self._lock:
+            if self.model is not None:
+                return
+            from model_loader import load_musicgen
+            from thread_budget import ThreadBudget
+            ThreadBudget(slots=1)                 # torch intra-/inter-op threads
+            device, _ = _gpu_context()
+            t0 = time.time()
+            processor, model, dtype, precision = load_musicgen(MODEL_NAME, device)
+            self.load_sec  = round(time.time() - t0, 1)
+            self.device, self.dtype = device, dtype
+            self.processor, self.model = processor, model
+            print(f"[OK] Worker pid={os.getpid()} loaded {MODEL_NAME} on {device} "
+                  f"({precision}) in {self.load_sec}s")
+
+    def acquire(self):
+        """Return (processor, model, device, dtype, info) loading on first call.
+        info tells the caller whether this task hit a warm model."""
+        warm = self.loaded
+        if not warm:
+            self.load()
+        with self._lock:
+            self.uses += 1
+            info = {
+                "model_warm":        warm,
+                "model_load_sec":    0.0 if warm else self.load_sec,
+                "model_reuse_count": self.uses - 1,
+                "worker_pid":        os.getpid(),
+            }
+        return self.processor, self.model, self.device, self.dtype, info
+
+
+_models = _ModelHolder()
+_gen_cache = None
+_assets    = None
+_job_store = None
+
+
+def _get_job_store():
+    """The shared job store, or None unless JOB_STORE=redis."""
+    global _job_store
+    from job_store import JOB_STORE, make_job_store
+    if JOB_STORE != "redis":
+        return None
+    if _job_store is None:
+        _job_store = make_job_store(float(os.getenv("JOB_TTL_SEC", "600")))
+    return _job_store
+
+
+def _publish(job_id: str | None, **fields):
+    """Mirror task state into the shared job store (JOB_STORE=redis) so that
+    api_server's /sse/progress can follow Celery tasks. Never fails the task."""
+    try:
+        store = _get_job_store()
+        if job_id and store is not None:
+            store.put(job_id, fields)
+    except Exception as e:
+        print(f"[WARN] Job store update failed: {e}")
+
+
+def _cancel_requested(job_id: str | None) -> str | None:
+    """Reason if DELETE /tasks/{job_id} flagged this task in the job store."""
+    try:
+        store = _get_job_store()
+        job = store.get(job_id) if job_id and store is not None else None
+    except Exception:
+        return None
+    if job and job.get("cancel_requested"):
+        return job.get("error") or "cancelled"
+    return None
+
+
+def _get_cache():
+    global _gen_cache
+    if _gen_cache is None:
+        from generation_cache import GenerationCache
+        _gen_cache = GenerationCache(GEN_CACHE_DIR, GEN_CACHE_MAX_MB * 1024 * 1024)
+    return _gen_cache
+
+
+def _get_assets():
+    global _assets
+    if _assets is None:
+        from asset_store import AssetStore
+        _assets = AssetStore(ASSET_DIR, {"/audio": "beat_outputs"})
+    return _assets
+
+
+@worker_process_init.connect
+def _preload_model(**_kwargs):
+    if not PRELOAD_MODEL:
+        return
+    try:
+        _models.load()
+    except Exception as e:          # task will retry the load lazily
+        print(f"[WARN] Model preload failed: {e}")
+
+
 # ── Task 1: Generate beat ─────────────────────────────────────────
 @celery_app.task(bind=True, name="beatflow.generate_beat")
-def generate_beat_task(self, prompt: str, label: str, commit_id: str | None = None):
+def generate_beat_task(self, prompt: str, label: str, commit_id: str | None = None,
+                       seed: int | None = None, duration: float | None = None):
     """
     Async MusicGen generation.
+    With a seed the result is reproducible and served from the shared
+    generation cache when it already exists.
+    duration (seconds) sets the length; None → DURATION_TOKENS (~10 s).
     Updates DB commit record when done.
-    Returns: {"audio_url", "duration", "elapsed", "device"}
+    Progress meta carries tokens_done / tokens_per_sec / eta_sec.
+    DELETE /tasks/{id} stops it between decoding steps (checked with each
+    progress report, so within ~1 s) and nothing is written.
+    Returns: {"audio_url", "duration", "elapsed", "device", "seed", "cached", "tokens_per_sec",
+              "model_warm", "model_load_sec", "model_reuse_count", "worker_pid"}
     """
-    self.update_state(state="PROGRESS", meta={"step": "loading model"})
-    from transformers import AutoProcessor, MusicgenForConditionalGeneration
     import torch, soundfile as sf
     from pathlib import Path
-    from datetime import datetime
+    from asset_store import output_name
+    from generation_cache import GenerationCache, link_or_copy, sampling_params
+    from job_manager import CancelToken, GenerationCancelled
 
-    device, dtype = _gpu_context()
+    t0 = time.time()
+    job_id = self.request.id
+    reason = _cancel_requested(job_id)
+    if reason:
+        raise GenerationCancelled(reason)
+    _publish(job_id, status="running", pct=0, error=None, kind="celery", started_at=t0)
+    if not _models.loaded:
+        self.update_state(state="PROGRESS", meta={"step": "loading model"})
+    processor, model, device, dtype, model_info = _models.acquire()
+    from inference import duration_to_tokens
+    tokens = DURATION_TOKENS if duration is None else duration_to_tokens(duration, model)
 
-    t0        = time.time()
-    processor = AutoProcessor.from_pretrained("facebook/musicgen-small")
-    model     = MusicgenForConditionalGeneration.from_pretrained(
-        "facebook/musicgen-small", torch_dtype=dtype
-    ).to(device)
-    model.eval()
+    filename = output_name("beat")
+    out_path = Path("beat_outputs") / filename
+    out_path.parent.mkdir(exist_ok=True)
 
-    self.update_state(state="PROGRESS", meta={"step": "generating"})
-    inputs = processor(text=[prompt], padding=True, return_tensors="pt").to(device)
+    cache_key = hit = progress = None
+    if seed is not None:
+        cache_key = GenerationCache.make_key(MODEL_NAME, prompt, tokens,
+                                             sampling_params(model), seed)
+        hit = _get_cache().get(cache_key)
 
-    with torch.inference_mode():
-        with torch.autocast(device_type=device, dtype=dtype, enabled=(device == "cuda")):
-            output = model.generate(**inputs, max_new_tokens=512)
+    if hit is not None:
+        link_or_copy(hit, out_path)
+        _get_assets().intern(out_path)
+        duration = sf.info(str(out_path)).duration
+    else:
+        from transformers import LogitsProcessorList, StoppingCriteriaList
+        from inference import CancelCriteria, CodesRecorder, ProgressReporter, SeededSampler, save_codes
+        from audio_writer import write_audio
+        from model_loader import autocast
 
-    audio_np    = output[0, 0].cpu().float().numpy()
-    sample_rate = model.config.audio_encoder.sampling_rate
-    duration    = len(audio_np) / sample_rate
+        self.update_state(state="PROGRESS", meta={"step": "generating", **model_info})
+        inputs = processor(text=[prompt], padding=True, return_tensors="pt").to(device)
 
-    ts       = datetime.now().strftime("%H%M%S")
-    filename = f"beat_{ts}.wav"
-    out_path = Path("beat_outputs") / filename
-    out_path.parent.mkdir(exist_ok=True)
-    sf.write(str(out_path), audio_np, sample_rate)
+        # Per-token throughput into the result backend (+ job store), ~1 write/sec
+        cancel = CancelToken()
+        def _report(info):
+            self.update_state(state="PROGRESS", meta={"step": "generating", **info, **model_info})
+            _publish(job_id, status="generating",
+                     pct=int(95 * info["tokens_done"] / max(info["tokens_total"], 1)), **info)
+            reason = _cancel_requested(job_id)
+            if reason:
+                cancel.cancel(reason)
+
+        progress = ProgressReporter(tokens, _report, min_interval=1.0)
+        recorder = CodesRecorder(model.decoder.num_codebooks)     # codes for /continue
+        if seed is not None:                      # same sampling as api_server → shared cache
+            inputs["logits_processor"] = LogitsProcessorList([SeededSampler(model, [seed], device)])
+        with torch.inference_mode():
+            with autocast(device, dtype):
+                output = model.generate(**inputs, max_new_tokens=tokens,
+                                        stopping_criteria=StoppingCriteriaList(
+                                            [progress, CancelCriteria([cancel]), recorder]))
+
+        audio_np    = output[0, 0].cpu().float().numpy()
+        sample_rate = model.config.audio_encoder.sampling_rate
+        duration    = len(audio_np) / sample_rate
+        write_audio(out_path, audio_np, sample_rate)
+        save_codes(out_path, recorder.codes())
+        _get_assets().intern(out_path)
+        if cache_key is not None:
+            _get_cache().put(cache_key, out_path)
     elapsed = round(time.time() - t0, 1)
 
     result = {
@@ -92,6 +273,10 @@ def generate_beat_task(self, prompt: str, label: str, commit_id: str | None = No
         "duration":  round(duration, 2),
         "elapsed":   elapsed,
         "device":    f"{device}",
+        "seed":      seed,
+        "cached":    hit is not None,
+        "tokens_per_sec": (progress.last or {}).get("tokens_per_sec") if progress else None,
+        **model_info,
     }
 
     # Update DB if commit_id provided
@@ -110,9 +295,18 @@ def generate_beat_task(self, prompt: str, label: str, commit_id: str | None = No
         except Exception as e:
             print(f"[WARN] DB update failed: {e}")
 
+    _publish(job_id, **result, status="done", pct=100, url=result["audio_url"],
+             filename=filename, finished_at=time.time())
     return result
 
 
+@task_failure.connect(sender=generate_beat_task)
+def _publish_failure(task_id=None, exception=None, **_kwargs):
+    from job_manager import GenerationCancelled
+    status = "cancelled" if isinstance(exception, GenerationCancelled) else "error"
+    _publish(task_id, status=status, error=str(exception), finished_at=time.time())
+
+
 # ── Task 2: Stem separation ───────────────────────────────────────
 @celery_app.task(bind=True, name="beatflow.separate_stems")
 def separate_stems_task(self, audio_path: str, commit_id: str | None = None):
@@ -0,0 +1,126 @@
+"""
+encoder_cache.py — Cached T5 text-encoder outputs for MusicGen
+===============================================================
+MusicGen runs every prompt through its T5 text encoder before decoding.
+The built-in mood prompts are encoded once (pinned), custom prompts are
+kept in a small LRU. generate_kwargs() turns a batch of prompts into
+input_ids / attention_mask / encoder_outputs for model.generate(), so the
+encoder is skipped for every cached prompt.
+"""
+
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+
+import torch
+from transformers.modeling_outputs import BaseModelOutput
+
+from model_loader import autocast
+
+
+class TextEncoderCache:
+    """Per-prompt (input_ids, attention_mask, hidden_states), unpadded."""
+
+    def __init__(self, processor, model, device: str, dtype: torch.dtype,
+                 max_entries: int = 128):
+        self.processor   = processor
+        self.model       = model
+        self.device      = device
+        self.dtype       = dtype
+        self.max_entries = int(max_entries)
+        self._pinned: dict[str, tuple] = {}
+        self._lru: OrderedDict[str, tuple] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    # ── Public API ────────────────────────────────────────────────
+    def precompute(self, prompts) -> int:
+        """Encode prompts once and pin them (never evicted). Returns count added."""
+        todo = [p for p in dict.fromkeys(prompts) if p not in self._pinned]
+        if todo:
+            for prompt, entry in zip(todo, self._encode(todo)):
+                with self._lock:
+                    self._pinned[prompt] = entry
+                    self._lru.pop(prompt, None)
+        return len(todo)
+
+    def generate_kwargs(self, prompts: list[str]) -> dict:
+        """model.generate() kwargs for prompts, encoding only the cache misses."""
+        entries, missing = {}, []
+        with self._lock:
+            for p in prompts:
+                entry = self._pinned.get(p) or self._lru.get(p)
+                if entry is None:
+                    if p not in missing:
+                        missing.append(p)
+                    continue
+                if p in self._lru:
+                    self._lru.move_to_end(p)
+                entries[p] = entry
+            self.hits   += len(prompts) - sum(prompts.count(p) for p in missing)
+            self.misses += sum(prompts.count(p) for p in missing)
+        if missing:
+            for p, entry in zip(missing, self._encode(missing)):
+                entries[p] = entry
+                self._remember(p, entry)
+        return self._collate([entries[p] for p in prompts])
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "pinned":   len(self._pinned),
+                "entries":  len(self._lru),
+                "max_entries": self.max_entries,
+                "hits":     self.hits,
+                "misses":   self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+    # ── Internals ─────────────────────────────────────────────────
+    def _remember(self, prompt: str, entry: tuple):
+        with self._lock:
+            self._lru[prompt] = entry
+            self._lru.move_to_end(prompt)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+    def _encode(self, prompts: list[str]) -> list[tuple]:
+        inputs = self.processor(text=prompts, padding=True, return_tensors="pt").to(self.device)
+        with torch.inference_mode():
+            with autocast(self.device, self.dtype):
+                hidden = self.model.text_encoder(
+                    input_ids=inputs["input_ids"],
+                    attention_mask=inputs["attention_mask"],
+                ).last_hidden_state
+        out = []
+        for i in range(len(prompts)):
+            n = int(inputs["attention_mask"][i].sum())        # tokenizer pads on the right
+            out.append((inputs["input_ids"][i, :n].clone(),
+                        inputs["attention_mask"][i, :n].clone(),
+                        hidden[i, :n].clone()))
+        return out
+
+    def _collate(self, entries: list[tuple]) -> dict:
+        n   = max(e[0].shape[0] for e in entries)
+        dim = entries[0][2].shape[-1]
+        ids    = torch.zeros(len(entries), n, dtype=entries[0][0].dtype, device=self.device)
+        mask   = torch.zeros(len(entries), n, dtype=entries[0][1].dtype, device=self.device)
+        hidden = torch.zeros(len(entries), n, dim, dtype=entries[0][2].dtype, device=self.device)
+        for i, (e_ids, e_mask, e_hidden) in enumerate(entries):
+            k = e_ids.shape[0]
+            ids[i, :k], mask[i, :k], hidden[i, :k] = e_ids, e_mask, e_hidden
+
+        # Classifier-free guidance: generate() only appends the null (all-zero)
+        # conditioning when it runs the encoder itself, so add it here.
+        guidance = self.model.generation_config.guidance_scale
+        if guidance is not None and guidance > 1:
+            hidden = torch.cat([hidden, torch.zeros_like(hidden)], dim=0)
+            mask   = torch.cat([mask, torch.zeros_like(mask)], dim=0)
+
+        # input_ids only fix the batch size; encoding is skipped via encoder_outputs
+        return {
+            "input_ids":       ids,
+            "attention_mask":  mask,
+            "encoder_outputs": BaseModelOutput(last_hidden_state=hidden),
+        }
@@ -0,0 +1,148 @@
+"""
+generation_cache.py — Content-addressed cache of generated WAVs
+================================================================
+Key   = sha256 of (model name, prompt, max_new_tokens, sampling params, seed)
+Value = <cache_dir>/<key>.wav
+
+Only seeded (deterministic) requests are cached: an unseeded request is
+expected to produce a new beat every time.
+
+A WAV's EnCodec codes (<name>.codes.npy, see inference.save_codes) travel
+with it through link_or_copy, so cached beats continue without re-encoding.
+
+Shared by api_server.py and celery_worker.py. Both processes may use the
+same directory; LRU order is kept in file mtimes so it survives restarts.
+"""
+
+from __future__ import annotations
+import hashlib, json, os, shutil, threading
+from collections import OrderedDict
+from pathlib import Path
+
+
+def sampling_params(model) -> dict:
+    """Generation settings of model that change its output — part of the key."""
+    gc = model.generation_config
+    params = {k: getattr(gc, k, None)
+              for k in ("do_sample", "guidance_scale", "temperature", "top_k", "top_p")}
+    params["precision"] = getattr(model, "precision", None)   # int8/bf16 sound different
+    params["sampler"]   = "per-row"          # inference.SeededSampler, not torch.manual_seed
+    return params
+
+
+def codes_path(wav_path) -> Path:
+    """beat_outputs/x.wav → beat_outputs/x.codes.npy"""
+    wav_path = Path(wav_path)
+    return wav_path.with_name(wav_path.stem + ".codes.npy")
+
+
+def link_or_copy(src: Path, dst: Path):
+    """Hard-link src to dst (no extra disk, survives eviction), copy if linking fails.
+    src's codes file, when it has one, goes along."""
+    pairs = [(Path(src), Path(dst))]
+    if codes_path(src).exists():
+        pairs.append((codes_path(src), codes_path(dst)))
+    else:
+        codes_path(dst).unlink(missing_ok=True)
+    for s, d in pairs:
+        d.unlink(missing_ok=True)
+        try:
+            os.link(s, d)
+        except OSError:
+            shutil.copy2(s, d)
+
+
+class GenerationCache:
+    """Size-bounded on-disk LRU cache with hit/miss counters."""
+
+    def __init__(self, root: Path | str, max_bytes: int):
+        self.root      = Path(root)
+        self.max_bytes = int(max_bytes)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock  = threading.Lock()
+        self._index: OrderedDict[str, int] = OrderedDict()   # key → size, oldest first
+        self._bytes = 0
+        self.hits = self.misses = self.evictions = 0
+        self._scan()
+
+    # ── Keys ──────────────────────────────────────────────────────
+    @staticmethod
+    def make_key(model_name: str, prompt: str, max_new_tokens: int,
+                 params: dict, seed: int | None) -> str:
+        payload = json.dumps({
+            "model":          model_name,
+            "prompt":         prompt.strip(),
+            "max_new_tokens": int(max_new_tokens),
+            "params":         params,
+            "seed":           None if seed is None else int(seed),
+        }, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.root / f"{key}.wav"
+
+    # ── Lookup / insert ───────────────────────────────────────────
+    def get(self, key: str) -> Path | None:
+        """Return the cached WAV for key (marking it most recently used) or None."""
+        path = self._path(key)
+        with self._lock:
+            if key in self._index and path.exists():
+                self._index.move_to_end(key)
+                self.hits += 1
+                try:
+                    os.utime(path)
+                except OSError:
+                    pass
+                return path
+            if key in self._index:                  # removed behind our back
+                self._bytes -= self._index.pop(key)
+            elif path.exists():                     # written by another process
+                self._add(key, path.stat().st_size)
+                self.hits += 1
+                return path
+            self.misses += 1
+            return None
+
+    def put(self, key: str, src: Path) -> Path:
+        """Store src under key and evict least recently used entries over budget."""
+        path = self._path(key)
+        link_or_copy(Path(src), path)
+        with self._lock:
+            if key in self._index:
+                self._bytes -= self._index.pop(key)
+            self._add(key, path.stat().st_size)
+            self._evict()
+        return path
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries":   len(self._index),
+                "bytes":     self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits":      self.hits,
+                "misses":    self.misses,
+                "evictions": self.evictions,
+                "hit_rate":  round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+    # ── Internals (call with _lock held) ──────────────────────────
+    def _add(self, key: str, size: int):
+        self._index[key] = size
+        self._bytes += size
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and len(self._index) > 1:
+            key, size = self._index.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            self._path(key).unlink(missing_ok=True)
+            codes_path(self._path(key)).unlink(missing_ok=True)
+
+    def _scan(self):
+        files = sorted(self.root.glob("*.wav"), key=lambda p: p.stat().st_mtime)
+        for p in files:
+            self._add(p.stem, p.stat().st_size)
+        with self._lock:
+            self._evict()
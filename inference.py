@@ -0,0 +1,889 @@
+"""
+inference.py — Shared MusicGen inference scheduling
+====================================================
+  - BatchScheduler : gathers concurrent prompts for a few milliseconds and
+                     runs them as one batched model.generate() call;
+                     prompts are only batched within one duration bucket;
+                     higher priority first, round-robin between users
+  - musicgen_batch_runner : the batched processor → generate → split step
+  - DecodeStage    : second pipeline stage — EnCodec decode of finished codes
+                     on its own thread while the next batch generates tokens
+  - ProgressReporter : per-step tokens done / tokens per second / ETA
+  - CancelCriteria   : stops generate() between decoding steps on cancel
+  - SeededSampler    : per-row seeded sampling (seeded jobs and variations)
+  - CodesRecorder    : recovers the EnCodec codes behind generate()'s audio;
+                       save_codes / load_codes keep them as <wav>.codes.npy
+  - AudioStreamer  : decodes finished EnCodec frames while generate() runs
+
+Used by api_server.py (/generate, /generate/tracked, /continue,
+/generate/stream).
+"""
+
+from __future__ import annotations
+import copy, math, os, queue, struct, threading, time
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+from transformers import LogitsProcessor, LogitsProcessorList, StoppingCriteria, StoppingCriteriaList
+
+from encoder_cache import TextEncoderCache
+from generation_cache import codes_path
+from job_manager import CancelToken, GenerationCancelled
+from model_loader import autocast
+
+
+# ═══════════════════════════════════════════════════════════════════
+# DURATION
+# ═══════════════════════════════════════════════════════════════════
+
+def duration_to_tokens(seconds: float, model) -> int:
+    """max_new_tokens giving at least `seconds` of audio. With the delay pattern
+    the last codebook lags num_codebooks - 1 steps, so N tokens → N - K + 1 frames."""
+    frame_rate = model.config.audio_encoder.frame_rate
+    return math.ceil(seconds * frame_rate) + model.decoder.config.num_codebooks - 1
+
+
+def tokens_to_samples(tokens: int, model) -> int:
+    """Waveform length generate() returns for max_new_tokens=tokens."""
+    frames = tokens - model.decoder.config.num_codebooks + 1
+    return max(frames, 0) * int(np.prod(model.config.audio_encoder.upsampling_ratios))
+
+
+# ═══════════════════════════════════════════════════════════════════
+# JOBS
+# ═══════════════════════════════════════════════════════════════════
+
+class GenerationJob:
+    """One queued request. Jobs with the same batch_key may share a batch."""
+
+    def __init__(self, prompt: str | None, max_new_tokens: int, call=None,
+                 seed: int | None = None, on_progress=None, cancel: CancelToken | None = None,
+                 priority: int = 0, user: str | None = None, with_codes: bool = False,
+                 group=None):
+        self.prompt         = prompt
+        self.max_new_tokens = int(max_new_tokens)
+        self.seed           = seed            # deterministic mode → own batch (or its group's)
+        self.on_progress    = on_progress     # callback(dict) — see ProgressReporter
+        self.call           = call            # exclusive callable (never batched)
+        self.cancel         = cancel          # leaves the queue / stops decoding when fired
+        self.priority       = int(priority)   # lower runs first (0 = logged-in, 1 = anonymous)
+        self.user           = user            # fair-queuing key
+        self.with_codes     = with_codes      # result is (audio, EnCodec codes)
+        self.group          = group           # seeded jobs of one group share a batch
+        self.bucket         = self.max_new_tokens # set by BatchScheduler
+        self.future: Future = Future()
+        self.enqueued_at    = time.monotonic()
+
+    @property
+    def batch_key(self):
+        if self.call is not None:
+            return ("call", id(self))
+        if self.seed is not None:
+            # a seeded result must not depend on which other prompts were batched with it
+            return ("seeded", self.group if self.group is not None else id(self))
+        return ("text", self.bucket)
+
+
+# ═══════════════════════════════════════════════════════════════════
+# SCHEDULER
+# ═══════════════════════════════════════════════════════════════════
+
+class BatchScheduler:
+    """
+    Dynamic micro-batching in front of a single model.
+
+    A worker thread takes the oldest queued job, then keeps collecting
+    compatible jobs until `max_batch_size` is reached or `max_wait_ms` has
+    passed since that job was queued. The batch is handed to
+    `run_batch(jobs) -> list[result]` and each result goes back to its
+    waiting caller through a Future.
+
+    `token_buckets` (ascending max_new_tokens edges) lets jobs of different
+    lengths share a batch: a job joins the smallest bucket that fits it and
+    the batch runs to its longest job, so a short job is never padded past
+    its bucket edge. Without buckets only equal lengths are batched.
+
+    With a ThreadBudget, `budget.slots` workers run batches concurrently,
+    each inside a slot. Seeded jobs sample from their own generator (see
+    SeededSampler), so they run alongside other batches; they only share
+    a batch with jobs of the same group (submit_variations).
+
+    A job whose CancelToken fires while queued is removed at once (its
+    future raises GenerationCancelled). run_batch may return an exception
+    instance in place of a job's result; it is raised to that caller.
+    run_batch may also return a Future of the result list (see DecodeStage):
+    the worker moves on to the next batch and the jobs resolve when it does.
+
+    The next batch starts with the queued job of the best (lowest)
+    priority whose user was served longest ago, so one user's burst
+    cannot starve others. on_batch(job_tokens, seconds) is called after
+    every text batch (see admission.py).
+    """
+
+    def __init__(self, run_batch, max_batch_size: int = 4, max_wait_ms: float = 25.0,
+                 token_buckets=None, budget=None, on_batch=None):
+        self._run_batch     = run_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait       = max(0.0, float(max_wait_ms)) / 1000.0
+        self.token_buckets  = sorted({int(b) for b in token_buckets or ()})
+        self.budget         = budget
+        self.on_batch       = on_batch
+        self.workers        = budget.slots if budget is not None else 1
+        self._queue: deque[GenerationJob] = deque()
+        self._last_served: dict = {}        # user → monotonic time of its last dispatch
+        self._cond      = threading.Condition()
+        self._stopped   = False
+        self._running   = 0                 # batches in flight
+        self._started   = time.monotonic()
+        self._stats     = {"jobs": 0, "batches": 0, "errors": 0, "cancelled": 0,
+                           "largest_batch": 0, "busy_sec": 0.0, "padding_tokens": 0}
+        self._threads   = [threading.Thread(target=self._loop, name=f"batch-scheduler-{i}",
+                                            daemon=True) for i in range(self.workers)]
+        for t in self._threads:
+            t.start()
+
+    # ── Public API ────────────────────────────────────────────────
+    def submit(self, prompt: str, max_new_tokens: int, seed: int | None = None,
+               on_progress=None, cancel: CancelToken | None = None,
+               priority: int = 0, user: str | None = None, with_codes: bool = False) -> Future:
+        """Queue a text prompt. The future resolves to run_batch's result for it
+        ((audio, codes) with_codes — see musicgen_batch_runner)."""
+        return self._enqueue(GenerationJob(prompt, max_new_tokens, seed=seed,
+                                           on_progress=on_progress, cancel=cancel,
+                                           priority=priority, user=user,
+                                           with_codes=with_codes))
+
+    def generate(self, prompt: str, max_new_tokens: int, seed: int | None = None,
+                 on_progress=None, cancel: CancelToken | None = None,
+                 priority: int = 0, user: str | None = None, with_codes: bool = False,
+                 timeout: float | None = None):
+        """Blocking helper: submit and wait for the result."""
+        return self.submit(prompt, max_new_tokens, seed=seed, on_progress=on_progress,
+                           cancel=cancel, priority=priority, user=user,
+                           with_codes=with_codes).result(timeout=timeout)
+
+    def submit_variations(self, prompt: str, max_new_tokens: int, seeds,
+                          on_progress=None, cancel: CancelToken | None = None,
+                          priority: int = 0, user: str | None = None,
+                          with_codes: bool = False) -> list[Future]:
+        """Queue len(seeds) samples of one prompt as a single batch (one text
+        encode, one generate; split across batches past max_batch_size).
+        One future per seed, in order."""
+        group = object()
+        return [self._enqueue(GenerationJob(prompt, max_new_tokens, seed=seed,
+                                            on_progress=on_progress if i == 0 else None,
+                                            cancel=cancel, priority=priority, user=user,
+                                            with_codes=with_codes, group=group))
+                for i, seed in enumerate(seeds)]
+
+    def submit_call(self, fn, cancel: CancelToken | None = None,
+                    priority: int = 0, user: str | None = None) -> Future:
+        """
+        Queue fn() to run on the scheduler thread, between batches.
+        Used for work that cannot be batched (e.g. audio continuation,
+        streaming) but must count against the same worker slots.
+        `cancel` only removes it from the queue; fn checks it while running.
+        """
+        return self._enqueue(GenerationJob(None, 0, call=fn, cancel=cancel,
+                                           priority=priority, user=user))
+
+    def call(self, fn, cancel: CancelToken | None = None, priority: int = 0,
+             user: str | None = None, timeout: float | None = None):
+        """Blocking helper: submit_call and wait for fn's return value."""
+        return self.submit_call(fn, cancel=cancel, priority=priority,
+                                user=user).result(timeout=timeout)
+
+    def stats(self) -> dict:
+        with self._cond:
+            s = dict(self._stats)
+            queued  = len(self._queue)
+            running = self._running
+        s["queued"]         = queued
+        s["running"]        = running
+        s["workers"]        = self.workers
+        s["avg_batch_size"] = round(s["jobs"] / s["batches"], 2) if s["batches"] else 0.0
+        s["utilisation"]    = round(s["busy_sec"] / max((time.monotonic() - self._started)
+                                                     * self.workers, 1e-9), 3)
+        s["busy_sec"]       = round(s["busy_sec"], 1)
+        s["max_batch_size"] = self.max_batch_size
+        s["max_wait_ms"]    = round(self.max_wait * 1000, 1)
+        s["token_buckets"]  = self.token_buckets
+        return s
+
+    def shutdown(self, wait: bool = True):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if wait:
+            for t in self._threads:
+                t.join()
+
+    # ── Internals ─────────────────────────────────────────────────
+    def _bucket(self, tokens: int) -> int:
+        for edge in self.token_buckets:
+            if tokens <= edge:
+                return edge
+        return tokens                          # longer than every bucket → exact length
+
+    def _enqueue(self, job: GenerationJob) -> Future:
+        job.bucket = self._bucket(job.max_new_tokens)
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("BatchScheduler is shut down")
+            self._queue.append(job)
+            self._cond.notify_all()
+        if job.cancel is not None:
+            job.cancel.on_cancel(lambda: self._dequeue_cancelled(job))
+        return job.future
+
+    def _dequeue_cancelled(self, job: GenerationJob):
+        with self._cond:
+            if job not in self._queue:
+                return                          # already running: the runner checks the token
+            self._queue.remove(job)
+            self._stats["cancelled"] += 1
+            self._cond.notify_all()
+        if job.future.set_running_or_notify_cancel():
+            job.future.set_exception(GenerationCancelled(job.cancel.reason))
+
+    def _order(self) -> list[GenerationJob]:
+        """Queue in dispatch order: priority, then the user served longest ago, then age."""
+        return sorted(self._queue, key=lambda j: (j.priority, self._last_served.get(j.user, 0.0),
+                                                  j.enqueued_at))
+
+    def _served(self, batch: list[GenerationJob]):
+        now = time.monotonic()
+        for i, job in enumerate(batch):
+            self._last_served[job.user] = now + i * 1e-6     # keep batch order among users
+        if len(self._last_served) > 4096:                     # forget long-idle users
+            for user, _ in sorted(self._last_served.items(), key=lambda kv: kv[1])[:2048]:
+                del self._last_served[user]
+
+    def _take_compatible(self, key, batch: list[GenerationJob]):
+        for job in self._order():
+            if len(batch) >= self.max_batch_size:
+                return
+            if job.batch_key == key:
+                self._queue.remove(job)
+                batch.append(job)
+
+    def _next_batch(self) -> list[GenerationJob] | None:
+        with self._cond:
+            while not self._queue and not self._stopped:
+                self._cond.wait()
+            if not self._queue:
+                return None
+            first = self._order()[0]
+            self._queue.remove(first)
+            batch = [first]
+            self._running += 1
+            if first.call is not None:
+                self._served(batch)
+                return batch
+            deadline = first.enqueued_at + self.max_wait
+            while True:
+                self._take_compatible(first.batch_key, batch)
+                remaining = deadline - time.monotonic()
+                if len(batch) >= self.max_batch_size or remaining <= 0 or self._stopped:
+                    self._served(batch)
+                    return batch
+                self._cond.wait(remaining)
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                self._run(batch)
+            finally:
+                with self._cond:
+                    self._running -= 1
+                    self._cond.notify_all()
+
+    def _run(self, batch: list[GenerationJob]):
+        batch = [j for j in batch if j.future.set_running_or_notify_cancel()]
+        for job in [j for j in batch if j.cancel is not None and j.cancel.cancelled]:
+            batch.remove(job)
+            job.future.set_exception(GenerationCancelled(job.cancel.reason))
+            with self._cond:
+                self._stats["cancelled"] += 1
+        if not batch:
+            return
+        t0 = time.monotonic()
+        try:
+            with self.budget.slot() if self.budget is not None else nullcontext():
+                if batch[0].call is not None:
+                    results = [batch[0].call()]
+                else:
+                    results = self._run_batch(batch)
+            if isinstance(results, Future):     # later pipeline stage still running
+                seconds = time.monotonic() - t0
+                results.add_done_callback(lambda f: self._deliver(batch, f.exception() or f.result(),
+                                                                  seconds))
+            else:
+                self._deliver(batch, results, time.monotonic() - t0)
+        except BaseException as e:
+            self._deliver(batch, e, 0.0)
+        finally:
+            with self._cond:
+                self._stats["busy_sec"] += time.monotonic() - t0
+                if batch[0].call is None:
+                    longest = max(j.max_new_tokens for j in batch)
+                    self._stats["jobs"]    += len(batch)
+                    self._stats["batches"] += 1
+                    self._stats["padding_tokens"] += sum(longest - j.max_new_tokens
+                                                         for j in batch)
+                    self._stats["largest_batch"] = max(self._stats["largest_batch"],
+                                                       len(batch))
+
+    def _deliver(self, batch: list[GenerationJob], results, seconds: float):
+        """Resolve the batch's futures with run_batch's results (or the exception
+        it raised); `seconds` is the time the batch held its worker."""
+        if isinstance(results, BaseException):
+            for job in batch:
+                if not job.future.done():
+                    job.future.set_exception(results)
+            with self._cond:
+                self._stats["errors"] += 1
+            return
+        for job, res in zip(batch, results):
+            if isinstance(res, BaseException):
+                job.future.set_exception(res)
+            else:
+                job.future.set_result(res)
+        if (batch[0].call is None and self.on_batch is not None
+                and not any(isinstance(r, BaseException) for r in results)):
+            try:                                # throughput of completed batches only
+                self.on_batch(sum(j.max_new_tokens for j in batch), seconds)
+            except Exception:
+                pass
+
+
+# ═══════════════════════════════════════════════════════════════════
+# SEEDED SAMPLING
+# ═══════════════════════════════════════════════════════════════════
+
+class SeededSampler(LogitsProcessor):
+    """
+    Per-row seeded sampling for model.generate(logits_processor=[...]).
+
+    torch.manual_seed() seeds one global RNG for a whole generate() call, so
+    a seeded job had to run alone and nothing else could sample meanwhile.
+    Here every batch row draws from its own torch.Generator instead: row b
+    of a batch with seeds[b] produces the same tokens as a batch of one with
+    that seed, and the global RNG is never touched (None → a random seed).
+
+    generate() runs custom processors before its classifier-free guidance,
+    temperature and top-k/top-p steps, so this processor applies those
+    itself (from model.generation_config), draws each row's token and
+    returns logits where only that token survives. Other tokens get a large
+    but finite negative value: guidance subtracts the unconditional half,
+    and -inf - -inf would be NaN.
+    """
+
+    MASKED = -1e4
+
+    def __init__(self, model, seeds, device=None):
+        gc = model.generation_config
+        self.num_codebooks = model.decoder.num_codebooks
+        self.guidance      = gc.guidance_scale if gc.guidance_scale and gc.guidance_scale > 1 else None
+        self.do_sample     = bool(gc.do_sample)
+        self.temperature   = gc.temperature or 1.0
+        self.top_k         = gc.top_k or 0
+        self.top_p         = gc.top_p if gc.top_p and gc.top_p < 1.0 else None
+        self.seeds         = [int(s) if s is not None else int(torch.seed() % 2**31) for s in seeds]
+        device = device or model.device
+        self.generators = [torch.Generator(device=device).manual_seed(s) for s in self.seeds]
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        rows   = input_ids.shape[0]                      # batch × codebooks
+        logits = scores.float()
+        if self.guidance is not None and scores.shape[0] == 2 * rows:
+            cond, uncond = logits.split(rows, dim=0)
+            logits = uncond + (cond - uncond) * self.guidance
+
+        if self.do_sample:
+            logits = logits / self.temperature
+            if self.top_k:
+                kth    = torch.topk(logits, min(self.top_k, logits.shape[-1]), dim=-1).values[..., -1:]
+                logits = logits.masked_fill(logits < kth, -float("inf"))
+            if self.top_p is not None:
+                ordered, order = torch.sort(logits, descending=True, dim=-1)
+                drop = ordered.softmax(-1).cumsum(-1) > self.top_p
+                drop[..., 1:] = drop[..., :-1].clone()   # keep the token that crosses top_p
+                drop[..., 0]  = False
+                logits = logits.masked_fill(drop.scatter(-1, order, drop), -float("inf"))
+            probs  = logits.softmax(-1)
+            tokens = torch.cat([
+                torch.multinomial(probs[b * self.num_codebooks:(b + 1) * self.num_codebooks], 1,
+                                  generator=gen)
+                for b, gen in enumerate(self.generators)])
+        else:
+            tokens = logits.argmax(-1, keepdim=True)
+
+        chosen = torch.full_like(scores, self.MASKED)
+        return chosen.scatter(-1, tokens.repeat(scores.shape[0] // rows, 1), 0.0)
+
+
+# ═══════════════════════════════════════════════════════════════════
+# PIPELINE
+# ═══════════════════════════════════════════════════════════════════
+
+def codes_only(model):
+    """
+    A view of a MusicgenForConditionalGeneration whose generate() stops at
+    the EnCodec codes: [batch, codebooks, frames] LongTensor instead of
+    audio. Weights are shared with `model`; only audio_encoder.decode is
+    replaced (encode still runs, for audio prompts).
+    """
+    codec        = copy.copy(model.audio_encoder)
+    codec.decode = lambda audio_codes, audio_scales=None, **kwargs: SimpleNamespace(
+        audio_values=audio_codes[0])
+    view          = copy.copy(model)
+    view._modules = dict(model._modules)
+    view._modules["audio_encoder"] = codec
+    return view
+
+
+def decode_codes(model, codes: torch.Tensor) -> torch.Tensor:
+    """[batch, codebooks, frames] codes → [batch, channels, samples] audio."""
+    return model.audio_encoder.decode(codes[None], audio_scales=[None] * codes.shape[0]).audio_values
+
+
+class DecodeStage:
+    """
+    Second stage of the generation pipeline. The runner hands finished codes
+    to submit(fn) and returns at once, so the scheduler starts the next
+    batch's token generation while this batch is decoded to waveform on
+    the stage's own worker thread(s). Runs outside the ThreadBudget slots:
+    the point is to fill the cores generation leaves idle.
+    stats() reports jobs, busy time, queue depth and utilisation
+    (busy time / (uptime × workers)).
+    """
+
+    def __init__(self, workers: int = 1):
+        self.workers  = max(1, int(workers))
+        self._pool    = ThreadPoolExecutor(self.workers, thread_name_prefix="decode-stage")
+        self._lock    = threading.Lock()
+        self._started = time.monotonic()
+        self._stats   = {"jobs": 0, "errors": 0, "busy_sec": 0.0, "queued": 0, "max_queued": 0}
+
+    def submit(self, fn) -> Future:
+        with self._lock:
+            self._stats["queued"]    += 1
+            self._stats["max_queued"] = max(self._stats["max_queued"], self._stats["queued"])
+        return self._pool.submit(self._timed, fn)
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+        s["workers"]     = self.workers
+        s["utilisation"] = round(s["busy_sec"] / max((time.monotonic() - self._started)
+                                                     * self.workers, 1e-9), 3)
+        s["busy_sec"]    = round(s["busy_sec"], 1)
+        return s
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
+
+    def _timed(self, fn):
+        with self._lock:
+            self._stats["queued"] -= 1
+        t0 = time.monotonic()
+        try:
+            return fn()
+        except BaseException:
+            with self._lock:
+                self._stats["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                self._stats["jobs"]     += 1
+                self._stats["busy_sec"] += time.monotonic() - t0
+
+
+# ═══════════════════════════════════════════════════════════════════
+# MUSICGEN RUNNER
+# ═══════════════════════════════════════════════════════════════════
+
+def _text_inputs(processor, device: str, prompts: list[str], encoder_cache=None) -> dict:
+    """generate() inputs for prompts — from the text-encoder cache when given."""
+    if encoder_cache is not None:
+        return encoder_cache.generate_kwargs(prompts)
+    return processor(text=prompts, padding=True, return_tensors="pt").to(device)
+
+
+def musicgen_batch_runner(processor, model, device: str, dtype: torch.dtype,
+                          encoder_cache=None, decode_stage: DecodeStage | None = None):
+    """
+    Build a run_batch callable for BatchScheduler.
+    Pads all prompts into one processor(text=[...]) call (or reuses cached
+    T5 outputs from encoder_cache), runs a single model.generate and
+    returns one float32 numpy waveform per job.
+    Seeded jobs arrive alone or with their group (variations of one
+    prompt) and sample through a SeededSampler; a repeated prompt is run
+    through the text encoder once.
+    Jobs with on_progress get per-step updates of the shared batch.
+    A batch of mixed lengths runs to the longest job; shorter jobs get
+    their own length back (the tail is cut off).
+    Decoding stops early once every job in the batch is cancelled;
+    cancelled jobs get GenerationCancelled instead of audio.
+    A job with_codes gets (audio, codes) — its int16 [codebooks, frames]
+    EnCodec codes, for save_codes / continuation.
+    With a decode_stage, generate() stops at the codes (codes_only) and
+    run returns a Future: EnCodec decode happens on the stage while the
+    scheduler moves on to the next batch.
+    """
+    gen_model = codes_only(model) if decode_stage is not None else model
+    k_all     = model.decoder.num_codebooks
+
+    def split(jobs: list[GenerationJob], output, codes_of) -> list:
+        # Shape: [batch, channels, samples] → one numpy [samples] per job
+        results = []
+        for i, j in enumerate(jobs):
+            if j.cancel is not None and j.cancel.cancelled:
+                results.append(GenerationCancelled(j.cancel.reason))
+                continue
+            audio = output[i, 0, :tokens_to_samples(j.max_new_tokens, model)].cpu().float().numpy()
+            if j.with_codes:
+                audio = (audio, codes_of(i, max(j.max_new_tokens - k_all + 1, 0)))
+            results.append(audio)
+        return results
+
+    def decode(jobs: list[GenerationJob], codes: torch.Tensor) -> list:
+        with torch.inference_mode():
+            with autocast(device, dtype):
+                audio = decode_codes(model, codes)
+        return split(jobs, audio, lambda i, frames: codes[i, :, :frames].cpu().numpy()
+                     .astype(np.int16))
+
+    def run(jobs: list[GenerationJob]):
+        prompts = [j.prompt for j in jobs]
+        cache   = encoder_cache
+        if cache is None and len(set(prompts)) < len(prompts):
+            cache = TextEncoderCache(processor, model, device, dtype, max_entries=0)
+        inputs = _text_inputs(processor, device, prompts, cache)
+        tokens = max(j.max_new_tokens for j in jobs)
+        if jobs[0].seed is not None:
+            inputs["logits_processor"] = LogitsProcessorList(
+                [SeededSampler(model, [j.seed for j in jobs], device)])
+
+        callbacks = [j.on_progress for j in jobs if j.on_progress is not None]
+        criteria  = StoppingCriteriaList(
+            [ProgressReporter(tokens, callbacks)] if callbacks else [])
+        if all(j.cancel is not None for j in jobs):
+            criteria.append(CancelCriteria([j.cancel for j in jobs]))
+        recorder = None
+        if decode_stage is None and any(j.with_codes for j in jobs):
+            recorder = CodesRecorder(k_all)
+            criteria.append(recorder)
+
+        try:
+            with torch.inference_mode():
+                with autocast(device, dtype):
+                    output = gen_model.generate(**inputs, max_new_tokens=tokens,
+                                                stopping_criteria=criteria)
+        except GenerationCancelled:
+            return [GenerationCancelled(j.cancel.reason) for j in jobs]
+
+        if decode_stage is not None:
+            return decode_stage.submit(lambda: decode(jobs, output))
+        return split(jobs, output, recorder.codes if recorder is not None else None)
+
+    return run
+
+
+# ═══════════════════════════════════════════════════════════════════
+# PROGRESS
+# ═══════════════════════════════════════════════════════════════════
+
+class ProgressReporter(StoppingCriteria):
+    """
+    Token-level progress for model.generate(stopping_criteria=...).
+
+    After each decoding step it works out tokens done, tokens/sec and ETA
+    and passes them as a dict to every callback, at most once per
+    `min_interval` seconds (the final step is always reported). It never
+    stops generation. Callback errors are swallowed so a broken progress
+    sink can't kill a generation.
+    """
+
+    def __init__(self, max_new_tokens: int, callbacks, min_interval: float = 0.5):
+        self.total        = int(max_new_tokens)
+        self.callbacks    = list(callbacks) if isinstance(callbacks, (list, tuple)) else [callbacks]
+        self.min_interval = float(min_interval)
+        self._prompt_len  = None
+        self._t0          = None
+        self._last        = 0.0
+        self.last: dict | None = None          # most recent report
+
+    def __call__(self, input_ids: torch.LongTensor, scores=None, **kwargs) -> bool:
+        now = time.monotonic()
+        if self._prompt_len is None:           # first call: one token generated
+            self._prompt_len = input_ids.shape[-1] - 1
+            self._t0 = now
+        done = input_ids.shape[-1] - self._prompt_len
+        if done < self.total and now - self._last < self.min_interval:
+            return False
+        self._last = now
+        self.report(done, now)
+        return False
+
+    def report(self, done: int, now: float | None = None):
+        now     = time.monotonic() if now is None else now
+        elapsed = max(now - (self._t0 or now), 1e-6)
+        # the first token lands before _t0, so rate over (done - 1) steps
+        rate    = (done - 1) / elapsed if done > 1 else 0.0
+        info = {
+            "tokens_done":    done,
+            "tokens_total":   self.total,
+            "tokens_per_sec": round(rate, 2),
+            "eta_sec":        round((self.total - done) / rate, 1) if rate > 0 else None,
+        }
+        self.last = info
+        for cb in self.callbacks:
+            try:
+                cb(info)
+            except Exception:
+                pass
+
+
+class CancelCriteria(StoppingCriteria):
+    """
+    Aborts model.generate() after the current decoding step once every
+    token has been cancelled (a batch keeps running for its other jobs).
+
+    It raises GenerationCancelled rather than returning True: MusicGen's
+    delay-pattern post-processing assumes the full max_new_tokens, and a
+    cancelled run has no use for the EnCodec decode anyway.
+    """
+
+    def __init__(self, tokens):
+        self.tokens = list(tokens)
+
+    def __call__(self, input_ids: torch.LongTensor, scores=None, **kwargs) -> bool:
+        if all(t.cancelled for t in self.tokens):
+            raise GenerationCancelled(self.tokens[0].reason)
+        return False
+
+
+# ═══════════════════════════════════════════════════════════════════
+# ENCODEC CODES
+# ═══════════════════════════════════════════════════════════════════
+
+class CodesRecorder(StoppingCriteria):
+    """
+    Keeps the decoder input_ids of the latest step so the EnCodec codes can
+    be read back after model.generate(), which only returns decoded audio.
+    Row b·K + k holds codebook k of batch row b with MusicGen's delay
+    pattern: frame t of codebook k sits at position 1 + k + t (0 is the
+    start token). Holding the reference costs nothing; it never stops.
+    """
+
+    def __init__(self, num_codebooks: int):
+        self.num_codebooks = int(num_codebooks)
+        self.input_ids: torch.LongTensor | None = None
+
+    def __call__(self, input_ids: torch.LongTensor, scores=None, **kwargs) -> bool:
+        self.input_ids = input_ids
+        return False
+
+    def codes(self, row: int = 0, frames: int | None = None) -> np.ndarray:
+        """int16 [codebooks, frames] codes of batch `row`, delay pattern undone."""
+        k_all = self.num_codebooks
+        ids   = self.input_ids[row * k_all:(row + 1) * k_all]
+        if frames is None:
+            frames = ids.shape[-1] - k_all
+        return np.stack([ids[k, 1 + k:1 + k + frames].cpu().numpy()
+                         for k in range(k_all)]).astype(np.int16)
+
+
+def save_codes(wav_path, codes: np.ndarray) -> Path:
+    """Store a WAV's EnCodec codes next to it (≈ 0.4 KB per second of audio)."""
+    from audio_writer import temp_path
+    path = codes_path(wav_path)
+    tmp  = temp_path(path)
+    try:
+        with open(tmp, "wb") as f:            # replaced, not written through a shared link
+            np.save(f, np.ascontiguousarray(codes, dtype=np.int16))
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return path
+
+
+def load_codes(wav_path, num_codebooks: int) -> np.ndarray | None:
+    """The WAV's stored [codebooks, frames] codes, or None when there are none
+    (or they don't fit this model)."""
+    path = codes_path(wav_path)
+    try:
+        codes = np.load(path)
+    except (OSError, ValueError):
+        return None
+    if codes.ndim != 2 or codes.shape[0] != num_codebooks or not codes.shape[1]:
+        return None
+    return codes
+
+
+# ═══════════════════════════════════════════════════════════════════
+# STREAMING
+# ═══════════════════════════════════════════════════════════════════
+
+class AudioStreamer(StoppingCriteria):
+    """
+    Decodes audio while model.generate() is still running (batch size 1).
+
+    Passed in stopping_criteria rather than as `streamer=`: a stopping
+    criterion sees the full decoder input_ids after every step on every
+    transformers version, and never stops generation itself.
+
+    MusicGen emits one token per codebook per step with a delay pattern
+    (codebook k lags k steps), so a frame is complete once the last
+    codebook has produced it. Every `play_frames` complete frames the
+    streamer decodes a window of codes and queues the new samples.
+
+    The window is `context_frames` of already-played codes (left context
+    for the decoder) + the new frames + `lookahead_frames` held back until
+    the next window (right context). Older codes are dropped, so both
+    memory and per-chunk decode cost stay constant for any length.
+    """
+
+    def __init__(self, model, play_frames: int = 50, context_frames: int = 25,
+                 lookahead_frames: int = 5):
+        self.audio_encoder    = model.audio_encoder
+        self.num_codebooks    = model.decoder.num_codebooks
+        self.sample_rate      = model.config.audio_encoder.sampling_rate
+        self.hop              = int(np.prod(model.config.audio_encoder.upsampling_ratios))
+        self.play_frames      = max(1, int(play_frames))
+        self.context_frames   = max(0, int(context_frames))
+        self.lookahead_frames = max(0, int(lookahead_frames))
+
+        self._codes   = [[] for _ in range(self.num_codebooks)]  # trimmed per-codebook frames
+        self._offset  = 0      # absolute frame index of self._codes[k][0]
+        self._emitted = 0      # absolute frames already sent
+        self._step    = 0      # decoder positions consumed (incl. start token)
+        self._done    = False
+        self.error: BaseException | None = None
+        self.audio_queue: queue.Queue = queue.Queue()
+
+    # ── Called by generate() after every decoding step ────────────
+    def __call__(self, input_ids: torch.LongTensor, scores=None, **kwargs) -> bool:
+        if input_ids.shape[0] != self.num_codebooks:
+            raise ValueError("AudioStreamer only supports batch size 1")
+        for col in input_ids[:, self._step:].t().tolist():
+            for k, tok in enumerate(col):
+                if self._step - 1 - k == self._offset + len(self._codes[k]):
+                    self._codes[k].append(tok)
+            self._step += 1
+
+        ready = self._complete() - self.lookahead_frames
+        if ready - self._emitted >= self.play_frames:
+            self._emit(ready)
+        return False
+
+    def end(self):
+        """Flush the remaining frames and close the stream."""
+        self._emit(self._complete())
+        self.finish()
+
+    # ── Consumer side ─────────────────────────────────────────────
+    def finish(self, error: BaseException | None = None):
+        """Close the stream (also on failure, so consumers never hang)."""
+        if self._done:
+            return
+        self._done = True
+        self.error = error
+        self.audio_queue.put(None)
+
+    def chunks(self, timeout: float | None = None):
+        """Yield float32 numpy chunks until generation ends; re-raise its error."""
+        while True:
+            chunk = self.audio_queue.get(timeout=timeout)
+            if chunk is None:
+                break
+            yield chunk
+        if self.error is not None:
+            raise self.error
+
+    # ── Internals ─────────────────────────────────────────────────
+    def _complete(self) -> int:
+        return self._offset + min(len(c) for c in self._codes)
+
+    def _emit(self, upto: int):
+        if upto <= self._emitted:
+            return
+        start = max(self._offset, self._emitted - self.context_frames)
+        end   = self._complete()
+        codes = torch.tensor(
+            [c[start - self._offset:end - self._offset] for c in self._codes],
+            dtype=torch.long, device=self.audio_encoder.device,
+        )[None, None]                                   # [frames=1, batch=1, codebooks, T]
+        with torch.inference_mode():
+            audio = self.audio_encoder.decode(codes, audio_scales=[None]).audio_values
+        audio = audio[0, 0].float().cpu().numpy()
+        self.audio_queue.put(audio[(self._emitted - start) * self.hop:(upto - start) * self.hop])
+        self._emitted = upto
+
+        drop = self._emitted - self.context_frames - self._offset
+        if drop > 0:
+            self._codes  = [c[drop:] for c in self._codes]
+            self._offset += drop
+
+
+def stream_generate(processor, model, device: str, dtype: torch.dtype,
+                    prompt: str, max_new_tokens: int, streamer: AudioStreamer,
+                    encoder_cache=None, cancel: CancelToken | None = None,
+                    codes_for=None):
+    """Run one generate() feeding `streamer`; always closes the stream.
+    Stops at the next decoding step once `cancel` fires. With codes_for
+    (a WAV path) the EnCodec codes are saved next to it."""
+    try:
+        inputs   = _text_inputs(processor, device, [prompt], encoder_cache)
+        criteria = StoppingCriteriaList([streamer])
+        if cancel is not None:
+            criteria.append(CancelCriteria([cancel]))
+        recorder = CodesRecorder(model.decoder.num_codebooks)
+        if codes_for is not None:
+            criteria.append(recorder)
+        with torch.inference_mode():
+            with autocast(device, dtype):
+                model.generate(**inputs, max_new_tokens=max_new_tokens,
+                               stopping_criteria=criteria)
+        if codes_for is not None:
+            save_codes(codes_for, recorder.codes())
+        streamer.end()
+    except BaseException as e:
+        streamer.finish(e)
+        raise
+
+
+def wav_stream_header(sample_rate: int, channels: int = 1, bits: int = 16) -> bytes:
+    """RIFF/WAVE header for a PCM stream of unknown length (sizes set to max)."""
+    block = channels * bits // 8
+    return (b"RIFF" + struct.pack("<I", 0xFFFFFFFF) + b"WAVE"
+            + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sample_rate,
+                                    sample_rate * block, block, bits)
+            + b"data" + struct.pack("<I", 0xFFFFFFFF))
+
+
+def to_pcm16(chunk: np.ndarray) -> bytes:
+    return (np.clip(chunk, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+
+def to_opus(audio: np.ndarray, sample_rate: int, opus_sr: int = 48000) -> bytes:
+    """Mono float audio → Ogg Opus bytes. Opus only takes 8/12/16/24/48 kHz,
+    so MusicGen's 32 kHz is resampled to 48 kHz first."""
+    import io, soundfile as sf
+    from scipy.signal import resample_poly
+    if sample_rate != opus_sr:
+        g = math.gcd(int(sample_rate), opus_sr)
+        audio = resample_poly(audio, opus_sr // g, int(sample_rate) // g).astype(np.float32)
+    buf = io.BytesIO()
+    sf.write(buf, np.clip(audio, -1.0, 1.0), opus_sr, format="OGG", subtype="OPUS")
+    return buf.getvalue()
@@ -0,0 +1,238 @@
+"""
+job_manager.py — Bounded background jobs with progress state
+=============================================================
+Replaces one-thread-per-request + an unbounded progress dict:
+
+  - a fixed pool of worker threads
+  - a bounded queue (submit() raises JobQueueFull when it is full)
+  - finished jobs are evicted `ttl_sec` after they finish, whether or
+    not anyone read the final state
+  - every job records created / started / finished times
+  - subscribe() pushes change notifications, so readers (SSE) need not poll
+  - cancel() drops a queued job at once and fires the CancelToken of a
+    running one; the job's code checks it (e.g. between decoding steps)
+
+State lives in a JobStore (job_store.py): in memory, or in Redis so that
+any uvicorn worker / host can answer get() and subscribe() for any job.
+
+    jobs = JobManager(workers=4, max_queue=64, ttl_sec=600)
+    job_id = jobs.submit(lambda update: {"url": ...})   # update(pct=…, …)
+    jobs.get(job_id) → {"status": "queued" | "running" | "done" | "error" | "cancelled", …}
+
+Used by api_server.py for /generate/tracked and /sse/progress.
+"""
+
+from __future__ import annotations
+import queue, threading, time, uuid
+
+from job_store import JobStore, MemoryJobStore
+
+
+FINAL_STATES = ("done", "error", "cancelled")
+
+
+class JobQueueFull(Exception):
+    """Raised by submit() when max_queue jobs are already waiting."""
+
+
+class GenerationCancelled(Exception):
+    """Raised by (or set on the future of) work whose CancelToken fired."""
+
+
+class CancelToken:
+    """Thread-safe cancellation flag, polled by the running work."""
+
+    def __init__(self):
+        self._event     = threading.Event()
+        self._lock      = threading.Lock()
+        self._callbacks = []
+        self.reason: str | None = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled"):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def on_cancel(self, callback):
+        """Call callback() once when cancelled (now, if it already is)."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise GenerationCancelled(self.reason)
+
+
+class JobManager:
+    """Fixed worker pool running fn(update) jobs, with TTL-evicted state."""
+
+    def __init__(self, workers: int = 4, max_queue: int = 64, ttl_sec: float = 600.0,
+                 store: JobStore | None = None):
+        self.workers   = max(1, int(workers))
+        self.max_queue = max(1, int(max_queue))
+        self.store     = store if store is not None else MemoryJobStore(ttl_sec)
+        self.ttl_sec   = self.store.ttl_sec
+        self._queue: queue.Queue = queue.Queue(maxsize=self.max_queue)
+        self._lock  = threading.Lock()
+        self._tokens: dict[str, CancelToken] = {}     # queued / running jobs of this process
+        self._stats = {"submitted": 0, "rejected": 0, "done": 0, "errors": 0,
+                       "cancelled": 0, "running": 0}
+        self._threads = [threading.Thread(target=self._loop, name=f"job-worker-{i}", daemon=True)
+                         for i in range(self.workers)]
+        for t in self._threads:
+            t.start()
+
+    # ── Public API ────────────────────────────────────────────────
+    def submit(self, fn, job_id: str | None = None, cancel: CancelToken | None = None,
+               **fields) -> str:
+        """Queue fn(update) and return its job id. update(**fields) merges
+        progress into the job state; fn's return dict is merged on success.
+        cancel() fires `cancel`; fn should stop by raising GenerationCancelled."""
+        job_id = job_id or str(uuid.uuid4())
+        token  = cancel if cancel is not None else CancelToken()
+        if self._queue.full():
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise JobQueueFull(f"{self.max_queue} jobs already queued")
+        self.track(job_id, **fields)
+        with self._lock:
+            self._tokens[job_id] = token
+        try:
+            self._queue.put_nowait((job_id, fn, token))
+        except queue.Full:
+            self.store.update(job_id, {"status": "error", "error": "queue full",
+                                       "finished_at": time.time()})
+            with self._lock:
+                self._tokens.pop(job_id, None)
+                self._stats["rejected"] += 1
+            raise JobQueueFull(f"{self.max_queue} jobs already queued")
+        with self._lock:
+            self._stats["submitted"] += 1
+        return job_id
+
+    def track(self, job_id: str, **fields):
+        """Register a job that runs elsewhere (e.g. a Celery task) so that
+        get() / subscribe() work for it; the runner then reports through the store."""
+        self.store.put(job_id, {"status": "queued", "pct": 0, "error": None, **fields,
+                                "created_at": time.time(), "started_at": None,
+                                "finished_at": None})
+
+    def update(self, job_id: str, **fields):
+        self.store.update(job_id, fields)
+        if self.store.backend != "memory":
+            # cancel() may have run in another process: it can only flag the shared state
+            with self._lock:
+                token = self._tokens.get(job_id)
+            if token is not None and not token.cancelled:
+                job = self.store.get(job_id) or {}
+                if job.get("cancel_requested"):
+                    token.cancel(job.get("error") or "cancelled")
+
+    def cancel(self, job_id: str, reason: str = "cancelled") -> str | None:
+        """Cancel a job. Returns its new status: "cancelled" (it never started),
+        "cancelling" (it stops at its next check), the final status when it
+        had already finished, or None for an unknown job."""
+        with self._lock:
+            token = self._tokens.get(job_id)
+        job = self.store.get(job_id)
+        if job is None and token is None:
+            return None
+        if job is not None and job.get("status") in FINAL_STATES:
+            return job["status"]
+        if token is not None:
+            token.cancel(reason)
+        if job is not None and job.get("status") == "queued":
+            self.update(job_id, status="cancelled", error=reason, cancel_requested=True,
+                        finished_at=time.time())
+            return "cancelled"
+        self.update(job_id, cancel_requested=True, error=reason)
+        return "cancelling"
+
+    def watch(self, job_id: str):
+        """A client connection (SSE, WebSocket) started following job_id."""
+        self.store.watch(job_id)
+
+    def unwatch(self, job_id: str):
+        self.store.unwatch(job_id)
+
+    def listeners(self, job_id: str) -> int:
+        """Client connections following job_id, in every process sharing the store."""
+        return self.store.watchers(job_id)
+
+    def subscribe(self, job_id: str, callback):
+        """Call callback() after every change to job_id (from any process when the
+        store is shared). Returns an unsubscribe function."""
+        return self.store.subscribe(job_id, callback)
+
+    def get(self, job_id: str) -> dict | None:
+        """Snapshot of a job's state plus queue_sec / run_sec, or None if unknown/evicted."""
+        job = self.store.get(job_id)
+        return self._view(job) if job is not None else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+        s["store"]     = self.store.stats()
+        s["queued"]    = self._queue.qsize()
+        s["workers"]   = self.workers
+        s["max_queue"] = self.max_queue
+        return s
+
+    # ── Internals ─────────────────────────────────────────────────
+    @staticmethod
+    def _view(job: dict) -> dict:
+        v, now = dict(job), time.time()
+        created  = job.get("created_at") or now
+        started  = job.get("started_at")
+        finished = job.get("finished_at")
+        v["queue_sec"] = round((started or now) - created, 3)
+        v["run_sec"]   = round((finished or now) - started, 3) if started else None
+        return v
+
+    def _loop(self):
+        while True:
+            job_id, fn, token = self._queue.get()
+            job = self.store.get(job_id) or {}
+            if token.cancelled or job.get("cancel_requested"):
+                if job.get("status") != "cancelled":
+                    self.update(job_id, status="cancelled", error=token.reason or job.get("error"),
+                                finished_at=time.time())
+                with self._lock:
+                    self._tokens.pop(job_id, None)
+                    self._stats["cancelled"] += 1
+                self._queue.task_done()
+                continue
+            with self._lock:
+                self._stats["running"] += 1
+            self.update(job_id, status="running", started_at=time.time())
+            try:
+                result = fn(lambda **fields: self.update(job_id, **fields)) or {}
+                self.update(job_id, **result, status="done", pct=100, finished_at=time.time())
+                key = "done"
+            except GenerationCancelled as e:
+                self.update(job_id, status="cancelled", error=str(e) or token.reason,
+                            finished_at=time.time())
+                key = "cancelled"
+            except Exception as e:
+                self.update(job_id, status="error", error=str(e), finished_at=time.time())
+                key = "errors"
+            with self._lock:
+                self._tokens.pop(job_id, None)
+                self._stats[key]      += 1
+                self._stats["running"] -= 1
+            self._queue.task_done()
@@ -0,0 +1,282 @@
+"""
+job_store.py — Where job / progress state lives
+================================================
+JobManager (tracked generations) and the Celery worker write job state
+here; /sse/progress reads it and subscribes to changes.
+
+  MemoryJobStore — one process only (dev, single uvicorn worker)
+  RedisJobStore  — Redis hash per job + pub/sub change events, so any
+                   uvicorn worker or host can serve a job's SSE stream
+
+Pick with JOB_STORE=memory|redis (JOB_STORE_URL for Redis). RedisJobStore
+takes any redis-py compatible client, e.g. fakeredis.FakeRedis() in tests.
+"""
+
+from __future__ import annotations
+import json, os, threading, time
+
+JOB_STORE     = os.getenv("JOB_STORE", "memory").lower()
+JOB_STORE_URL = os.getenv("JOB_STORE_URL", "redis://localhost:6379/2")
+
+
+class JobStore:
+    """
+    Common subscribe() bookkeeping. Backends implement put / update / get
+    and the watcher count.
+      put(job_id, fields)    create or merge, then notify subscribers
+      update(job_id, fields) merge into an existing job only (no-op once evicted)
+      watch / unwatch(id)    +1 / -1 open client connections (SSE, WebSocket)
+                             following job_id, shared like the job state —
+                             unlike subscribe(), which is per process
+    A job whose fields contain finished_at expires ttl_sec after that.
+    """
+
+    backend = "base"
+
+    def __init__(self, ttl_sec: float = 600.0):
+        self.ttl_sec = float(ttl_sec)
+        self._listeners: dict[str, list] = {}    # job_id → [callback()]
+        self._listen_lock = threading.Lock()
+
+    def subscribe(self, job_id: str, callback):
+        """Call callback() — from a store or worker thread — after every change
+        to job_id. Returns an unsubscribe function."""
+        with self._listen_lock:
+            self._listeners.setdefault(job_id, []).append(callback)
+
+        def unsubscribe():
+            with self._listen_lock:
+                callbacks = self._listeners.get(job_id, [])
+                if callback in callbacks:
+                    callbacks.remove(callback)
+                if not callbacks:
+                    self._listeners.pop(job_id, None)
+        return unsubscribe
+
+    def listener_count(self, job_id: str | None = None) -> int:
+        """Local subscribers of job_id, or of every job."""
+        with self._listen_lock:
+            if job_id is not None:
+                return len(self._listeners.get(job_id, ()))
+            return sum(len(v) for v in self._listeners.values())
+
+    def _notify(self, job_id: str):
+        with self._listen_lock:
+            callbacks = list(self._listeners.get(job_id, ()))
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def stats(self) -> dict:
+        return {"backend": self.backend, "listeners": self.listener_count(),
+                "ttl_sec": self.ttl_sec}
+
+
+# ═══════════════════════════════════════════════════════════════════
+# IN-MEMORY
+# ═══════════════════════════════════════════════════════════════════
+
+class MemoryJobStore(JobStore):
+    backend = "memory"
+
+    def __init__(self, ttl_sec: float = 600.0):
+        super().__init__(ttl_sec)
+        self._jobs: dict[str, dict] = {}
+        self._watchers: dict[str, int] = {}
+        self._lock   = threading.Lock()
+        self.evicted = 0
+
+    def put(self, job_id: str, fields: dict):
+        with self._lock:
+            self._evict(time.time())
+            self._jobs.setdefault(job_id, {}).update(fields)
+        self._notify(job_id)
+
+    def update(self, job_id: str, fields: dict):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.update(fields)
+        self._notify(job_id)
+
+    def watch(self, job_id: str) -> int:
+        with self._lock:
+            self._watchers[job_id] = self._watchers.get(job_id, 0) + 1
+            return self._watchers[job_id]
+
+    def unwatch(self, job_id: str) -> int:
+        with self._lock:
+            n = self._watchers.get(job_id, 0) - 1
+            if n > 0:
+                self._watchers[job_id] = n
+            else:
+                self._watchers.pop(job_id, None)
+            return max(n, 0)
+
+    def watchers(self, job_id: str) -> int:
+        with self._lock:
+            return self._watchers.get(job_id, 0)
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            self._evict(time.time())
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = {"jobs": len(self._jobs), "evicted": self.evicted}
+        return {**super().stats(), **s}
+
+    def _evict(self, now: float):
+        """Drop finished jobs older than ttl_sec. Call with _lock held."""
+        expired = [jid for jid, j in self._jobs.items()
+                   if j.get("finished_at") is not None and now - j["finished_at"] > self.ttl_sec]
+        for jid in expired:
+            del self._jobs[jid]
+        self.evicted += len(expired)
+
+
+# ═══════════════════════════════════════════════════════════════════
+# REDIS  (hash + pub/sub)
+# ═══════════════════════════════════════════════════════════════════
+
+class RedisJobStore(JobStore):
+    """
+    <prefix>:job:<id>       hash, one JSON-encoded value per field
+    <prefix>:events:<id>    channel, one message per change
+    <prefix>:watchers:<id>  counter of open client connections, any process
+    Unfinished jobs expire after max_age_sec without updates, as a safety
+    net (a crashed worker never writes finished_at). The watcher counter
+    gets the same TTL, so a count left behind by a crashed process only
+    keeps its job from being auto-cancelled until then.
+    """
+
+    backend = "redis"
+
+    def __init__(self, client=None, url: str = JOB_STORE_URL, prefix: str = "beatflow",
+                 ttl_sec: float = 600.0, max_age_sec: float = 86400.0):
+        super().__init__(ttl_sec)
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self._r          = client
+        self.prefix      = prefix
+        self.max_age_sec = int(max_age_sec)
+        self._thread     = None
+        self._stopped    = threading.Event()
+
+    def _key(self, job_id: str) -> str:
+        return f"{self.prefix}:job:{job_id}"
+
+    def _channel(self, job_id: str) -> str:
+        return f"{self.prefix}:events:{job_id}"
+
+    def _watch_key(self, job_id: str) -> str:
+        return f"{self.prefix}:watchers:{job_id}"
+
+    def put(self, job_id: str, fields: dict):
+        pipe = self._r.pipeline()
+        self._write(pipe, job_id, fields)
+        pipe.execute()
+
+    def update(self, job_id: str, fields: dict):
+        """WATCH / MULTI: an expiry or delete between the EXISTS check and
+        the write aborts and retries it, so no partial record is re-created."""
+        key = self._key(job_id)
+
+        def merge(pipe):
+            if pipe.exists(key):
+                pipe.multi()
+                self._write(pipe, job_id, fields)
+
+        self._r.transaction(merge, key)
+
+    def watch(self, job_id: str) -> int:
+        key  = self._watch_key(job_id)
+        pipe = self._r.pipeline()
+        pipe.incr(key)
+        pipe.expire(key, self.max_age_sec)
+        return int(pipe.execute()[0])
+
+    def unwatch(self, job_id: str) -> int:
+        """Decrement, dropping the key at zero (WATCH / MULTI, like update(),
+        so a concurrent watch() is never deleted and the count never goes
+        negative after the key expired)."""
+        key = self._watch_key(job_id)
+        left = []
+
+        def decrement(pipe):
+            n = int(pipe.get(key) or 0) - 1
+            left[:] = [max(n, 0)]
+            pipe.multi()
+            if n > 0:
+                pipe.decr(key)
+            else:
+                pipe.delete(key)
+
+        self._r.transaction(decrement, key)
+        return left[0]
+
+    def watchers(self, job_id: str) -> int:
+        return max(int(self._r.get(self._watch_key(job_id)) or 0), 0)
+
+    def _write(self, pipe, job_id: str, fields: dict):
+        """Queue the merge, its expiry and the change event on pipe."""
+        key = self._key(job_id)
+        pipe.hset(key, mapping={k: json.dumps(v) for k, v in fields.items()})
+        if fields.get("finished_at") is not None:
+            pipe.expire(key, max(1, int(self.ttl_sec)))
+        else:
+            pipe.expire(key, self.max_age_sec)
+        pipe.publish(self._channel(job_id), "1")
+
+    def get(self, job_id: str) -> dict | None:
+        raw = self._r.hgetall(self._key(job_id))
+        if not raw:
+            return None
+        return {(k.decode() if isinstance(k, bytes) else k): json.loads(v) for k, v in raw.items()}
+
+    def subscribe(self, job_id: str, callback):
+        unsubscribe = super().subscribe(job_id, callback)
+        self._ensure_listener()
+        return unsubscribe
+
+    def close(self):
+        self._stopped.set()
+
+    def _ensure_listener(self):
+        with self._listen_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._listen, name="job-store-pubsub",
+                                                daemon=True)
+                self._thread.start()
+
+    def _listen(self):
+        """One pattern subscription per process, fanned out to local callbacks."""
+        events = f"{self.prefix}:events:"
+        while not self._stopped.is_set():
+            try:
+                ps = self._r.pubsub(ignore_subscribe_messages=True)
+                ps.psubscribe(events + "*")
+                while not self._stopped.is_set():
+                    msg = ps.get_message(timeout=1.0)
+                    if msg and msg.get("type") == "pmessage":
+                        channel = msg["channel"]
+                        if isinstance(channel, bytes):
+                            channel = channel.decode()
+                        self._notify(channel[len(events):])
+                ps.close()
+            except Exception as e:
+                print(f"[WARN] Job store pub/sub lost ({type(e).__name__}: {e}), reconnecting")
+                self._stopped.wait(1.0)
+
+
+def make_job_store(ttl_sec: float = 600.0, backend: str = JOB_STORE) -> JobStore:
+    """JobStore chosen by JOB_STORE (memory | redis)."""
+    if backend == "redis":
+        return RedisJobStore(url=JOB_STORE_URL, ttl_sec=ttl_sec)
+    return MemoryJobStore(ttl_sec=ttl_sec)
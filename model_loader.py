@@ -0,0 +1,71 @@
+"""
+model_loader.py — MusicGen loading with optional CPU precision modes
+=====================================================================
+CUDA always runs fp16. On CPU the mode is chosen by MUSICGEN_CPU_MODE:
+  fp32 — default, full precision
+  int8 — dynamic int8 quantization of the decoder's nn.Linear layers
+         (weights int8, activations quantized on the fly per batch)
+  bf16 — fp32 weights with bf16 autocast; only on CPUs with native bf16
+         (AVX512-BF16 / AMX), falls back to fp32 elsewhere
+
+Used by api_server.py and celery_worker.py.
+"""
+
+from __future__ import annotations
+import os
+import torch
+
+CPU_MODES = ("fp32", "int8", "bf16")
+CPU_MODE  = os.getenv("MUSICGEN_CPU_MODE", "fp32").lower()
+
+
+def cpu_bf16_supported() -> bool:
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except Exception:
+        return False
+
+
+def autocast(device: str, dtype: torch.dtype):
+    """Autocast for generate(): fp16 on CUDA, bf16 on CPU in bf16 mode, else off."""
+    return torch.autocast(device_type=device, dtype=dtype,
+                          enabled=(device == "cuda" or dtype == torch.bfloat16))
+
+
+def quantize_decoder_int8(model):
+    """Swap the decoder's Linear layers for dynamically quantized int8 ones (CPU only).
+    The T5 text encoder and EnCodec stay fp32: they run once per request."""
+    model.decoder = torch.ao.quantization.quantize_dynamic(
+        model.decoder, {torch.nn.Linear}, dtype=torch.qint8
+    )
+    return model
+
+
+def load_musicgen(model_name: str, device: str, cpu_mode: str = CPU_MODE, model_cls=None):
+    """
+    Load processor + model for device in the requested precision.
+    Returns (processor, model, dtype, precision) where dtype is the one to
+    pass to autocast() and precision is "fp16" | "fp32" | "int8" | "bf16".
+    The precision is also stored on model.precision (part of cache keys).
+    """
+    from transformers import AutoProcessor
+    if model_cls is None:
+        from transformers import MusicgenForConditionalGeneration as model_cls
+
+    if device == "cuda":
+        precision, weights, dtype = "fp16", torch.float16, torch.float16
+    else:
+        precision = cpu_mode if cpu_mode in CPU_MODES else "fp32"
+        if precision == "bf16" and not cpu_bf16_supported():
+            print("[WARN] CPU has no native bf16 support — using fp32")
+            precision = "fp32"
+        weights = torch.float32
+        dtype   = torch.bfloat16 if precision == "bf16" else torch.float32
+
+    processor = AutoProcessor.from_pretrained(model_name)
+    model     = model_cls.from_pretrained(model_name, torch_dtype=weights).to(device)
+    model.eval()
+    if precision == "int8":
+        quantize_decoder_int8(model)
+    model.precision = precision
+    return processor, model, dtype, precision
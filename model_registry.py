@@ -0,0 +1,228 @@
+"""
+model_registry.py — On-demand MusicGen variants under a RAM budget
+===================================================================
+Variants (small / medium / melody) are loaded the first time they are
+needed and kept resident afterwards. The registry tracks resident memory
+per model (tensor bytes, plus the RSS growth seen while loading) and
+when the total is over MODEL_RAM_BUDGET_MB it unloads the least recently
+used idle models. Pinned models (the default model the batch scheduler
+runs on) and models currently in use are never evicted.
+
+    registry = ModelRegistry("cpu", budget_bytes=8 << 30)
+    base = registry.get("small", pin=True)
+    with registry.acquire("melody") as m:
+        m.model.generate(...)
+"""
+
+from __future__ import annotations
+import gc, os, threading, time
+from contextlib import contextmanager
+
+import torch
+
+from model_loader import CPU_MODE, load_musicgen
+
+# name → (Hugging Face id, model class)
+MODEL_VARIANTS: dict[str, tuple[str, str]] = {
+    "small":  ("facebook/musicgen-small",  "musicgen"),
+    "medium": ("facebook/musicgen-medium", "musicgen"),
+    "melody": ("facebook/musicgen-melody", "melody"),
+}
+
+MODEL_RAM_BUDGET_MB = int(os.getenv("MODEL_RAM_BUDGET_MB", "8192"))
+
+
+def _model_cls(kind: str):
+    if kind == "melody":
+        from transformers import MusicgenMelodyForConditionalGeneration
+        return MusicgenMelodyForConditionalGeneration
+    from transformers import MusicgenForConditionalGeneration
+    return MusicgenForConditionalGeneration
+
+
+def _rss_bytes() -> int:
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except Exception:
+        return 0
+
+
+def model_nbytes(model) -> int:
+    """Bytes held by the model's tensors, including int8-packed Linear weights."""
+    def size(v) -> int:
+        if isinstance(v, torch.Tensor):
+            return v.nelement() * v.element_size()
+        if isinstance(v, (tuple, list)):
+            return sum(size(x) for x in v)
+        return 0
+    return sum(size(v) for v in model.state_dict().values())
+
+
+class LoadedModel:
+    """One resident variant plus its bookkeeping."""
+
+    def __init__(self, name: str, hf_id: str, processor, model, dtype, precision,
+                 nbytes: int, rss_delta: int, load_sec: float):
+        self.name      = name
+        self.hf_id     = hf_id
+        self.processor = processor
+        self.model     = model
+        self.dtype     = dtype
+        self.precision = precision
+        self.nbytes    = nbytes
+        self.rss_delta = rss_delta
+        self.load_sec  = load_sec
+        self.pinned    = False
+        self.in_use    = 0
+        self.uses      = 0
+        self.loaded_at = self.last_used = time.time()
+
+    def info(self) -> dict:
+        return {
+            "hf_id":     self.hf_id,
+            "precision": self.precision,
+            "bytes":     self.nbytes,
+            "rss_delta": self.rss_delta,
+            "load_sec":  round(self.load_sec, 2),
+            "pinned":    self.pinned,
+            "in_use":    self.in_use,
+            "uses":      self.uses,
+            "idle_sec":  round(time.time() - self.last_used, 1),
+        }
+
+
+class ModelRegistry:
+    """Thread-safe LRU of loaded MusicGen variants bounded by budget_bytes."""
+
+    def __init__(self, device: str, budget_bytes: int = MODEL_RAM_BUDGET_MB << 20,
+                 cpu_mode: str = CPU_MODE, variants: dict | None = None):
+        self.device       = device
+        self.budget_bytes = int(budget_bytes)
+        self.cpu_mode     = cpu_mode
+        self.variants     = dict(variants or MODEL_VARIANTS)
+        self._loaded: dict[str, LoadedModel] = {}
+        self._lock        = threading.Lock()
+        self._load_locks  = {name: threading.Lock() for name in self.variants}
+        self.loads = self.evictions = 0
+
+    # ── Public API ────────────────────────────────────────────────
+    def get(self, name: str, pin: bool = False) -> LoadedModel:
+        """Return the resident model, loading it first if needed.
+        Pinned models stay resident for the life of the process."""
+        return self._get(name, pin=pin)
+
+    @contextmanager
+    def acquire(self, name: str):
+        """get() for the duration of a with-block; the model can't be evicted meanwhile."""
+        entry = self._get(name, hold=True)
+        try:
+            yield entry
+        finally:
+            with self._lock:
+                entry.in_use   -= 1
+                entry.uses     += 1
+                entry.last_used = time.time()
+                evicted = self._evict()           # budget may have been overrun while busy
+            if evicted:
+                self._release_memory()
+
+    def unload(self, name: str) -> bool:
+        """Drop an idle, unpinned model. Returns False if it is pinned, busy or not loaded."""
+        with self._lock:
+            entry = self._loaded.get(name)
+            if entry is None or entry.pinned or entry.in_use:
+                return False
+            self._drop(name)
+        self._release_memory()
+        return True
+
+    def resident_bytes(self) -> int:
+        with self._lock:
+            return sum(e.nbytes for e in self._loaded.values())
+
+    def stats(self) -> dict:
+        with self._lock:
+            resident = sum(e.nbytes for e in self._loaded.values())
+            return {
+                "device":         self.device,
+                "budget_bytes":   self.budget_bytes,
+                "resident_bytes": resident,
+                "loads":          self.loads,
+                "evictions":      self.evictions,
+                "available":      list(self.variants),
+                "loaded":         {n: e.info() for n, e in self._loaded.items()},
+            }
+
+    # ── Internals ─────────────────────────────────────────────────
+    def _get(self, name: str, pin: bool = False, hold: bool = False) -> LoadedModel:
+        if name not in self.variants:
+            raise KeyError(f"Unknown model '{name}' (choose from {', '.join(self.variants)})")
+        with self._lock:
+            entry = self._loaded.get(name)
+        if entry is None:
+            with self._load_locks[name]:          # one loader per variant
+                with self._lock:
+                    entry = self._loaded.get(name)
+                if entry is None:
+                    entry = self._load(name)
+        with self._lock:
+            if name not in self._loaded:          # evicted just after loading: still alive, re-register
+                self._loaded[name] = entry
+            entry.pinned    = entry.pinned or pin
+            entry.in_use   += int(hold)
+            entry.last_used = time.time()
+        return entry
+
+    def _load(self, name: str) -> LoadedModel:
+        hf_id, kind = self.variants[name]
+        print(f"[..] Loading {hf_id}...")
+        rss0, t0 = _rss_bytes(), time.time()
+        processor, model, dtype, precision = load_musicgen(
+            hf_id, self.device, cpu_mode=self.cpu_mode, model_cls=_model_cls(kind)
+        )
+        entry = LoadedModel(name, hf_id, processor, model, dtype, precision,
+                            nbytes=model_nbytes(model),
+                            rss_delta=max(_rss_bytes() - rss0, 0),
+                            load_sec=time.time() - t0)
+        with self._lock:
+            self._loaded[name] = entry
+            entry.in_use += 1                     # not evictable by its own load
+            self.loads   += 1
+            evicted = self._evict()
+            entry.in_use -= 1
+            over = sum(e.nbytes for e in self._loaded.values()) - self.budget_bytes
+        if evicted:
+            self._release_memory()
+        print(f"[OK] {hf_id} ready on {self.device} ({precision}, "
+              f"{entry.nbytes / 1e6:.0f} MB, {entry.load_sec:.1f}s)"
+              + (f" — evicted {', '.join(evicted)}" if evicted else ""))
+        if over > 0:
+            print(f"[WARN] Model RAM budget exceeded by {over / 1e6:.0f} MB "
+                  f"(remaining models are pinned or busy)")
+        return entry
+
+    def _evict(self) -> list[str]:
+        """Unload idle, unpinned models, least recently used first, until within
+        budget. Call with _lock held."""
+        evicted = []
+        total = sum(e.nbytes for e in self._loaded.values())
+        idle  = sorted((e for e in self._loaded.values() if not e.pinned and not e.in_use),
+                       key=lambda e: e.last_used)
+        for entry in idle:
+            if total <= self.budget_bytes:
+                break
+            total -= entry.nbytes
+            self._drop(entry.name)
+            self.evictions += 1
+            evicted.append(entry.name)
+        return evicted
+
+    def _drop(self, name: str):
+        entry = self._loaded.pop(name)
+        print(f"[..] Unloaded {entry.hf_id} (freed ~{entry.nbytes / 1e6:.0f} MB)")
+
+    def _release_memory(self):
+        gc.collect()
+        if self.device == "cuda":
+            torch.cuda.empty_cache()
@@ -10,6 +10,22 @@ test_files = [
     'test_musicgen_05_performance_monitoring.py',
     'test_musicgen_06_model_variants.py',
     'test_musicgen_07_audio_quality_analysis.py',
+    'test_musicgen_08_micro_batching.py',
+    'test_musicgen_09_encoder_cache.py',
+    'test_musicgen_10_quantized_cpu.py',
+    'test_musicgen_11_thread_budget.py',
+    'test_musicgen_12_sse_idle_listeners.py',
+    'test_musicgen_13_job_store.py',
+    'test_musicgen_14_cancellation.py',
+    'test_musicgen_15_admission.py',
+    'test_musicgen_16_single_flight.py',
+    'test_musicgen_17_continue_codes.py',
+    'test_musicgen_18_continue_window.py',
+    'test_musicgen_19_variations.py',
+    'test_musicgen_20_long_form.py',
+    'test_musicgen_21_pipeline.py',
+    'test_musicgen_22_audio_writer.py',
+    'test_musicgen_23_asset_store.py',
 ]
 
 print("="*60)
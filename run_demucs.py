@@ -36,7 +36,16 @@ def _sf_save(uri, src, sample_rate, channels_first=True, format=None,
         data = data.T   # → (samples, channels) for soundfile
     # Pick bit depth
     subtype = "PCM_24" if bits_per_sample == 24 else "PCM_16"
-    sf.write(str(uri), data, sample_rate, subtype=subtype)
+    # Write beside the target and rename over it: an existing stem may be a
+    # hard link shared through the asset store, so never write through it
+    uri = str(uri)
+    tmp = os.path.join(os.path.dirname(uri), f".part-{os.getpid()}-{os.path.basename(uri)}")
+    try:
+        sf.write(tmp, data, sample_rate, subtype=subtype)
+        os.replace(tmp, uri)
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
 
 _ta.save = _sf_save
 
@@ -0,0 +1,148 @@
+"""
+single_flight.py — Coalesce identical in-flight requests
+=========================================================
+When the same mood is requested several times within seconds (explore
+page, retries, bots), every copy used to start its own generation.
+SingleFlight runs one computation per key at a time and hands its result
+to every caller that asked for the same key while it was running.
+
+  do(key, fn)                in-process work (api_server's _generate):
+                             progress is fanned out to every waiter, and
+                             the shared run is cancelled only once every
+                             waiter has cancelled
+  join(key, start, alive)    dispatched work (Celery): a duplicate gets
+                             the id of the task that is still running
+
+stats()["dedupe_ratio"] is the share of calls served by another call's run.
+"""
+
+from __future__ import annotations
+import threading
+from concurrent.futures import Future, InvalidStateError
+
+from job_manager import CancelToken, GenerationCancelled
+
+
+class _Flight:
+    def __init__(self):
+        self.future  = Future()
+        self.cancel  = CancelToken()     # fired when the last waiter leaves
+        self.waiters = 0
+        self.progress: list = []         # on_progress of every waiter
+
+
+class SingleFlight:
+    """Per-key deduplication of concurrent calls."""
+
+    def __init__(self, max_ids: int = 1024):
+        self.max_ids  = int(max_ids)
+        self._flights: dict = {}         # key → _Flight          (do)
+        self._ids: dict     = {}         # key → dispatched id    (join)
+        self._lock  = threading.Lock()
+        self._stats = {"calls": 0, "executions": 0, "shared": 0, "abandoned": 0}
+
+    # ── Public API ────────────────────────────────────────────────
+    def do(self, key, fn, on_progress=None, cancel: CancelToken | None = None):
+        """
+        Return (fn's result, shared). The first caller for a key runs
+        fn(on_progress, cancel) in its own thread; callers arriving while it
+        runs wait for that result (or its exception). A caller whose own
+        `cancel` fires stops waiting with GenerationCancelled.
+        """
+        with self._lock:
+            self._stats["calls"] += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self._stats["executions"] += 1
+            else:
+                self._stats["shared"] += 1
+            flight.waiters += 1
+            if on_progress is not None:
+                flight.progress.append(on_progress)
+
+        mine = Future()
+        flight.future.add_done_callback(lambda f: _copy(f, mine))
+        if cancel is not None:
+            cancel.on_cancel(lambda: self._leave(key, flight, mine, on_progress, cancel))
+
+        if leader:
+            try:
+                flight.future.set_result(fn(lambda info: self._fan_out(flight, info), flight.cancel))
+            except BaseException as e:
+                flight.future.set_exception(e)
+            finally:
+                with self._lock:
+                    if self._flights.get(key) is flight:
+                        del self._flights[key]
+        return mine.result(), not leader
+
+    def join(self, key, start, alive):
+        """
+        Return (id, shared). If the id last started for key is still
+        alive(id), return it; otherwise start() new work and remember its id.
+        """
+        with self._lock:
+            self._stats["calls"] += 1
+            existing = self._ids.get(key)
+            if existing is not None and alive(existing):
+                self._stats["shared"] += 1
+                return existing, True
+            new_id = start()
+            self._ids.pop(key, None)
+            self._ids[key] = new_id
+            self._stats["executions"] += 1
+            while len(self._ids) > self.max_ids:            # oldest first
+                del self._ids[next(iter(self._ids))]
+        return new_id, False
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+            s["in_flight"] = len(self._flights)
+        s["dedupe_ratio"] = round(s["shared"] / s["calls"], 3) if s["calls"] else 0.0
+        return s
+
+    # ── Internals ─────────────────────────────────────────────────
+    def _fan_out(self, flight: _Flight, info: dict):
+        with self._lock:
+            callbacks = list(flight.progress)
+        for callback in callbacks:
+            try:
+                callback(info)
+            except Exception:
+                pass
+
+    def _leave(self, key, flight: _Flight, mine: Future, on_progress, cancel: CancelToken):
+        """
+        A waiter cancelled: stop its wait. If nobody is left, cancel the run
+        and drop it from the table so a later caller starts a fresh flight
+        instead of joining one that is being cancelled.
+        """
+        with self._lock:
+            if flight.future.done():
+                return
+            flight.waiters -= 1
+            if on_progress in flight.progress:
+                flight.progress.remove(on_progress)
+            last = flight.waiters == 0
+            if last and self._flights.get(key) is flight:
+                del self._flights[key]
+            self._stats["abandoned"] += 1
+        if last:
+            flight.cancel.cancel(cancel.reason)
+        try:
+            mine.set_exception(GenerationCancelled(cancel.reason))
+        except InvalidStateError:
+            pass
+
+
+def _copy(src: Future, dst: Future):
+    try:
+        if src.exception() is not None:
+            dst.set_exception(src.exception())
+        else:
+            dst.set_result(src.result())
+    except InvalidStateError:
+        pass                              # this waiter already left
@@ -0,0 +1,77 @@
+import torch
+from transformers import AutoProcessor, MusicgenForConditionalGeneration
+from concurrent.futures import ThreadPoolExecutor
+import os
+import time
+
+from inference import BatchScheduler, musicgen_batch_runner
+
+print("="*60)
+print("TEST 8: Micro-Batching Throughput (BatchScheduler)")
+print("="*60)
+
+device = 'cuda' if torch.cuda.is_available() else 'cpu'
+dtype = torch.float16 if device == 'cuda' else torch.float32
+model_name = "facebook/musicgen-small"
+
+# Keep runs short on CPU; override with BENCH_TOKENS=512 for full 10 s beats
+max_new_tokens = int(os.getenv("BENCH_TOKENS", "128"))
+n_requests = int(os.getenv("BENCH_REQUESTS", "8"))
+batch_sizes = [1, 2, 4, 8]
+
+prompts = [
+    "energetic EDM beat with heavy bass drops",
+    "lo-fi hip hop beat with vinyl crackle",
+    "calm solo piano music",
+    "dark trap beat with 808 bass",
+    "smooth jazz with saxophone lead",
+    "synthwave retro 80s electronic music",
+    "fast drum and bass with rapid breakbeats",
+    "ambient atmospheric synthesizer pads",
+]
+
+print(f"\n[DEVICE] {device.upper()}  threads={torch.get_num_threads()}")
+print(f"[CONFIG] {n_requests} concurrent requests x {max_new_tokens} tokens")
+
+print(f"\n[LOADING] {model_name}")
+processor = AutoProcessor.from_pretrained(model_name)
+model = MusicgenForConditionalGeneration.from_pretrained(model_name, torch_dtype=dtype).to(device)
+model.eval()
+run_batch = musicgen_batch_runner(processor, model, device, dtype)
+
+# Warm-up so the first measured batch doesn't pay one-off kernel setup
+BatchScheduler(run_batch, max_batch_size=1).generate(prompts[0], 8)
+
+results = []
+for batch_size in batch_sizes:
+    print(f"\n[Test] max_batch_size={batch_size}")
+    print("-" * 40)
+    scheduler = BatchScheduler(run_batch, max_batch_size=batch_size, max_wait_ms=50)
+
+    # All requests arrive at once, like a burst of users hitting Generate
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=n_requests) as pool:
+        futures = [pool.submit(scheduler.generate, prompts[i % len(prompts)], max_new_tokens)
+                   for i in range(n_requests)]
+        audio = [f.result() for f in futures]
+    wall = time.time() - start
+    stats = scheduler.stats()
+    scheduler.shutdown()
+
+    throughput = n_requests / wall
+    tok_per_s = n_requests * max_new_tokens / wall
+    results.append((batch_size, wall, throughput, tok_per_s, stats["avg_batch_size"]))
+
+    print(f"  Wall time:      {wall:.2f}s")
+    print(f"  Batches run:    {stats['batches']} (avg size {stats['avg_batch_size']})")
+    print(f"  Throughput:     {throughput:.3f} req/s  |  {tok_per_s:.1f} tokens/s")
+    print(f"  Audio samples:  {len(audio[0])} per request")
+
+print(f"\n[SUMMARY]")
+print("-" * 60)
+print(f"  {'batch':>5}  {'wall s':>8}  {'req/s':>8}  {'tok/s':>8}  {'speedup':>8}")
+base = results[0][2]
+for batch_size, wall, throughput, tok_per_s, _ in results:
+    print(f"  {batch_size:>5}  {wall:>8.2f}  {throughput:>8.3f}  {tok_per_s:>8.1f}  {throughput / base:>7.2f}x")
+
+print(f"\n[OK] Micro-batching benchmark complete!")
@@ -0,0 +1,83 @@
+import torch
+from transformers import AutoProcessor, MusicgenForConditionalGeneration
+import os
+import time
+
+from encoder_cache import TextEncoderCache
+
+print("="*60)
+print("TEST 9: Text-Encoder Cost vs Total Generation Time")
+print("="*60)
+
+device = 'cuda' if torch.cuda.is_available() else 'cpu'
+dtype = torch.float16 if device == 'cuda' else torch.float32
+model_name = "facebook/musicgen-small"
+max_new_tokens = int(os.getenv("BENCH_TOKENS", "256"))
+repeats = int(os.getenv("BENCH_REPEATS", "3"))
+
+prompts = [
+    "energetic EDM beat with heavy bass drops, synthesizers, and pulsing drums at 128 bpm, club music",
+    "lo-fi hip hop beat with vinyl crackle, mellow chords, relaxed drums, chill study music",
+    "calm solo piano music, emotional and introspective, soft dynamics, gentle melody",
+]
+
+print(f"\n[DEVICE] {device.upper()}  |  {max_new_tokens} tokens  |  {repeats} repeats")
+print(f"\n[LOADING] {model_name}")
+processor = AutoProcessor.from_pretrained(model_name)
+model = MusicgenForConditionalGeneration.from_pretrained(model_name, torch_dtype=dtype).to(device)
+model.eval()
+
+
+def timed(fn):
+    if device == 'cuda':
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    out = fn()
+    if device == 'cuda':
+        torch.cuda.synchronize()
+    return out, time.perf_counter() - start
+
+
+# ── 1. Encoder alone ──────────────────────────────────────────────
+print(f"\n[Test] T5 text encoder only")
+print("-" * 40)
+encode_times = []
+for prompt in prompts:
+    inputs = processor(text=[prompt], padding=True, return_tensors="pt").to(device)
+    for _ in range(repeats):
+        with torch.inference_mode():
+            _, t = timed(lambda: model.text_encoder(**inputs))
+        encode_times.append(t)
+encode_ms = 1000 * sum(encode_times) / len(encode_times)
+print(f"  Mean encode time: {encode_ms:.1f} ms per prompt")
+
+# ── 2. Full generation, with and without cached encoder outputs ───
+cache = TextEncoderCache(processor, model, device, dtype)
+cache.precompute(prompts)
+
+gen_plain, gen_cached = [], []
+for prompt in prompts:
+    for _ in range(repeats):
+        inputs = processor(text=[prompt], padding=True, return_tensors="pt").to(device)
+        with torch.inference_mode():
+            _, t = timed(lambda: model.generate(**inputs, max_new_tokens=max_new_tokens))
+        gen_plain.append(t)
+
+        with torch.inference_mode():
+            _, t = timed(lambda: model.generate(**cache.generate_kwargs([prompt]),
+                                                max_new_tokens=max_new_tokens))
+        gen_cached.append(t)
+
+plain_s = sum(gen_plain) / len(gen_plain)
+cached_s = sum(gen_cached) / len(gen_cached)
+
+print(f"\n[SUMMARY]")
+print("-" * 40)
+print(f"  Encoder:                 {encode_ms:8.1f} ms")
+print(f"  Generate (encoder run):  {plain_s * 1000:8.1f} ms")
+print(f"  Generate (cached T5):    {cached_s * 1000:8.1f} ms")
+print(f"  Encoder share of total:  {100 * encode_ms / 1000 / plain_s:8.2f} %")
+print(f"  Saved per request:       {(plain_s - cached_s) * 1000:8.1f} ms")
+print(f"  Cache stats:             {cache.stats()}")
+
+print(f"\n[OK] Encoder cache benchmark complete!")
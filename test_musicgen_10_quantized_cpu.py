@@ -0,0 +1,122 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Each precision mode runs in its own process so peak RSS is measured cleanly:
+#   python test_musicgen_10_quantized_cpu.py            → run all modes + compare
+#   python test_musicgen_10_quantized_cpu.py int8 out   → one mode (child process)
+
+MODEL_NAME = "facebook/musicgen-small"
+PROMPT = "lo-fi hip hop beat with vinyl crackle, mellow chords, relaxed drums, chill study music"
+MAX_NEW_TOKENS = int(os.getenv("BENCH_TOKENS", "256"))
+SEED = 1234
+MODES = ["fp32", "int8", "bf16"]
+output_dir = Path('musicgen_test_outputs/quantized_cpu')
+
+
+def peak_rss_mb() -> float:
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss / 1024 if sys.platform != "darwin" else rss / 1e6   # Linux: KiB, macOS: bytes
+    except ImportError:                                                 # Windows
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 1e6
+
+
+def run_mode(mode: str, out_file: str):
+    import torch
+    from model_loader import load_musicgen, autocast
+
+    t0 = time.time()
+    processor, model, dtype, precision = load_musicgen(MODEL_NAME, "cpu", cpu_mode=mode)
+    load_time = time.time() - t0
+    inputs = processor(text=[PROMPT], padding=True, return_tensors="pt")
+
+    with torch.inference_mode(), autocast("cpu", dtype):       # warm-up
+        model.generate(**inputs, max_new_tokens=8)
+
+    torch.manual_seed(SEED)
+    start = time.time()
+    with torch.inference_mode(), autocast("cpu", dtype):
+        audio = model.generate(**inputs, max_new_tokens=MAX_NEW_TOKENS)
+    wall = time.time() - start
+
+    np.save(out_file, audio[0, 0].float().numpy())
+    print(json.dumps({
+        "mode":           precision,
+        "load_sec":       round(load_time, 2),
+        "wall_sec":       round(wall, 2),
+        "tokens_per_sec": round(MAX_NEW_TOKENS / wall, 2),
+        "peak_rss_mb":    round(peak_rss_mb(), 1),
+    }))
+
+
+def spectral_similarity(a: np.ndarray, b: np.ndarray, n_fft: int = 2048) -> tuple[float, float]:
+    """Cosine similarity of mean log-magnitude spectra and log-spectral distance (dB).
+    Sampling diverges token-by-token between precisions, so compare timbre/balance
+    rather than waveforms."""
+    def mean_log_spec(x):
+        frames = np.lib.stride_tricks.sliding_window_view(x, n_fft)[::n_fft // 2]
+        mag = np.abs(np.fft.rfft(frames * np.hanning(n_fft), axis=-1))
+        return 20 * np.log10(mag.mean(axis=0) + 1e-8)
+    sa, sb = mean_log_spec(a), mean_log_spec(b)
+    cos = float(np.dot(sa - sa.mean(), sb - sb.mean())
+                / (np.linalg.norm(sa - sa.mean()) * np.linalg.norm(sb - sb.mean()) + 1e-12))
+    lsd = float(np.sqrt(np.mean((sa - sb) ** 2)))
+    return cos, lsd
+
+
+def main():
+    print("="*60)
+    print("TEST 10: Quantized CPU Inference (fp32 vs int8 vs bf16)")
+    print("="*60)
+    print(f"\n[CONFIG] {MAX_NEW_TOKENS} tokens  |  seed {SEED}")
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    results = {}
+    for mode in MODES:
+        print(f"\n[Test] MUSICGEN_CPU_MODE={mode}")
+        print("-" * 40)
+        out_file = str(output_dir / f"{mode}.npy")
+        proc = subprocess.run([sys.executable, __file__, mode, out_file],
+                              capture_output=True, text=True, cwd=Path(__file__).parent)
+        if proc.returncode != 0:
+            print(f"  [X] Failed: {proc.stderr[-500:]}")
+            continue
+        info = json.loads(proc.stdout.strip().splitlines()[-1])
+        if info["mode"] != mode:
+            print(f"  [!] {mode} unsupported here — ran as {info['mode']}, skipping")
+            continue
+        info["audio"] = np.load(out_file)
+        results[mode] = info
+        print(f"  Wall time:   {info['wall_sec']:.2f}s  ({info['tokens_per_sec']:.1f} tokens/s)")
+        print(f"  Peak RSS:    {info['peak_rss_mb']:.0f} MB  |  load {info['load_sec']:.1f}s")
+
+    if "fp32" not in results:
+        print("\n[X] fp32 reference missing, cannot compare")
+        return
+
+    ref = results["fp32"]
+    print(f"\n[SUMMARY]  (similarity vs fp32 reference)")
+    print("-" * 60)
+    print(f"  {'mode':>5}  {'wall s':>7}  {'tok/s':>7}  {'speedup':>7}  {'RSS MB':>7}  {'spec cos':>8}  {'LSD dB':>7}")
+    for mode, info in results.items():
+        cos, lsd = spectral_similarity(ref["audio"], info["audio"])
+        print(f"  {mode:>5}  {info['wall_sec']:>7.2f}  {info['tokens_per_sec']:>7.1f}  "
+              f"{ref['wall_sec'] / info['wall_sec']:>6.2f}x  {info['peak_rss_mb']:>7.0f}  "
+              f"{cos:>8.3f}  {lsd:>7.2f}")
+
+    print(f"\n[OK] Quantized CPU benchmark complete!")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3:
+        run_mode(sys.argv[1], sys.argv[2])
+    else:
+        main()
@@ -0,0 +1,115 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+# Finds the best INFER_SLOTS × THREADS_PER_SLOT split for this machine.
+# Each split runs in its own process (thread pools are fixed at import):
+#   python test_musicgen_11_thread_budget.py          → try every split + summary
+#   python test_musicgen_11_thread_budget.py 2 4      → one split (child process)
+
+MODEL_NAME = "facebook/musicgen-small"
+PROMPTS = [
+    "energetic EDM beat with heavy bass drops, synthesizers, and pulsing drums at 128 bpm, club music",
+    "lo-fi hip hop beat with vinyl crackle, mellow chords, relaxed drums, chill study music",
+    "dark trap beat with 808 bass, hi-hats, and atmospheric pads, hip hop production, 140 bpm",
+    "calm solo piano music, emotional and introspective, soft dynamics, gentle melody",
+]
+MAX_NEW_TOKENS = int(os.getenv("BENCH_TOKENS", "128"))
+CORES          = int(os.getenv("BENCH_CORES", str(os.cpu_count() or 1)))
+TOTAL_REQUESTS = int(os.getenv("BENCH_REQUESTS", "8"))
+MAX_SLOTS      = int(os.getenv("BENCH_MAX_SLOTS", "8"))
+
+
+def run_split(slots: int, threads: int):
+    os.environ["INFER_SLOTS"]      = str(slots)
+    os.environ["THREADS_PER_SLOT"] = str(threads)
+    from thread_budget import ThreadBudget, apply_thread_env
+    apply_thread_env(threads)
+
+    import threading
+    import torch
+    from transformers import AutoProcessor, MusicgenForConditionalGeneration
+
+    budget    = ThreadBudget(slots, threads)
+    processor = AutoProcessor.from_pretrained(MODEL_NAME)
+    model     = MusicgenForConditionalGeneration.from_pretrained(MODEL_NAME).eval()
+
+    def one(prompt, tokens):
+        inputs = processor(text=[prompt], padding=True, return_tensors="pt")
+        with budget.slot(), torch.inference_mode():
+            model.generate(**inputs, max_new_tokens=tokens)
+
+    one(PROMPTS[0], 8)                                         # warm-up
+
+    latencies, lock = [], threading.Lock()
+    def client(i):
+        t0 = time.time()
+        one(PROMPTS[i % len(PROMPTS)], MAX_NEW_TOKENS)
+        with lock:
+            latencies.append(time.time() - t0)
+
+    start   = time.time()
+    clients = [threading.Thread(target=client, args=(i,)) for i in range(TOTAL_REQUESTS)]
+    for c in clients:
+        c.start()
+    for c in clients:
+        c.join()
+    wall = time.time() - start
+
+    print(json.dumps({
+        "slots":          slots,
+        "threads":        threads,
+        "wall_sec":       round(wall, 2),
+        "tokens_per_sec": round(TOTAL_REQUESTS * MAX_NEW_TOKENS / wall, 2),
+        "mean_latency":   round(sum(latencies) / len(latencies), 2),
+        "max_latency":    round(max(latencies), 2),
+    }))
+
+
+def main():
+    print("="*60)
+    print("TEST 11: CPU Thread Budget (slots × threads per slot)")
+    print("="*60)
+    splits = [(s, CORES // s) for s in range(1, min(CORES, MAX_SLOTS) + 1) if CORES % s == 0]
+    print(f"\n[CONFIG] {CORES} cores  |  {TOTAL_REQUESTS} concurrent requests × {MAX_NEW_TOKENS} tokens")
+    print(f"  Splits: {', '.join(f'{s}×{t}' for s, t in splits)}")
+
+    results = []
+    for slots, threads in splits:
+        print(f"\n[Test] INFER_SLOTS={slots} THREADS_PER_SLOT={threads}")
+        print("-" * 40)
+        proc = subprocess.run([sys.executable, __file__, str(slots), str(threads)],
+                              capture_output=True, text=True, cwd=Path(__file__).parent)
+        if proc.returncode != 0:
+            print(f"  [X] Failed: {proc.stderr[-500:]}")
+            continue
+        info = json.loads(proc.stdout.strip().splitlines()[-1])
+        results.append(info)
+        print(f"  Throughput:  {info['tokens_per_sec']:.1f} tokens/s  (wall {info['wall_sec']:.1f}s)")
+        print(f"  Latency:     mean {info['mean_latency']:.1f}s  |  max {info['max_latency']:.1f}s")
+
+    if not results:
+        print("\n[X] No split completed")
+        return
+
+    best = max(results, key=lambda r: r["tokens_per_sec"])
+    print(f"\n[SUMMARY]")
+    print("-" * 60)
+    print(f"  {'slots×threads':>13}  {'tok/s':>7}  {'mean lat s':>10}  {'max lat s':>9}")
+    for r in results:
+        mark = "  <- best" if r is best else ""
+        print(f"  {str(r['slots']) + '×' + str(r['threads']):>13}  {r['tokens_per_sec']:>7.1f}  "
+              f"{r['mean_latency']:>10.1f}  {r['max_latency']:>9.1f}{mark}")
+    print(f"\n  Recommended: INFER_SLOTS={best['slots']} THREADS_PER_SLOT={best['threads']}")
+
+    print(f"\n[OK] Thread budget benchmark complete!")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3:
+        run_split(int(sys.argv[1]), int(sys.argv[2]))
+    else:
+        main()
@@ -0,0 +1,99 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+
+# No model needed: api_server only loads MusicGen from its startup hook.
+import api_server
+from api_server import sse_progress, _jobs
+
+print("="*60)
+print("TEST 12: SSE Event-Loop Cost with Idle Listeners")
+print("="*60)
+
+LISTENERS = int(os.getenv("BENCH_LISTENERS", "1000"))
+IDLE_SEC  = float(os.getenv("BENCH_IDLE_SEC", "10"))
+print(f"\n[CONFIG] {LISTENERS} listeners  |  {IDLE_SEC:.0f}s idle window  |  "
+      f"heartbeat {api_server.SSE_HEARTBEAT_SEC:.0f}s")
+
+
+async def polling_stream(task_id: str):
+    """The previous /sse/progress loop: wake every second, re-send state."""
+    for _ in range(300):
+        info = _jobs.get(task_id) or {"status": "unknown", "pct": 0}
+        yield f"data: {json.dumps(info)}\n\n"
+        if info.get("status") in ("done", "error"):
+            break
+        await asyncio.sleep(1)
+
+
+async def run(mode: str) -> dict:
+    release = threading.Event()
+    task_id = _jobs.submit(lambda update: release.wait(120) and {"url": "/audio/x.wav"})
+    await asyncio.sleep(0.1)                                  # job is now "running"
+
+    seen     = [0] * LISTENERS
+    got_done = [None] * LISTENERS
+
+    async def listener(i):
+        await asyncio.sleep(random.random())                  # clients connect at random times
+        if mode == "push":
+            body = (await sse_progress(task_id)).body_iterator
+        else:
+            body = polling_stream(task_id)
+        async for chunk in body:
+            seen[i] += 1
+            if chunk.startswith("data:") and '"status": "done"' in chunk:
+                got_done[i] = time.perf_counter()
+
+    tasks = [asyncio.create_task(listener(i)) for i in range(LISTENERS)]
+    await asyncio.sleep(1.5)                                  # all connected
+
+    # ── Idle window: nothing changes ─────────────────────────────
+    cpu0, wall0, msgs0 = time.process_time(), time.perf_counter(), sum(seen)
+    await asyncio.sleep(IDLE_SEC)
+    cpu  = time.process_time() - cpu0
+    wall = time.perf_counter() - wall0
+    idle_msgs = sum(seen) - msgs0
+
+    # ── Completion: how long until every listener has the final state ─
+    t_done = time.perf_counter()
+    release.set()
+    await asyncio.wait_for(asyncio.gather(*tasks), timeout=30)
+    lat = sorted(t - t_done for t in got_done if t is not None)
+    return {
+        "mode":         mode,
+        "cpu_ms_per_s": 1000 * cpu / wall,
+        "idle_msgs":    idle_msgs,
+        "done_p50_ms":  1000 * lat[len(lat) // 2],
+        "done_max_ms":  1000 * lat[-1],
+        "delivered":    len(lat),
+    }
+
+
+async def main():
+    results = []
+    for mode in ("polling", "push"):
+        print(f"\n[Test] {mode} — {LISTENERS} idle listeners")
+        print("-" * 40)
+        r = await run(mode)
+        results.append(r)
+        print(f"  Event-loop CPU while idle:  {r['cpu_ms_per_s']:.1f} ms per second")
+        print(f"  Messages sent while idle:   {r['idle_msgs']}")
+        print(f"  'done' delivered:           {r['delivered']}/{LISTENERS}  "
+              f"(p50 {r['done_p50_ms']:.0f} ms, max {r['done_max_ms']:.0f} ms)")
+
+    poll, push = results
+    print(f"\n[SUMMARY]")
+    print("-" * 40)
+    print(f"  Idle CPU:        polling {poll['cpu_ms_per_s']:.1f} ms/s  →  push {push['cpu_ms_per_s']:.1f} ms/s")
+    print(f"  Idle messages:   polling {poll['idle_msgs']}  →  push {push['idle_msgs']}")
+    print(f"  Done latency:    polling p50 {poll['done_p50_ms']:.0f} ms  →  push p50 {push['done_p50_ms']:.0f} ms")
+    print(f"  Job stats:       {_jobs.stats()}")
+
+    print(f"\n[OK] SSE idle-listener benchmark complete!")
+
+
+asyncio.run(main())
@@ -0,0 +1,120 @@
+import os
+import threading
+import time
+
+# No model needed. Runs against JOB_STORE_URL when a Redis server answers
+# there, otherwise against an in-process fakeredis server.
+from job_manager import JobManager
+from job_store import JOB_STORE_URL, MemoryJobStore, RedisJobStore
+
+print("="*60)
+print("TEST 13: Job Store Backends (memory vs Redis hash + pub/sub)")
+print("="*60)
+
+JOBS  = int(os.getenv("BENCH_JOBS", "20"))
+STEPS = int(os.getenv("BENCH_STEPS", "10"))
+
+
+def redis_clients():
+    """Two independent clients on one server — two uvicorn workers / hosts."""
+    try:
+        import redis
+        a = redis.Redis.from_url(JOB_STORE_URL)
+        a.ping()
+        return "redis " + JOB_STORE_URL, a, redis.Redis.from_url(JOB_STORE_URL)
+    except Exception:
+        import fakeredis
+        server = fakeredis.FakeServer()
+        return "fakeredis", fakeredis.FakeRedis(server=server), fakeredis.FakeRedis(server=server)
+
+
+def run(label: str, store_a, store_b) -> dict:
+    """Submit on manager A, follow every job from manager B."""
+    a = JobManager(workers=4, max_queue=JOBS, ttl_sec=60, store=store_a)
+    b = JobManager(workers=1, max_queue=1, ttl_sec=60, store=store_b)
+
+    def work(update):
+        for i in range(1, STEPS + 1):
+            time.sleep(0.01)
+            update(status="generating", pct=int(100 * i / STEPS), sent_at=time.time())
+        return {"url": "/audio/x.wav"}
+
+    lock, seen, lags, done = threading.Lock(), {}, [], threading.Event()
+    finished = set()
+
+    def follow(job_id):
+        def changed():
+            info = b.get(job_id) or {}
+            with lock:
+                seen[job_id] = seen.get(job_id, 0) + 1
+                if info.get("sent_at") and info.get("status") == "generating":
+                    lags.append(time.time() - info["sent_at"])
+                if info.get("status") == "done":
+                    finished.add(job_id)
+                    if len(finished) == JOBS:
+                        done.set()
+        return changed
+
+    t0  = time.time()
+    ids = [str(i) + "-" + label for i in range(JOBS)]
+    for job_id in ids:                      # subscribe first so no change is missed
+        b.subscribe(job_id, follow(job_id))
+    time.sleep(0.2)                         # pub/sub listener is up
+    for job_id in ids:
+        a.submit(work, job_id=job_id, url=None)
+    ok   = done.wait(30)
+    wall = time.time() - t0
+    lags.sort()
+    final = [b.get(j) for j in ids]
+    return {
+        "label":     label,
+        "ok":        ok and all(f and f["status"] == "done" and f["url"] for f in final),
+        "wall":      wall,
+        "events":    sum(seen.values()),
+        "lag_p50":   1000 * lags[len(lags) // 2] if lags else float("nan"),
+        "lag_max":   1000 * lags[-1] if lags else float("nan"),
+        "store":     b.stats()["store"],
+    }
+
+
+def main():
+    results = []
+
+    print(f"\n[Test] memory — one process, {JOBS} jobs × {STEPS} updates")
+    print("-" * 40)
+    mem = MemoryJobStore(ttl_sec=60)
+    results.append(run("memory", mem, mem))
+
+    label, client_a, client_b = redis_clients()
+    print(f"\n[Test] {label} — submit on manager A, follow from manager B")
+    print("-" * 40)
+    prefix = f"bench{os.getpid()}"
+    results.append(run("redis", RedisJobStore(client_a, prefix=prefix, ttl_sec=60),
+                       RedisJobStore(client_b, prefix=prefix, ttl_sec=60)))
+
+    # A Celery worker reports through put() on a job the API registered
+    print(f"\n[Test] {label} — externally-run (Celery-style) job")
+    print("-" * 40)
+    api    = JobManager(workers=1, store=RedisJobStore(client_a, prefix=prefix))
+    worker = RedisJobStore(client_b, prefix=prefix)
+    api.track("celery-1", kind="celery", url=None)
+    worker.put("celery-1", {"status": "running", "started_at": time.time()})
+    worker.put("celery-1", {"status": "done", "pct": 100, "url": "/audio/y.wav",
+                            "finished_at": time.time()})
+    info = api.get("celery-1")
+    print(f"  State seen by API:  {info['status']}  {info['url']}  run {info['run_sec']}s")
+    ttl = client_a.ttl(f"{prefix}:job:celery-1")
+    print(f"  Redis TTL after finish:  {ttl}s")
+
+    for r in results:
+        print(f"\n  {r['label']:<7} {'[OK]' if r['ok'] else '[X] '}  wall {r['wall']:.2f}s  "
+              f"events {r['events']}  lag p50 {r['lag_p50']:.1f} ms  max {r['lag_max']:.1f} ms")
+        print(f"          store {r['store']}")
+
+    if not all(r["ok"] for r in results) or info["status"] != "done":
+        print("\n[X] Job store benchmark failed")
+        return
+    print(f"\n[OK] Job store benchmark complete!")
+
+
+main()
@@ -0,0 +1,79 @@
+import os
+import time
+
+from thread_budget import apply_thread_env
+apply_thread_env()
+
+import torch
+from transformers import AutoProcessor, MusicgenForConditionalGeneration
+
+from inference import BatchScheduler, musicgen_batch_runner
+from job_manager import CancelToken, GenerationCancelled
+
+print("="*60)
+print("TEST 14: Cancelling Abandoned Generations")
+print("="*60)
+
+MODEL_NAME     = "facebook/musicgen-small"
+LONG_TOKENS    = int(os.getenv("BENCH_LONG_TOKENS", "256"))
+SHORT_TOKENS   = int(os.getenv("BENCH_SHORT_TOKENS", "64"))
+ABANDONED      = int(os.getenv("BENCH_ABANDONED", "3"))
+CANCEL_AFTER_S = float(os.getenv("BENCH_CANCEL_AFTER", "1.0"))
+PROMPT = "lo-fi hip hop beat with vinyl crackle, mellow chords, relaxed drums, chill study music"
+
+print(f"\n[CONFIG] {ABANDONED} abandoned × {LONG_TOKENS} tokens ahead of one "
+      f"{SHORT_TOKENS}-token request  |  clients leave after {CANCEL_AFTER_S:.1f}s")
+
+processor = AutoProcessor.from_pretrained(MODEL_NAME)
+model     = MusicgenForConditionalGeneration.from_pretrained(MODEL_NAME).eval()
+runner    = musicgen_batch_runner(processor, model, "cpu", torch.float32)
+
+
+def run(cancel: bool) -> dict:
+    # One job at a time, so the abandoned jobs hold the only slot in turn
+    sched  = BatchScheduler(runner, max_batch_size=1, max_wait_ms=0)
+    tokens = [CancelToken() for _ in range(ABANDONED)]
+    t0     = time.time()
+    abandoned = [sched.submit(PROMPT, LONG_TOKENS, cancel=t) for t in tokens]
+    waiting   = sched.submit(PROMPT, SHORT_TOKENS)
+
+    time.sleep(CANCEL_AFTER_S)
+    t_cancel = time.time()
+    if cancel:
+        for t in tokens:
+            t.cancel("client disconnected")
+    freed = None
+    for f in abandoned:
+        try:
+            f.result()
+        except GenerationCancelled:
+            pass
+        freed = freed or time.time() - t_cancel
+    waiting.result()
+    latency = time.time() - t0
+    stats = sched.stats()
+    sched.shutdown()
+    return {"latency": latency, "freed": freed, "busy": stats["busy_sec"],
+            "cancelled": stats["cancelled"]}
+
+
+sched = BatchScheduler(runner, max_batch_size=1)
+sched.generate(PROMPT, 8)                                    # warm-up
+sched.shutdown()
+
+results = {}
+for label, cancel in (("no cancellation", False), ("cancel on disconnect", True)):
+    print(f"\n[Test] {label}")
+    print("-" * 40)
+    r = results[label] = run(cancel)
+    print(f"  Waiting request latency:  {r['latency']:.1f}s")
+    print(f"  Slot freed after leaving: {r['freed']:.2f}s")
+    print(f"  Model busy time:          {r['busy']:.1f}s  (dropped from queue: {r['cancelled']})")
+
+before, after = results["no cancellation"], results["cancel on disconnect"]
+print(f"\n[SUMMARY]")
+print("-" * 40)
+print(f"  Waiting request:  {before['latency']:.1f}s  →  {after['latency']:.1f}s")
+print(f"  CPU spent on abandoned work:  {before['busy']:.1f}s  →  {after['busy']:.1f}s busy")
+
+print(f"\n[OK] Cancellation benchmark complete!")
@@ -0,0 +1,109 @@
+import os
+import threading
+import time
+
+from thread_budget import apply_thread_env
+apply_thread_env()
+
+import torch
+from transformers import AutoProcessor, MusicgenForConditionalGeneration
+
+from admission import AdmissionController, AdmissionRejected, PRIORITY_ANON, PRIORITY_USER
+from inference import BatchScheduler, musicgen_batch_runner
+
+print("="*60)
+print("TEST 15: Admission Control Under a Traffic Spike")
+print("="*60)
+
+MODEL_NAME  = "facebook/musicgen-small"
+TOKENS      = int(os.getenv("BENCH_TOKENS", "128"))
+SPIKE       = int(os.getenv("BENCH_SPIKE", "24"))          # requests arriving at once
+LOGGED_IN   = int(os.getenv("BENCH_LOGGED_IN", "4"))       # of which from logged-in users
+ANON_LIMIT  = float(os.getenv("BENCH_ANON_LIMIT", "10"))
+USER_LIMIT  = float(os.getenv("BENCH_USER_LIMIT", "60"))
+PROMPT = "energetic EDM beat with heavy bass drops, synthesizers, and pulsing drums at 128 bpm"
+
+print(f"\n[CONFIG] {SPIKE} requests × {TOKENS} tokens at once ({LOGGED_IN} logged-in)  |  "
+      f"max wait: anonymous {ANON_LIMIT:.0f}s, logged-in {USER_LIMIT:.0f}s")
+
+processor = AutoProcessor.from_pretrained(MODEL_NAME)
+model     = MusicgenForConditionalGeneration.from_pretrained(MODEL_NAME).eval()
+runner    = musicgen_batch_runner(processor, model, "cpu", torch.float32)
+
+
+def spike(admission: AdmissionController | None) -> dict:
+    sched = BatchScheduler(runner, max_batch_size=4, max_wait_ms=25,
+                           on_batch=admission.record_batch if admission else None)
+    sched.generate(PROMPT, TOKENS)                        # warm-up + first throughput sample
+    lock, rows = threading.Lock(), []
+
+    def client(i):
+        priority = PRIORITY_USER if i < LOGGED_IN else PRIORITY_ANON
+        user     = f"user{i}" if priority == PRIORITY_USER else f"ip{i % 6}"
+        t0, ticket, estimate = time.time(), None, None
+        if admission is not None:
+            estimate = admission.estimate_wait(priority)
+            try:
+                ticket = admission.admit(TOKENS, user, priority)
+            except AdmissionRejected as e:
+                with lock:
+                    rows.append({"priority": priority, "rejected": True, "latency": 0.0,
+                                 "retry_after": e.retry_after})
+                return
+        started = []
+        try:
+            sched.generate(PROMPT, TOKENS, priority=priority, user=user,
+                           on_progress=lambda info: started or started.append(time.time()))
+        finally:
+            if ticket is not None:
+                ticket.release()
+        with lock:
+            rows.append({"priority": priority, "rejected": False, "latency": time.time() - t0,
+                         "wait": (started[0] if started else time.time()) - t0,
+                         "estimate": estimate})
+
+    clients = [threading.Thread(target=client, args=(i,)) for i in range(SPIKE)]
+    for c in clients:
+        c.start()
+    for c in clients:
+        c.join()
+    sched.shutdown()
+    return {"rows": rows, "tokens_per_sec": admission.tokens_per_sec() if admission else None}
+
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))] if values else float("nan")
+
+
+results = {}
+for label, admission in (
+    ("accept everything", None),
+    ("admission control", AdmissionController(max_wait_sec={PRIORITY_USER: USER_LIMIT,
+                                                             PRIORITY_ANON: ANON_LIMIT},
+                                              max_per_user=8)),
+):
+    print(f"\n[Test] {label}")
+    print("-" * 40)
+    r = results[label] = spike(admission)
+    for name, prio in (("logged-in", PRIORITY_USER), ("anonymous", PRIORITY_ANON)):
+        ok  = [x for x in r["rows"] if x["priority"] == prio and not x["rejected"]]
+        rej = [x for x in r["rows"] if x["priority"] == prio and x["rejected"]]
+        lat = [x["latency"] for x in ok]
+        print(f"  {name:<10} admitted {len(ok):>2}  rejected {len(rej):>2}" + (
+              f"  |  latency p50 {pct(lat, .5):.1f}s  p95 {pct(lat, .95):.1f}s  "
+              f"max {pct(lat, 1):.1f}s" if lat else ""))
+    est = [(x["estimate"], x["wait"]) for x in r["rows"] if x.get("estimate") is not None]
+    if est:
+        err = [abs(e - w) for e, w in est]
+        print(f"  Wait estimate error: median {pct(err, .5):.1f}s  "
+              f"(at {r['tokens_per_sec']:.0f} measured tokens/s)")
+
+base, ctrl = results["accept everything"], results["admission control"]
+worst = lambda r: max((x["latency"] for x in r["rows"] if not x["rejected"]), default=0.0)
+print(f"\n[SUMMARY]")
+print("-" * 40)
+print(f"  Worst admitted latency:  {worst(base):.1f}s  →  {worst(ctrl):.1f}s")
+print(f"  Rejected with 429:       0  →  {sum(x['rejected'] for x in ctrl['rows'])}")
+
+print(f"\n[OK] Admission control benchmark complete!")
@@ -0,0 +1,76 @@
+import os
+import time
+from pathlib import Path
+
+from thread_budget import apply_thread_env
+apply_thread_env()
+
+import soundfile as sf
+import torch
+from transformers import AutoProcessor, MusicgenForConditionalGeneration
+
+import audio_processing
+from audio_processing import continue_beat
+from generation_cache import codes_path
+from inference import BatchScheduler, musicgen_batch_runner, duration_to_tokens, save_codes
+
+print("="*60)
+print("TEST 17: /continue From Stored EnCodec Codes")
+print("="*60)
+
+MODEL_NAME   = "facebook/musicgen-small"
+SOURCE_SEC   = float(os.getenv("BENCH_SOURCE_SEC", "10"))   # beat being extended
+EXTEND_TOKENS = int(os.getenv("BENCH_EXTEND_TOKENS", "128"))
+RUNS         = int(os.getenv("BENCH_RUNS", "3"))
+PROMPT = "lo-fi hip hop beat with vinyl crackle, mellow chords, relaxed drums, chill study music"
+OUT_DIR = Path("bench_outputs")
+OUT_DIR.mkdir(exist_ok=True)
+audio_processing.OUTPUT_DIR = OUT_DIR
+
+print(f"\n[CONFIG] extend a {SOURCE_SEC:.0f}s beat by {EXTEND_TOKENS} tokens  |  {RUNS} runs each")
+
+processor = AutoProcessor.from_pretrained(MODEL_NAME)
+model     = MusicgenForConditionalGeneration.from_pretrained(MODEL_NAME).eval()
+sched     = BatchScheduler(musicgen_batch_runner(processor, model, "cpu", torch.float32))
+
+audio, codes = sched.generate(PROMPT, duration_to_tokens(SOURCE_SEC, model), with_codes=True)
+sched.shutdown()
+source = OUT_DIR / "continue_source.wav"
+sf.write(str(source), audio, model.config.audio_encoder.sampling_rate)
+print(f"  Source: {len(audio) / model.config.audio_encoder.sampling_rate:.1f}s, "
+      f"codes {codes.shape[0]}×{codes.shape[1]} ({codes.nbytes / 1024:.1f} KB)")
+
+
+def extend(use_codes: bool) -> list[float]:
+    if use_codes:
+        save_codes(source, codes)
+    else:
+        codes_path(source).unlink(missing_ok=True)
+    times = []
+    for _ in range(RUNS):
+        t0 = time.time()
+        out_path, _ = continue_beat(str(source), PROMPT, processor, model, "cpu",
+                                    torch.float32, max_new_tokens=EXTEND_TOKENS)
+        times.append(time.time() - t0)
+        out_path.unlink(missing_ok=True)
+        codes_path(out_path).unlink(missing_ok=True)
+    return times
+
+
+continue_beat(str(source), PROMPT, processor, model, "cpu", torch.float32, max_new_tokens=8)  # warm-up
+
+results = {}
+for label, use_codes in (("re-encode WAV", False), ("stored codes", True)):
+    print(f"\n[Test] {label}")
+    print("-" * 40)
+    times = results[label] = extend(use_codes)
+    print(f"  /continue latency: mean {sum(times) / len(times):.2f}s  "
+          f"min {min(times):.2f}s  max {max(times):.2f}s")
+
+before = sum(results["re-encode WAV"]) / RUNS
+after  = sum(results["stored codes"]) / RUNS
+print(f"\n[SUMMARY]")
+print("-" * 40)
+print(f"  /continue latency:  {before:.2f}s  →  {after:.2f}s  ({before - after:.2f}s saved)")
+
+print(f"\n[OK] Continuation-from-codes benchmark complete!")
@@ -0,0 +1,75 @@
+import os
+import time
+from pathlib import Path
+
+from thread_budget import apply_thread_env
+apply_thread_env()
+
+import soundfile as sf
+import torch
+from transformers import AutoProcessor, MusicgenForConditionalGeneration
+
+import audio_processing
+from audio_processing import continue_beat
+from generation_cache import codes_path
+from inference import BatchScheduler, musicgen_batch_runner, duration_to_tokens, save_codes
+
+print("="*60)
+print("TEST 18: Bounded Context Window for Repeated Continuation")
+print("="*60)
+
+MODEL_NAME    = "facebook/musicgen-small"
+EXTENSIONS    = int(os.getenv("BENCH_EXTENSIONS", "4"))
+EXTEND_TOKENS = int(os.getenv("BENCH_EXTEND_TOKENS", "256"))
+CONTEXT_SEC   = float(os.getenv("BENCH_CONTEXT_SEC", "5"))
+PROMPT = "deep house music with groovy bassline, smooth synthesizers, four-on-the-floor drums"
+OUT_DIR = Path("bench_outputs")
+OUT_DIR.mkdir(exist_ok=True)
+audio_processing.OUTPUT_DIR = OUT_DIR
+
+print(f"\n[CONFIG] {EXTENSIONS} extensions × {EXTEND_TOKENS} tokens  |  window {CONTEXT_SEC:.0f}s")
+
+processor = AutoProcessor.from_pretrained(MODEL_NAME)
+model     = MusicgenForConditionalGeneration.from_pretrained(MODEL_NAME).eval()
+sched     = BatchScheduler(musicgen_batch_runner(processor, model, "cpu", torch.float32))
+
+audio, codes = sched.generate(PROMPT, duration_to_tokens(5, model), with_codes=True)
+sched.shutdown()
+source = OUT_DIR / "window_source.wav"
+sf.write(str(source), audio, model.config.audio_encoder.sampling_rate)
+save_codes(source, codes)
+
+
+def chain(context_sec) -> list[tuple[float, float]]:
+    """Extend the source EXTENSIONS times in a row → [(track seconds, step latency)]."""
+    current, steps, made = source, [], []
+    for _ in range(EXTENSIONS):
+        t0 = time.time()
+        current, duration = continue_beat(str(current), PROMPT, processor, model, "cpu",
+                                          torch.float32, max_new_tokens=EXTEND_TOKENS,
+                                          context_sec=context_sec)
+        steps.append((duration, time.time() - t0))
+        made.append(current)
+    for p in made:
+        p.unlink(missing_ok=True)
+        codes_path(p).unlink(missing_ok=True)
+    return steps
+
+
+results = {}
+for label, context_sec in (("whole track as context", None),
+                           (f"last {CONTEXT_SEC:.0f}s as context", CONTEXT_SEC)):
+    print(f"\n[Test] {label}")
+    print("-" * 40)
+    steps = results[label] = chain(context_sec)
+    for i, (duration, latency) in enumerate(steps, 1):
+        print(f"  Extension {i}: track {duration:5.1f}s  →  {latency:.2f}s")
+
+full, windowed = results.values()
+print(f"\n[SUMMARY]")
+print("-" * 40)
+print(f"  Last extension:      {full[-1][1]:.2f}s  →  {windowed[-1][1]:.2f}s")
+print(f"  Growth first → last: {full[-1][1] / full[0][1]:.2f}×  →  "
+      f"{windowed[-1][1] / windowed[0][1]:.2f}×")
+
+print(f"\n[OK] Continuation window benchmark complete!")
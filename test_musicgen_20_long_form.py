@@ -0,0 +1,69 @@
+import os
+import resource
+import time
+from pathlib import Path
+
+from thread_budget import apply_thread_env
+apply_thread_env()
+
+import soundfile as sf
+import torch
+from transformers import AutoProcessor, MusicgenForConditionalGeneration
+
+from audio_processing import generate_long
+from generation_cache import codes_path
+
+print("="*60)
+print("TEST 20: Long-Form Generation via Windowed Continuation")
+print("="*60)
+
+MODEL_NAME  = "facebook/musicgen-small"
+TRACK_SEC   = float(os.getenv("BENCH_TRACK_SEC", "120"))
+WINDOW_SEC  = float(os.getenv("BENCH_WINDOW_SEC", "20"))
+CONTEXT_SEC = float(os.getenv("BENCH_CONTEXT_SEC", "10"))
+PROMPT = "cinematic ambient soundtrack with evolving pads, soft piano, slow build, 80 bpm"
+OUT_DIR = Path("bench_outputs")
+OUT_DIR.mkdir(exist_ok=True)
+
+print(f"\n[CONFIG] {TRACK_SEC:.0f}s track  |  {WINDOW_SEC:.0f}s windows, "
+      f"{CONTEXT_SEC:.0f}s context")
+
+processor = AutoProcessor.from_pretrained(MODEL_NAME)
+model     = MusicgenForConditionalGeneration.from_pretrained(MODEL_NAME).eval()
+
+
+def rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+print(f"\n[Test] Per-window timings")
+print("-" * 40)
+out_path = OUT_DIR / "long_form.wav"
+rss_before = rss_mb()
+t0 = time.time()
+path, duration, timings = generate_long(
+    PROMPT, processor, model, "cpu", torch.float32, TRACK_SEC,
+    window_sec=WINDOW_SEC, context_sec=CONTEXT_SEC, seed=0, out_path=out_path,
+    on_window=lambda t: print(f"  Window {t['window']:2d}: +{t['new_sec']:4.1f}s  "
+                              f"gen {t['gen_sec']:.2f}s  write {t['write_sec']:.3f}s  "
+                              f"track {t['total_sec']:5.1f}s"))
+wall = time.time() - t0
+peak = rss_mb()
+
+gen = [t["gen_sec"] for t in timings[1:]] or [timings[0]["gen_sec"]]
+info = sf.info(str(path))
+print(f"\n[Test] Output")
+print("-" * 40)
+print(f"  File:            {path.name}  ({info.duration:.1f}s, {info.samplerate} Hz)")
+print(f"  Peak RSS:        {peak:.0f} MB  (+{peak - rss_before:.0f} MB during generation)")
+print(f"  Continuation windows: mean {sum(gen) / len(gen):.2f}s  "
+      f"min {min(gen):.2f}s  max {max(gen):.2f}s")
+path.unlink(missing_ok=True)
+codes_path(path).unlink(missing_ok=True)
+
+print(f"\n[SUMMARY]")
+print("-" * 40)
+print(f"  {duration:.0f}s of audio in {wall:.1f}s  ({duration / max(wall, 1e-6):.2f}× realtime)")
+print(f"  Window cost growth first → last continuation: {gen[-1] / gen[0]:.2f}×")
+
+print(f"\n[OK] Long-form benchmark complete!")
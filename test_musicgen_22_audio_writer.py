@@ -0,0 +1,93 @@
+import io
+import os
+import time
+import tracemalloc
+from pathlib import Path
+
+from thread_budget import apply_thread_env
+apply_thread_env()
+
+import numpy as np
+import soundfile as sf
+import torch
+
+from audio_writer import encode_async, encoded_path, write_audio
+
+print("="*60)
+print("TEST 22: Zero-Copy Audio Writer (PCM16 / FLAC / Opus)")
+print("="*60)
+
+SECONDS     = float(os.getenv("BENCH_AUDIO_SEC", "30"))
+SAMPLE_RATE = 32000
+RUNS        = int(os.getenv("BENCH_RUNS", "5"))
+OUT_DIR = Path("bench_outputs")
+OUT_DIR.mkdir(exist_ok=True)
+
+print(f"\n[CONFIG] {SECONDS:.0f}s mono float32 at {SAMPLE_RATE} Hz  |  {RUNS} runs each")
+
+# A beat-like signal: kick + bass + noise, so the compressed sizes mean something
+t     = np.arange(int(SECONDS * SAMPLE_RATE), dtype=np.float32) / SAMPLE_RATE
+kick  = np.sin(2 * np.pi * 55 * t) * np.exp(-8 * (t % 0.5))
+audio = (0.5 * kick + 0.2 * np.sin(2 * np.pi * 110 * t)
+         + 0.02 * np.random.randn(len(t))).astype(np.float32)
+
+
+def old_path(path: Path):
+    """What _generate did: numpy → tensor → in-memory WAV → write_bytes."""
+    try:
+        import torchaudio
+        buf = io.BytesIO()
+        torchaudio.save(buf, torch.from_numpy(audio).unsqueeze(0), SAMPLE_RATE, format="wav")
+        path.write_bytes(buf.getvalue())
+    except ImportError:                # same copies without torchaudio: float WAV in memory
+        buf = io.BytesIO()
+        sf.write(buf, torch.from_numpy(audio).unsqueeze(0).numpy().T, SAMPLE_RATE,
+                 format="WAV", subtype="FLOAT")
+        path.write_bytes(buf.getvalue())
+
+
+def measure(fn, path: Path) -> dict:
+    times = []
+    tracemalloc.start()
+    for _ in range(RUNS):
+        t0 = time.time()
+        fn(path)
+        times.append(time.time() - t0)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"mean": sum(times) / RUNS, "peak_mb": peak / 1e6, "kb": path.stat().st_size / 1024}
+
+
+results = {}
+for label, fn in (("tensor → BytesIO → write_bytes", old_path),
+                  ("write_audio (pcm16, streamed)", lambda p: write_audio(p, audio, SAMPLE_RATE))):
+    print(f"\n[Test] {label}")
+    print("-" * 40)
+    r = results[label] = measure(fn, OUT_DIR / "writer.wav")
+    print(f"  Write time:    {r['mean'] * 1000:.1f} ms")
+    print(f"  Peak Python allocations: {r['peak_mb']:.1f} MB")
+    print(f"  File size:     {r['kb']:.0f} KB")
+
+print(f"\n[Test] Background encodes")
+print("-" * 40)
+wav = write_audio(OUT_DIR / "writer.wav", audio, SAMPLE_RATE)
+t0      = time.time()
+futures = encode_async(wav, ["flac", "opus"])
+queued  = time.time() - t0
+for enc, future in futures.items():
+    path = future.result()
+    print(f"  {enc:5s}: {path.stat().st_size / 1024:6.0f} KB  "
+          f"({100 * path.stat().st_size / wav.stat().st_size:.0f}% of WAV)")
+print(f"  Request-path cost of queuing both: {queued * 1000:.2f} ms  "
+      f"(encodes finished after {time.time() - t0:.2f}s)")
+for enc in ("pcm16", "flac", "opus"):
+    encoded_path(wav, enc).unlink(missing_ok=True)
+
+before, after = results.values()
+print(f"\n[SUMMARY]")
+print("-" * 40)
+print(f"  Write time:       {before['mean'] * 1000:.1f} ms  →  {after['mean'] * 1000:.1f} ms")
+print(f"  Peak allocations: {before['peak_mb']:.1f} MB  →  {after['peak_mb']:.1f} MB")
+print(f"  WAV size:         {before['kb']:.0f} KB  →  {after['kb']:.0f} KB")
+
+print(f"\n[OK] Audio writer benchmark complete!")
@@ -0,0 +1,87 @@
+import io
+import os
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from asset_store import AssetStore
+from database import Base
+from models import Commit
+
+print("="*60)
+print("TEST 23: Content-Addressed Asset Store (Dedupe + GC)")
+print("="*60)
+
+UPLOADS  = int(os.getenv("BENCH_UPLOADS", "40"))
+DISTINCT = int(os.getenv("BENCH_DISTINCT", "8"))      # distinct files among the uploads
+KEEP     = int(os.getenv("BENCH_KEEP", "3"))          # uploads referenced by a commit
+ROOT     = Path("bench_outputs") / "asset_store_bench"
+shutil.rmtree(ROOT, ignore_errors=True)
+outputs = ROOT / "beat_outputs"
+outputs.mkdir(parents=True)
+
+print(f"\n[CONFIG] {UPLOADS} uploads of {DISTINCT} distinct 10s WAVs  |  {KEEP} kept by commits")
+
+
+def wav_bytes(i: int) -> bytes:
+    buf = io.BytesIO()
+    sf.write(buf, np.random.default_rng(i).uniform(-0.5, 0.5, 320000).astype(np.float32),
+             32000, format="WAV", subtype="PCM_16")
+    return buf.getvalue()
+
+
+def disk_bytes(*dirs) -> int:
+    seen, total = set(), 0
+    for d in dirs:
+        for p in Path(d).rglob("*"):
+            st = p.stat()
+            if p.is_file() and st.st_ino not in seen:
+                seen.add(st.st_ino)
+                total += st.st_size
+    return total
+
+
+files = [wav_bytes(i) for i in range(DISTINCT)]
+store = AssetStore(ROOT / "blobs", {"/audio": outputs})
+
+print(f"\n[Test] Uploads")
+print("-" * 40)
+t0 = time.time()
+names = [store.put_upload(io.BytesIO(files[i % DISTINCT]), ".wav", outputs)[0].name
+         for i in range(UPLOADS)]
+elapsed = time.time() - t0
+naive = sum(len(files[i % DISTINCT]) for i in range(UPLOADS))
+on_disk = disk_bytes(outputs, store.root)
+print(f"  Upload + hash:   {1000 * elapsed / UPLOADS:.1f} ms per file")
+print(f"  Distinct names:  {len(set(names))} for {UPLOADS} uploads")
+print(f"  Disk used:       {on_disk / 1e6:.1f} MB  (one file per upload: {naive / 1e6:.1f} MB)")
+
+print(f"\n[Test] GC")
+print("-" * 40)
+engine = create_engine("sqlite://")
+Base.metadata.create_all(engine)
+db = sessionmaker(bind=engine)()
+for name in sorted(set(names))[:KEEP]:
+    db.add(Commit(repository_id="bench", author_id="bench", audio_url=f"/audio/{name}"))
+db.commit()
+t0 = time.time()
+result = store.collect(db, grace_sec=0)
+print(f"  Collected in:    {1000 * (time.time() - t0):.1f} ms")
+print(f"  Removed:         {len(result['files'])} files, {len(result['blobs'])} blobs, "
+      f"{result['bytes_freed'] / 1e6:.1f} MB")
+print(f"  Left:            {len(list(outputs.iterdir()))} files, {store.stats()['blobs']} blobs")
+db.close()
+after = disk_bytes(outputs, store.root)
+shutil.rmtree(ROOT, ignore_errors=True)
+
+print(f"\n[SUMMARY]")
+print("-" * 40)
+print(f"  Disk for {UPLOADS} uploads:  {naive / 1e6:.1f} MB  →  {on_disk / 1e6:.1f} MB")
+print(f"  After GC ({KEEP} referenced): {after / 1e6:.1f} MB")
+
+print(f"\n[OK] Asset store benchmark complete!")
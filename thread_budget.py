@@ -0,0 +1,112 @@
+"""
+thread_budget.py — CPU thread budget for concurrent inference
+==============================================================
+Every torch / librosa call fans out to its own intra-op pool, so a few
+concurrent requests oversubscribe the CPU badly. The budget is
+INFER_SLOTS concurrent model runs × THREADS_PER_SLOT threads each
+(default: 1 slot using every core):
+
+  apply_thread_env()  caps OpenMP / MKL / OpenBLAS / numba pools through
+                      env vars — call it before torch, numpy or librosa
+                      are imported
+  ThreadBudget        process-wide torch settings plus a semaphore of
+                      slots; `with budget.slot():` around a model run
+                      sets the calling thread's torch / numba threads
+
+For Celery, each prefork process is one slot: set INFER_SLOTS to the
+worker concurrency. test_musicgen_11_thread_budget.py finds the best
+slots × threads split for a machine.
+"""
+
+from __future__ import annotations
+import os, sys, threading, time
+from contextlib import contextmanager
+
+CPU_CORES        = int(os.getenv("CPU_CORES", str(os.cpu_count() or 1)))
+INFER_SLOTS      = max(1, int(os.getenv("INFER_SLOTS", "1")))
+THREADS_PER_SLOT = max(1, int(os.getenv("THREADS_PER_SLOT", str(max(1, CPU_CORES // INFER_SLOTS)))))
+INTEROP_THREADS  = max(1, int(os.getenv("INTEROP_THREADS", "1")))
+
+_THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS",
+                    "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS", "NUMBA_NUM_THREADS")
+
+
+def apply_thread_env(threads: int = THREADS_PER_SLOT):
+    """Default every native thread pool to `threads`. Values already set in
+    the environment win. Has no effect on libraries that are already loaded."""
+    for var in _THREAD_ENV_VARS:
+        os.environ.setdefault(var, str(threads))
+
+
+class ThreadBudget:
+    """Limits concurrent model runs to `slots`, each using `threads_per_slot` threads."""
+
+    def __init__(self, slots: int = INFER_SLOTS, threads_per_slot: int = THREADS_PER_SLOT,
+                 interop_threads: int = INTEROP_THREADS):
+        self.slots            = max(1, int(slots))
+        self.threads_per_slot = max(1, int(threads_per_slot))
+        self.interop_threads  = max(1, int(interop_threads))
+        self._sem   = threading.BoundedSemaphore(self.slots)
+        self._lock  = threading.Lock()
+        self._stats = {"runs": 0, "in_use": 0, "waited": 0, "wait_sec": 0.0, "max_wait_sec": 0.0}
+        self._configure_process()
+
+    # ── Public API ────────────────────────────────────────────────
+    @contextmanager
+    def slot(self):
+        """Block until a slot is free, then run the with-block inside it."""
+        t0 = time.monotonic()
+        self._sem.acquire()
+        waited = time.monotonic() - t0
+        with self._lock:
+            s = self._stats
+            s["runs"]     += 1
+            s["in_use"]   += 1
+            s["wait_sec"] += waited
+            s["max_wait_sec"] = max(s["max_wait_sec"], waited)
+            if waited > 0.001:
+                s["waited"] += 1
+        try:
+            self._configure_thread()
+            yield
+        finally:
+            with self._lock:
+                self._stats["in_use"] -= 1
+            self._sem.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+        s["wait_sec"]         = round(s["wait_sec"], 2)
+        s["max_wait_sec"]     = round(s["max_wait_sec"], 2)
+        s["slots"]            = self.slots
+        s["threads_per_slot"] = self.threads_per_slot
+        s["interop_threads"]  = self.interop_threads
+        s["cpu_cores"]        = CPU_CORES
+        return s
+
+    # ── Internals ─────────────────────────────────────────────────
+    def _configure_process(self):
+        import torch
+        torch.set_num_threads(self.threads_per_slot)
+        try:
+            torch.set_num_interop_threads(self.interop_threads)
+        except RuntimeError:
+            pass                          # can only be set once, before inter-op work starts
+        try:
+            from threadpoolctl import threadpool_limits
+            threadpool_limits(self.threads_per_slot)    # BLAS already loaded by numpy
+        except ImportError:
+            pass
+
+    def _configure_thread(self):
+        """torch (OpenMP) and numba thread counts are per calling thread."""
+        import torch
+        if torch.get_num_threads() != self.threads_per_slot:
+            torch.set_num_threads(self.threads_per_slot)
+        numba = sys.modules.get("numba")
+        if numba is not None:
+            try:
+                numba.set_num_threads(min(self.threads_per_slot, numba.config.NUMBA_NUM_THREADS))
+            except Exception:
+                pass